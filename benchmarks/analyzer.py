@@ -0,0 +1,62 @@
+"""Benchmark comparing the throughput and scores of the sentiment engines."""
+
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import List
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from bot.vectorized import VectorizedSentimentIntensityAnalyzer, compound_tolerance
+
+# Common words mixed in with lexicon words to resemble chat messages
+filler = ["jag", "du", "och", "att", "det", "är", "inte", "väldigt", "lol", "ok", "!", "?", ":)", "😁", "https://example.com"]
+
+
+def generate_messages(analyzer: SentimentIntensityAnalyzer, count: int, seed: int) -> List[str]:
+    """Generate random messages using words from the lexicon."""
+    generator = random.Random(seed)
+    words = sorted(analyzer.lexicon)[::10] + filler * 50
+    return [" ".join(generator.choice(words) for _ in range(generator.randint(1, 15))) for _ in range(count)]
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Compare the VADER engine with the vectorized engine")
+    parser.add_argument("-n", "--messages", default=20000, type=int, help="Number of messages to score")
+    parser.add_argument("-b", "--batch-size", default=256, type=int, help="Number of messages per batch")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate messages")
+    options = parser.parse_args()
+
+    reference = SentimentIntensityAnalyzer()
+    vectorized = VectorizedSentimentIntensityAnalyzer(reference)
+    messages = generate_messages(reference, options.messages, options.seed)
+
+    start = perf_counter()
+    expected = [reference.polarity_scores(message) for message in messages]
+    vader_time = perf_counter() - start
+
+    start = perf_counter()
+    single = [vectorized.polarity_scores(message) for message in messages]
+    single_time = perf_counter() - start
+
+    start = perf_counter()
+    batched = []
+    for offset in range(0, len(messages), options.batch_size):
+        batched.extend(vectorized.polarity_scores_batch(messages[offset:offset + options.batch_size]))
+    batched_time = perf_counter() - start
+
+    difference = max(
+        abs(scores["compound"] - result["compound"])
+        for scores, results in ((expected, single), (expected, batched))
+        for scores, result in zip(scores, results)
+    )
+
+    print("vader:              {:10.0f} messages/s".format(len(messages) / vader_time))
+    print("vectorized:         {:10.0f} messages/s".format(len(messages) / single_time))
+    print("vectorized batches: {:10.0f} messages/s".format(len(messages) / batched_time))
+    print("max compound difference: {} (tolerance {})".format(difference, compound_tolerance))
+
+
+if __name__ == "__main__":
+    main()
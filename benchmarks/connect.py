@@ -0,0 +1,134 @@
+"""Benchmark of connecting to servers with dead addresses, against local listeners which accept, refuse or black-hole connections."""
+
+import asyncio
+import socket
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from irc.connector import Connector
+from irc.exception import IRCSocketException
+
+
+class Listeners:
+    """Local listeners accepting, refusing or black-holing connections, over IPv4 and, if available, IPv6."""
+
+    def __init__(self) -> None:
+        self.__sockets: List[socket.socket] = []
+        self.addresses: Dict[str, Tuple[int, Tuple[Any, ...]]] = {}
+
+        families = [(socket.AF_INET, "127.0.0.1", "4")]
+        if socket.has_ipv6:
+            try:
+                socket.create_server(("::1", 0), family=socket.AF_INET6).close()
+                families.append((socket.AF_INET6, "::1", "6"))
+            except OSError:
+                pass
+
+        for family, host, suffix in families:
+            # Connections are queued by the kernel, never needing to be accepted
+            accepting = self.__listen(family, host, 128)
+            self.addresses["accept" + suffix] = (family, accepting.getsockname())
+
+            # A closed port refuses connections
+            refusing = socket.socket(family, socket.SOCK_STREAM)
+            refusing.bind((host, 0))
+            self.addresses["refuse" + suffix] = (family, refusing.getsockname())
+            refusing.close()
+
+            # With a full accept queue, connections are silently dropped
+            black_hole = self.__listen(family, host, 0)
+            filler = socket.socket(family, socket.SOCK_STREAM)
+            filler.connect(black_hole.getsockname())
+            self.__sockets.append(filler)
+            self.addresses["black-hole" + suffix] = (family, black_hole.getsockname())
+
+    def __listen(self, family: int, host: str, backlog: int) -> socket.socket:
+        """Listen on a free port."""
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.bind((host, 0))
+        listener.listen(backlog)
+        self.__sockets.append(listener)
+        return listener
+
+    def resolver(self, names: List[str]) -> Callable[[str, int], List[Tuple[Any, ...]]]:
+        """A resolver returning the addresses of listeners, in order."""
+        def resolve(_server: str, _port: int) -> List[Tuple[Any, ...]]:
+            return [(self.addresses[name][0], socket.SOCK_STREAM, socket.IPPROTO_TCP, "", self.addresses[name][1]) for name in names]
+        return resolve
+
+    def close(self) -> None:
+        """Close all listeners."""
+        for listener in self.__sockets:
+            listener.close()
+
+
+def connect_sequentially(addresses: List[Tuple[Any, ...]], timeout: float) -> socket.socket:
+    """Connect to the addresses one after another, the way socket.create_connection does."""
+    error: Exception = IRCSocketException("No addresses")
+    for family, _, protocol, _, address in addresses:
+        candidate = socket.socket(family, socket.SOCK_STREAM, protocol)
+        candidate.settimeout(timeout)
+        try:
+            candidate.connect(address)
+            return candidate
+        except OSError as exception:
+            candidate.close()
+            error = exception
+    raise error
+
+
+async def open_and_close(connector: Connector, timeout: float) -> Any:
+    """Open streams using asyncio and close them right away, returning the closed writer."""
+    _, writer = await connector.open_connection("server", 6667, timeout)
+    writer.close()
+    await writer.wait_closed()
+    return writer
+
+
+def measure(function: Callable[[], Any]) -> str:
+    """Time a connect, describing the outcome."""
+    start = perf_counter()
+    try:
+        function().close()
+        outcome = "connected"
+    except (OSError, IRCSocketException) as exception:
+        outcome = str(exception) or type(exception).__name__
+    return "{:7.3f}s {}".format(perf_counter() - start, outcome)
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Compare sequential and racing connects to servers with dead addresses")
+    parser.add_argument("--timeout", default=5, type=float, help="Seconds to wait for a connection")
+    parser.add_argument("--attempt-delay", default=0.25, type=float, help="Seconds between racing attempts")
+    options = parser.parse_args()
+
+    listeners = Listeners()
+    scenarios = [
+        ["accept4"],
+        ["refuse4", "accept4"],
+        ["black-hole4", "accept4"],
+        ["black-hole4", "refuse4", "accept4"],
+        ["black-hole4", "refuse4"],
+    ]
+    if "accept6" in listeners.addresses:
+        scenarios[3:3] = [["black-hole6", "accept4"], ["black-hole6", "black-hole4", "accept6"]]
+
+    for names in scenarios:
+        resolve = listeners.resolver(names)
+        print(", ".join(names))
+        print("  sequential:      ", measure(lambda: connect_sequentially(resolve("", 0), options.timeout)))
+
+        connector = Connector(attempt_delay=options.attempt_delay, resolver=resolve)
+        print("  racing:          ", measure(lambda: connector.connect("server", 6667, options.timeout)))
+        # Failed addresses are now skipped
+        print("  racing again:    ", measure(lambda: connector.connect("server", 6667, options.timeout)))
+
+        connector = Connector(attempt_delay=options.attempt_delay, resolver=resolve)
+        print("  racing (asyncio):", measure(lambda: asyncio.run(open_and_close(connector, options.timeout))))
+    listeners.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark of splitting and encoding outgoing messages, comparing the encoder with wrapping text by characters."""
+
+import random
+import sys
+import textwrap
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable, List
+
+from irc.encoding import MessageEncoder, default_hostname_length, max_line_length
+
+# Text resembling replies of the bot, with multibyte Swedish characters and emojis
+words = [
+    "stämningen", "i", "kanalen", "är", "positiv", "och", "förbättras", "över", "de", "senaste", "meddelandena",
+    "😁", "🎉", "åäö", "ÅÄÖ", "👍🏽", "🇸🇪", "(╯°□°)╯︵", "┻━┻", "hej", "tack!", ":D", "https://example.com/ärende/1234"
+]
+
+
+def generate_messages(count: int, length: int, seed: int) -> List[str]:
+    """Generate messages of about a length in characters."""
+    generator = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        message: List[str] = []
+        while sum(len(word) + 1 for word in message) < length:
+            message.append(generator.choice(words))
+        messages.append(" ".join(message))
+    return messages
+
+
+def wrap_by_characters(target: str, message: str) -> List[bytes]:
+    """The previous path: wrap by characters, format each line and encode it twice, checking the limit."""
+    lines = []
+    for line in textwrap.wrap(message, width=(512 - len(target) - 12)):
+        formatted = "PRIVMSG {} :{}\r\n".format(target, line)
+        if len(formatted.encode()) > 512:
+            raise ValueError("Message is too long")
+        lines.append(formatted.encode())
+    return lines
+
+
+def time_per_message(function: Callable[[str, str], List[bytes]], messages: List[str], repeat: int) -> float:
+    """The fastest time of a run, per message in µs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for message in messages:
+            function("#random", message)
+        best = min(best, perf_counter() - start)
+    return best / len(messages) * 1e6
+
+
+def check(encoder: MessageEncoder, message: str) -> List[str]:
+    """Check the lines of a message for the limit, valid UTF-8 and not losing any text."""
+    problems = []
+    lines = encoder.encode("PRIVMSG", "#random", message)
+    for line in lines:
+        if len(line) + encoder.relayed_prefix_length > max_line_length:
+            problems.append("line of {} bytes, {} as relayed".format(len(line), len(line) + encoder.relayed_prefix_length))
+        try:
+            line.decode()
+        except UnicodeDecodeError:
+            problems.append("line split within a character")
+    text = "".join(line[len(b"PRIVMSG #random :"):-2].decode(errors="replace") for line in lines)
+    if text.replace(" ", "") != message.replace(" ", ""):
+        problems.append("text lost or changed")
+    return problems
+
+
+def check_nick_changes() -> List[str]:
+    """Check that the prefix length follows the nick of the bot, before and after learning its hostname."""
+    problems = []
+    encoder = MessageEncoder("sentiment-bot", "sentiment-bot")
+    for nick in ("sentiment-bot_", "sb"):
+        encoder.nick = nick
+        expected = len(":{}!~sentiment-bot@ ".format(nick).encode()) + default_hostname_length
+        if encoder.relayed_prefix_length != expected:
+            problems.append("prefix of {} bytes as {}, expected {}".format(encoder.relayed_prefix_length, nick, expected))
+
+    encoder.learn_hostname("~sentiment-bot@example.com")
+    for nick in ("sentiment-bot", "sentiment-bot-with-a-longer-nick"):
+        encoder.nick = nick
+        expected = len(":{}!~sentiment-bot@example.com ".format(nick).encode())
+        if encoder.relayed_prefix_length != expected:
+            problems.append("prefix of {} bytes as {}, expected {}".format(encoder.relayed_prefix_length, nick, expected))
+    return problems
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Compare the message encoder with wrapping text by characters")
+    parser.add_argument("-n", "--messages", default=10000, type=int, help="Number of messages of each length")
+    parser.add_argument("-r", "--repeat", default=5, type=int, help="Number of timed runs, the fastest is reported")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate messages")
+    options = parser.parse_args()
+
+    encoder = MessageEncoder("sentiment-bot", "sentiment-bot")
+    encode: Callable[[str, str], List[bytes]] = lambda target, message: encoder.encode("PRIVMSG", target, message)
+
+    failures = 0
+    for name, length in (("short", 20), ("reply", 150), ("near the limit", 420), ("long", 2000)):
+        messages = generate_messages(options.messages, length, options.seed)
+
+        # Lines relayed over the limit are cut by the server, otherwise the previous path raised
+        raised = 0
+        over_limit = 0
+        working = []
+        for message in messages:
+            try:
+                lines = wrap_by_characters("#random", message)
+            except ValueError:
+                raised += 1
+                continue
+            over_limit += sum(len(line) + encoder.relayed_prefix_length > max_line_length for line in lines)
+            working.append(message)
+
+        print("{} messages of about {} characters".format(name, length))
+        print("  wrapping by characters raised for {} messages and relayed {} lines over the limit".format(raised, over_limit))
+        if working:
+            print("  wrapping by characters: {:8.2f}µs per message".format(time_per_message(wrap_by_characters, working, options.repeat)))
+            print("  encoder:                {:8.2f}µs per message".format(time_per_message(encode, working, options.repeat)))
+        if raised > 0:
+            print("  encoder:                {:8.2f}µs per message, including those raising".format(
+                time_per_message(encode, messages, options.repeat)
+            ))
+
+        for message in messages:
+            for problem in check(encoder, message):
+                failures += 1
+                print("  {}: {!r}".format(problem, message[:80]))
+
+    for problem in check_nick_changes():
+        failures += 1
+        print("nick change: {}".format(problem))
+
+    print("checked all messages and nick changes, {} problems".format(failures))
+    if failures > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
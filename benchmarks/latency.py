@@ -0,0 +1,96 @@
+"""Benchmark of the time from data arriving on a socket to a line being handled, and of the calls made while idle."""
+
+import os
+import socket
+import ssl
+import tempfile
+import threading
+from argparse import ArgumentParser, Namespace
+from time import perf_counter, perf_counter_ns, sleep
+from typing import List, Optional
+
+from benchmarks.loadtest import create_certificate, percentile
+from irc.exception import IRCSocketClosedException, IRCSocketException
+from irc.framing import LineBuffer
+from irc.socket import Socket
+
+
+def serve(listener: socket.socket, context: Optional[ssl.SSLContext], options: Namespace) -> None:
+    """Send timestamped lines to a single client at a fixed rate, then stay idle before closing."""
+    connection, _ = listener.accept()
+    if context is not None:
+        connection = context.wrap_socket(connection, server_side=True)
+    with connection:
+        # Give the client time to start reading
+        sleep(0.1)
+        started = perf_counter()
+        for index in range(options.lines):
+            delay = started + index / options.rate - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            connection.sendall("PING :{} {}\r\n".format(index, perf_counter_ns()).encode())
+        sleep(options.idle)
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Measure the time from data arriving to a line being read, the way the ingress thread reads")
+    parser.add_argument("-n", "--lines", default=2000, type=int, help="Number of lines to send")
+    parser.add_argument("-r", "--rate", default=500, type=float, help="Lines per second to send")
+    parser.add_argument("--idle", default=2, type=float, help="Seconds to stay idle after sending")
+    parser.add_argument("--tls", action="store_true", help="Serve TLS using a self-signed certificate, requires OpenSSL")
+    options = parser.parse_args()
+
+    context = None
+    if options.tls:
+        directory = tempfile.mkdtemp()
+        certificate_path, key_path = create_certificate(directory)
+        # Trust the certificate when the client creates its default context
+        os.environ["SSL_CERT_FILE"] = certificate_path
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certificate_path, key_path)
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    server = threading.Thread(target=serve, args=(listener, context, options), daemon=True)
+    server.start()
+
+    client = Socket("localhost", listener.getsockname()[1], timeout=10, use_tls=options.tls)
+    client.connect()
+
+    # Read the way the ingress thread of the IRC client does
+    line_buffer = LineBuffer()
+    latencies: List[float] = []
+    calls_when_sent = (0, 0)
+    idle_started = 0.0
+    while True:
+        try:
+            client.wait_for_data(options.idle + 10)
+            if client.read_into(line_buffer.buffer) == 0:
+                continue
+        except (IRCSocketClosedException, IRCSocketException):
+            break
+
+        received = perf_counter_ns()
+        for line in line_buffer.lines():
+            index, sent = line.split(b" :")[1].split()
+            latencies.append((received - int(sent)) / 1e6)
+            if int(index) == options.lines - 1:
+                calls_when_sent = (client.receive_calls, client.wait_calls)
+                idle_started = perf_counter()
+    idle = perf_counter() - idle_started
+    client.close()
+    server.join()
+
+    latencies.sort()
+    print("lines:           {:10d}".format(len(latencies)))
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0)):
+        print("latency {}:     {:10.3f}ms".format(name, percentile(latencies, fraction) or 0.0))
+    print("receive calls:   {:10.2f} per line".format(calls_when_sent[0] / len(latencies)))
+    print("waits:           {:10.2f} per line".format(calls_when_sent[1] / len(latencies)))
+    print("calls when idle: {:10d} in {:.1f}s, closing included".format(
+        client.receive_calls + client.wait_calls - sum(calls_when_sent), idle
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""End-to-end load test of the bot against a local stand-in IRC server."""
+
+import asyncio
+import json
+import os
+import random
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+from argparse import REMAINDER, ArgumentParser, Namespace
+from collections import deque
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from irc.messages import IRCMessage, parse_message
+
+# Words used to generate traffic, mixing neutral chatter with clearly positive and negative messages
+neutral_words = ["hej", "det", "är", "inte", "så", "lol", "haha", "idag", "imorgon", "vad", "gör", "ni"]
+positive_words = ["älskar", "underbart", "fantastiskt", "bra", "tack!", "glad", "härligt", "😁"]
+negative_words = ["hatar", "dåligt", "hemskt", "ledsen", "arg", "tråkigt", "usel"]
+
+# The thresholds at which the bot reacts
+reaction_threshold = 0.6
+
+
+def generate_traffic(count: int, channels: int, seed: int) -> List[Tuple[str, str, str]]:
+    """Generate messages as (nick, channel, text), resembling busy channels."""
+    generator = random.Random(seed)
+    nicks = ["alice", "bob", "carol", "dave", "erin", "frank"]
+    traffic = []
+    for _ in range(count):
+        kind = generator.random()
+        words = neutral_words if kind < 0.5 else positive_words if kind < 0.8 else negative_words
+        text = " ".join(generator.choice(words) for _ in range(generator.randint(2, 10)))
+        traffic.append((generator.choice(nicks), "#load{}".format(generator.randrange(channels)), text))
+    return traffic
+
+
+def read_traffic(path: str) -> List[Tuple[str, str, str]]:
+    """Read recorded traffic, one raw PRIVMSG line per line."""
+    traffic = []
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            message = parse_message(line.rstrip("\r\n"))
+            if isinstance(message, IRCMessage) and message.target.startswith("#"):
+                traffic.append((message.author, message.target, message.message))
+    return traffic
+
+
+def create_certificate(directory: str) -> Tuple[str, str]:
+    """Create a self-signed certificate for 127.0.0.1 using OpenSSL. Returns the certificate and key paths."""
+    certificate_path = os.path.join(directory, "certificate.pem")
+    key_path = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key_path, "-out", certificate_path, "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return certificate_path, key_path
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """The value below which the given fraction of sorted values fall."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+class FakeServer:  # pylint: disable=too-many-instance-attributes
+    """A stand-in IRC server for a single client, handling registration, JOIN and PING."""
+
+    def __init__(self, channels: Set[str], tls_context: Optional[ssl.SSLContext] = None) -> None:
+        self.__channels = channels
+        self.__tls_context = tls_context
+        self.__writer: Optional[asyncio.StreamWriter] = None
+
+        self.__joined: Set[str] = set()
+        self.__is_ready = asyncio.Event()
+
+        # The times the reacting messages were sent, per channel, waiting for their reaction
+        self.__expected: Dict[str, Deque[float]] = {}
+        self.__latencies: List[float] = []
+        self.__unexpected_reactions = 0
+        self.__last_reaction = 0.0
+        self.__pings: Dict[str, float] = {}
+        self.__pong_latencies: List[float] = []
+
+    @property
+    def latencies(self) -> List[float]:
+        """The seconds from each reacting message being sent to its reaction being received."""
+        return self.__latencies
+
+    @property
+    def pong_latencies(self) -> List[float]:
+        """The seconds from each PING being sent to its PONG being received."""
+        return self.__pong_latencies
+
+    @property
+    def unexpected_reactions(self) -> int:
+        """The number of reactions not matching a sent message."""
+        return self.__unexpected_reactions
+
+    @property
+    def last_reaction(self) -> float:
+        """The time the last reaction was received."""
+        return self.__last_reaction
+
+    @property
+    def awaiting(self) -> int:
+        """The number of reactions not yet received."""
+        return sum(len(times) for times in self.__expected.values())
+
+    async def start(self) -> int:
+        """Start listening. Returns the port."""
+        server = await asyncio.start_server(self.__handle_client, "127.0.0.1", 0, ssl=self.__tls_context)
+        return server.sockets[0].getsockname()[1]
+
+    async def wait_until_ready(self) -> None:
+        """Wait for the client to register and join all channels."""
+        await self.__is_ready.wait()
+
+    async def send(self, nick: str, channel: str, text: str, expect_reaction: bool) -> None:
+        """Send a message to a channel."""
+        assert self.__writer is not None
+        if expect_reaction:
+            self.__expected.setdefault(channel, deque()).append(perf_counter())
+        self.__writer.write(":{0}!~{0}@user/{0} PRIVMSG {1} :{2}\r\n".format(nick, channel, text).encode())
+        await self.__writer.drain()
+
+    async def ping(self) -> None:
+        """Send a PING."""
+        assert self.__writer is not None
+        token = str(len(self.__pings))
+        self.__pings[token] = perf_counter()
+        self.__writer.write("PING :{}\r\n".format(token).encode())
+        await self.__writer.drain()
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle the bot's connection."""
+        self.__writer = writer
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            command, _, rest = line.decode(errors="replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command == "NICK":
+                writer.write(":irc.test 001 {} :Welcome to the load test\r\n".format(rest).encode())
+            elif command == "JOIN":
+                self.__joined.add(rest)
+                if self.__channels <= self.__joined:
+                    self.__is_ready.set()
+            elif command == "PONG":
+                sent = self.__pings.pop(rest.lstrip(":"), None)
+                if sent is not None:
+                    self.__pong_latencies.append(perf_counter() - sent)
+            elif command == "PRIVMSG":
+                channel = rest.partition(" ")[0]
+                expected = self.__expected.get(channel)
+                now = perf_counter()
+                self.__last_reaction = now
+                if expected:
+                    self.__latencies.append(now - expected.popleft())
+                else:
+                    self.__unexpected_reactions += 1
+
+
+async def run(options: Namespace, traffic: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+    """Run the bot against the stand-in server, replaying the traffic."""
+    analyzer = SentimentIntensityAnalyzer()
+    reacting = [abs(analyzer.polarity_scores(text)["compound"]) >= reaction_threshold for _, _, text in traffic]
+    channels = sorted({channel for _, channel, _ in traffic})
+
+    with tempfile.TemporaryDirectory() as directory:
+        environment = dict(os.environ)
+        tls_context = None
+        if options.tls:
+            certificate_path, key_path = create_certificate(directory)
+            tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            tls_context.load_cert_chain(certificate_path, key_path)
+            # Make the bot trust the self-signed certificate
+            environment["SSL_CERT_FILE"] = certificate_path
+
+        server = FakeServer(set(channels), tls_context)
+        port = await server.start()
+
+        arguments = ["-s", "127.0.0.1", "-p", str(port), "--use-tls", "1" if options.tls else ""]
+        for channel in channels:
+            arguments += ["-c", channel]
+        # Flood control would drop or coalesce reactions, making them impossible to match with messages
+        arguments += ["--rate", "0", "--max-queued-reactions", str(len(traffic))] + options.bot_arguments
+
+        started = perf_counter()
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bot.main", *arguments,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL if options.quiet else None
+        )
+        try:
+            await asyncio.wait_for(server.wait_until_ready(), options.timeout)
+            ready = perf_counter()
+
+            # Replay the traffic at the configured rate, pinging every second
+            next_ping = ready
+            for index, ((nick, channel, text), expect_reaction) in enumerate(zip(traffic, reacting)):
+                if options.rate > 0:
+                    delay = ready + index / options.rate - perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if perf_counter() >= next_ping:
+                    await server.ping()
+                    next_ping += 1
+                await server.send(nick, channel, text, expect_reaction)
+            sent = perf_counter()
+
+            # Wait for all reactions, giving up once they stop arriving
+            while server.awaiting > 0 and perf_counter() - max(sent, server.last_reaction) < options.timeout:
+                await asyncio.sleep(0.01)
+            finished = max(sent, server.last_reaction)
+        finally:
+            bot.terminate()
+            await bot.wait()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    latencies = sorted(server.latencies)
+    pong_latencies = sorted(server.pong_latencies)
+    return {
+        "tls": options.tls,
+        "bot_arguments": arguments,
+        "messages": len(traffic),
+        "channels": len(channels),
+        "offered_rate": options.rate,
+        "startup_seconds": ready - started,
+        "send_seconds": sent - ready,
+        "duration_seconds": finished - ready,
+        "messages_per_second": len(traffic) / (finished - ready) if finished > ready else None,
+        "reactions_expected": sum(reacting),
+        "reactions_received": len(latencies),
+        "reactions_missing": server.awaiting,
+        "reactions_unexpected": server.unexpected_reactions,
+        "latency_ms": {
+            name: None if value is None else value * 1000
+            for name, value in (
+                ("p50", percentile(latencies, 0.5)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", latencies[-1] if latencies else None)
+            )
+        },
+        "pong_latency_ms_p50": None if not pong_latencies else percentile(pong_latencies, 0.5) * 1000,  # type: ignore
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        # Kilobytes on Linux, bytes on macOS
+        "max_rss": usage.ru_maxrss
+    }
+
+
+def main() -> None:
+    """Main entrypoint of the load test."""
+    parser = ArgumentParser(description="Measure the bot's throughput and reaction latency against a local server")
+    parser.add_argument("-n", "--messages", default=10000, type=int, help="Number of messages to generate")
+    parser.add_argument("--channels", default=10, type=int, help="Number of channels to generate messages in")
+    parser.add_argument("-r", "--rate", default=1000, type=float, help="Messages per second to send. Use 0 to send as fast as possible")
+    parser.add_argument("--replay", help="Replay recorded traffic, one raw PRIVMSG line per line, instead of generating it")
+    parser.add_argument("--tls", action="store_true", help="Serve TLS using a self-signed certificate, requires OpenSSL")
+    parser.add_argument("--timeout", default=10, type=float, help="Seconds to wait for the bot to join or to react")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate messages")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to a file instead of standard output")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Hide the bot's log")
+    parser.add_argument("bot_arguments", nargs=REMAINDER, help="Additional arguments for the bot, following --")
+    options = parser.parse_args()
+    if options.bot_arguments[:1] == ["--"]:
+        options.bot_arguments = options.bot_arguments[1:]
+
+    traffic = read_traffic(options.replay) if options.replay else \
+        generate_traffic(options.messages, options.channels, options.seed)
+    results = asyncio.run(run(options, traffic))
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark of the memory used by queued messages."""
+
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from queue import Queue
+from typing import Callable, List, Optional, Tuple
+
+from benchmarks.parser import generate_lines, legacy_control_message_regex, legacy_private_message_regex
+from irc.messages import IRCMessage, parse_message
+
+
+class LegacyIRCMessage():
+    """A private message as previously stored, each field split eagerly into the instance's dictionary."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            raw_message: str,
+            author: str,
+            hostname: str,
+            is_notice: bool,
+            target: str,
+            message: str
+    ) -> None:
+        self.__raw_message = raw_message
+        self.__author = author
+        self.__hostname = hostname
+        self.__is_notice = is_notice
+        self.__target = target
+        self.__message = message
+
+
+class LegacyIRCControlMessage():
+    """A control message as previously stored, each field split eagerly into the instance's dictionary."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            raw_message: str,
+            server: str,
+            message_type: str,
+            target: str,
+            parameter: Optional[str],
+            message: str
+    ) -> None:
+        self.__raw_message = raw_message
+        self.__server = server
+        self.__message_type = message_type
+        self.__target = target
+        self.__parameter = parameter
+        self.__message = message
+
+
+def legacy_parse(line: str) -> Optional[object]:
+    """Parse a line into the previous message types."""
+    match = legacy_private_message_regex.match(line)
+    if match:
+        author, hostname, message_type, target, message = match.groups()
+        return LegacyIRCMessage(line, author, hostname, message_type == "NOTICE", target, message)
+
+    match = legacy_control_message_regex.match(line)
+    if match:
+        server, message_type, target, _, parameter, message = match.groups()
+        return LegacyIRCControlMessage(line, server, message_type, target, parameter, message)
+
+    return None
+
+
+def parse_and_materialize(line: str) -> Optional[object]:
+    """Parse a line and access all fields of private messages, as the bot does when analyzing them."""
+    message = parse_message(line)
+    if isinstance(message, IRCMessage):
+        _ = message.author, message.hostname, message.target, message.message
+    return message
+
+
+def measure(parse: Callable[[str], Optional[object]], lines: List[str]) -> Tuple[int, int]:
+    """Measure the memory used by queueing the parsed lines. Returns the number of messages and bytes used."""
+    queue: Queue = Queue()
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for line in lines:
+        message = parse(line)
+        if message is not None:
+            queue.put(message)
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return queue.qsize(), end - start
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Measure the memory used by queued messages")
+    parser.add_argument("-n", "--messages", default=100000, type=int, help="Number of lines to queue")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate lines")
+    options = parser.parse_args()
+
+    # Only queue lines handled by both parsers. The raw lines are kept by all
+    # message types alike and are not measured
+    lines = [line for line in generate_lines(options.messages * 2, options.seed) if legacy_parse(line) is not None]
+    lines = lines[:options.messages]
+
+    for name, parse in (
+            ("previous messages:  ", legacy_parse),
+            ("lazy messages:      ", parse_message),
+            ("accessed messages:  ", parse_and_materialize)
+    ):
+        count, size = measure(parse, lines)
+        print("{} {:8.1f} KiB for {} messages ({:5.1f} bytes/message)".format(
+            name, size / 1024, count, size / max(count, 1)
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark comparing the single-pass tokenizer with the previous regex parsers."""
+
+import random
+import re
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable, List, Optional
+
+from irc.messages import IRCBaseMessage, IRCControlMessage, IRCControlMessageType, IRCMessage, parse_message
+
+# The regexes previously used to parse each line, both tried for every line
+legacy_control_message_regex = re.compile("^:([^ ]+) ([0-9]+) ([^ ]+)( ([^ ]+) )(.*)$")
+legacy_private_message_regex = re.compile("^:([^!]+)!(.*?) (PRIVMSG|NOTICE) ([^ ]+) :(.*)")
+
+
+def legacy_parse_control_message(line: str) -> Optional[IRCBaseMessage]:
+    """Parse a control message using the previous regex parser."""
+    match = legacy_control_message_regex.match(line)
+    if not match:
+        return None
+
+    server, raw_type, target, _, parameter, message = match.groups()
+    try:
+        message_type = IRCControlMessageType(raw_type)
+    except ValueError:
+        return None
+
+    return IRCControlMessage(line, server, message_type, target, parameter, message)
+
+
+def legacy_parse_message(line: str) -> Optional[IRCBaseMessage]:
+    """Parse a private message using the previous regex parser."""
+    match = legacy_private_message_regex.match(line)
+    if not match:
+        return None
+
+    author, hostname, message_type, target, message = match.groups()
+    return IRCMessage(line, author, hostname, message_type == "NOTICE", target, message)
+
+
+def legacy_parse(line: str) -> Optional[object]:
+    """Parse a line the way the ingress thread previously did, trying every parser."""
+    parsers = {legacy_parse_control_message, legacy_parse_message}
+    messages = [parser(line) for parser in parsers]
+    parsed_messages = [message for message in messages if message is not None]
+    if len(parsed_messages) == 0 and line.startswith("PING"):
+        return line.split(" ")[1:]
+    return parsed_messages[0] if parsed_messages else None
+
+
+def generate_lines(count: int, seed: int) -> List[str]:
+    """Generate lines resembling the traffic of a busy channel."""
+    generator = random.Random(seed)
+    nicks = ["alice", "bob", "carol", "dave", "erin", "frank"]
+    words = ["hej", "lol", "bra", "tack!", "+1", "haha", "det", "är", "inte", "så", "dåligt", "😁"]
+    lines = []
+    for _ in range(count):
+        nick = generator.choice(nicks)
+        prefix = ":{0}!~{0}@user/{0}".format(nick)
+        kind = generator.random()
+        if kind < 0.8:
+            message = " ".join(generator.choice(words) for _ in range(generator.randint(1, 12)))
+            lines.append("{} PRIVMSG #random :{}".format(prefix, message))
+        elif kind < 0.85:
+            lines.append(":irc.example.com 353 sentiment-bot = #random :{}".format(" ".join(nicks)))
+        elif kind < 0.9:
+            lines.append("PING :irc.example.com")
+        elif kind < 0.95:
+            lines.append("{} JOIN #random".format(prefix))
+        else:
+            lines.append("{} PART #random :Leaving".format(prefix))
+    return lines
+
+
+def measure(parse: Callable[[str], Optional[object]], lines: List[str], rounds: int) -> float:
+    """Measure the number of lines parsed per second."""
+    start = perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            parse(line)
+    return len(lines) * rounds / (perf_counter() - start)
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Compare the tokenizer with the previous regex parsers")
+    parser.add_argument("-n", "--lines", default=100000, type=int, help="Number of lines to parse per round")
+    parser.add_argument("-r", "--rounds", default=3, type=int, help="Number of rounds")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate lines")
+    options = parser.parse_args()
+
+    lines = generate_lines(options.lines, options.seed)
+
+    # Make sure the tokenizer handles at least the lines the regexes did
+    parsed: List[Optional[IRCBaseMessage]] = [parse_message(line) for line in lines]
+    unhandled = sum(1 for line, message in zip(lines, parsed) if message is None and legacy_parse(line) is not None)
+
+    print("regex parsers: {:10.0f} lines/s".format(measure(legacy_parse, lines, options.rounds)))
+    print("tokenizer:     {:10.0f} lines/s".format(measure(parse_message, lines, options.rounds)))
+    print("lines only handled by the regex parsers: {}".format(unhandled))
+
+
+if __name__ == "__main__":
+    main()
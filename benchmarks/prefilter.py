@@ -0,0 +1,72 @@
+"""Benchmark of the lexicon pre-filter, measuring its skip ratio and speedup."""
+
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import List
+
+from bot.analyzer import Analyzer
+from bot.prefilter import LexiconFilter
+
+# Common chat words, a few of them such as "lol" and ":)" in the lexicon
+chatter = [
+    "jag", "du", "och", "att", "det", "är", "vi", "på", "en", "som", "lol", "ok", "hmm", "ja", "nej", "idag",
+    "imorgon", "kaffe", "lunch", "deploy", "servern", "koden", "mötet", "?", "!", ":)", ":(", "xD", "😁", "👍",
+    "🚀", "https://example.com", "@alice", "#random", "v1.2.3"
+]
+
+# Decorations of single words, as typed in chat
+decorations = ["{}", "{}!", "{}?!", "({})", "\"{}\"", "{}...", "{},", ":{}:", "{}😁", "😁{}", "#{}", "{}'s"]
+
+
+def generate_messages(words: List[str], count: int, share: float, seed: int) -> List[str]:
+    """Generate random chat messages, about a share of them containing words of the lexicon."""
+    generator = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        message = [generator.choice(chatter) for _ in range(generator.randint(1, 12))]
+        if generator.random() < share:
+            word = generator.choice(decorations).format(generator.choice(words))
+            message.insert(generator.randrange(len(message) + 1), word.upper() if generator.random() < 0.2 else word)
+        messages.append(" ".join(message))
+    return messages
+
+
+def main() -> None:
+    """Main entrypoint of the benchmark."""
+    parser = ArgumentParser(description="Measure the skip ratio and speedup of the lexicon pre-filter")
+    parser.add_argument("-n", "--messages", default=50000, type=int, help="Number of messages to generate")
+    parser.add_argument("--share", default=0.2, type=float, help="Share of messages containing a word of the lexicon")
+    parser.add_argument("--engine", default="vader", choices=Analyzer.engines, help="Scoring engine to use")
+    parser.add_argument("-r", "--repeat", default=3, type=int, help="Number of timed runs, the fastest is reported")
+    parser.add_argument("--seed", default=0, type=int, help="Seed used to generate messages")
+    options = parser.parse_args()
+
+    analyzer = Analyzer(engine=options.engine)
+    analyzer.load()
+    prefilter = LexiconFilter(analyzer, report_interval=0)
+
+    words = sorted(analyzer.lexicon)
+    messages = generate_messages(words, options.messages, options.share, options.seed)
+
+    unfiltered_time = float("inf")
+    filtered_time = float("inf")
+    for _ in range(options.repeat):
+        start = perf_counter()
+        for message in messages:
+            analyzer.polarity_scores(message)
+        unfiltered_time = min(unfiltered_time, perf_counter() - start)
+
+        start = perf_counter()
+        for message in messages:
+            if prefilter.may_score(message):
+                analyzer.polarity_scores(message)
+        filtered_time = min(filtered_time, perf_counter() - start)
+
+    print("skip ratio:     {:10.1%}".format(prefilter.skip_ratio))
+    print("unfiltered:     {:10.0f} messages/s".format(len(messages) / unfiltered_time))
+    print("filtered:       {:10.0f} messages/s ({:.1f}x)".format(len(messages) / filtered_time, unfiltered_time / filtered_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Long-lived sentiment analyzer shared by the bot's handlers."""
+
+import logging
+from logging import Logger
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Sequence
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from bot.lexicon import CompiledLexicon, CompiledSentimentIntensityAnalyzer
+from irc.metrics import Histogram, Metrics
+
+
+class Analyzer:
+    """A sentiment analyzer which loads its lexicon once and is then shared."""
+
+    # The available scoring engines. The vectorized engine requires NumPy
+    engines = ("vader", "vectorized")
+
+    def __init__(
+            self,
+            engine: str = "vader",
+            lexicon_path: Optional[str] = None,
+            logger: Optional[Logger] = None,
+            metrics: Optional[Metrics] = None
+    ) -> None:
+        if engine not in Analyzer.engines:
+            raise ValueError("Unsupported engine: {}".format(engine))
+
+        self.__engine = engine
+        self.__lexicon_path = lexicon_path
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        self.__analyzer: Optional[Any] = None
+        # Set once the lexicon has been loaded, used to wait for a warm up
+        self.__loaded = Event()
+        self.__load_lock = Lock()
+        self.__load_time: Optional[float] = None
+
+        # Timing statistics for calls to polarity_scores
+        self.__stats_lock = Lock()
+        self.__calls = 0
+        self.__total_call_time = 0.0
+        self.__max_call_time = 0.0
+        self.__call_seconds: Optional[Histogram] = None
+        if metrics is not None:
+            self.__call_seconds = metrics.histogram(
+                "bot_analysis_seconds", "Seconds spent per call to analyze messages", ("engine",)
+            ).labels(engine)
+
+    @property
+    def engine(self) -> str:
+        """The name of the scoring engine."""
+        return self.__engine
+
+    @property
+    def lexicon_path(self) -> Optional[str]:
+        """The path of the compiled lexicon, if used."""
+        return self.__lexicon_path
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether or not the lexicon has been loaded."""
+        return self.__loaded.is_set()
+
+    @property
+    def load_time(self) -> Optional[float]:
+        """The number of seconds it took to load the lexicon, if loaded."""
+        return self.__load_time
+
+    @property
+    def lexicon(self) -> Mapping[str, float]:
+        """The valence of each word, loading the lexicon first if necessary."""
+        if not self.__loaded.is_set():
+            self.load()
+        assert self.__analyzer is not None
+        lexicon: Mapping[str, float] = self.__analyzer.lexicon
+        return lexicon
+
+    @property
+    def lexicon_words(self) -> FrozenSet[str]:
+        """The words of the lexicon, loading the lexicon first if necessary. Never decodes a compiled lexicon."""
+        if not self.__loaded.is_set():
+            self.load()
+        assert self.__analyzer is not None
+        if self.__engine == "vectorized":
+            words: FrozenSet[str] = self.__analyzer.lexicon_words
+            return words
+        return frozenset(self.__analyzer.lexicon)
+
+    @property
+    def emojis(self) -> Dict[str, str]:
+        """The description of each emoji, loading the lexicon first if necessary."""
+        if not self.__loaded.is_set():
+            self.load()
+        assert self.__analyzer is not None
+        emojis: Dict[str, str] = self.__analyzer.emojis
+        return emojis
+
+    @property
+    def calls(self) -> int:
+        """The number of analyzed messages."""
+        return self.__calls
+
+    @property
+    def total_call_time(self) -> float:
+        """The total number of seconds spent analyzing messages."""
+        return self.__total_call_time
+
+    @property
+    def average_call_time(self) -> float:
+        """The average number of seconds spent analyzing a message."""
+        with self.__stats_lock:
+            return self.__total_call_time / self.__calls if self.__calls > 0 else 0.0
+
+    @property
+    def max_call_time(self) -> float:
+        """The largest number of seconds spent analyzing a single message."""
+        return self.__max_call_time
+
+    def load(self) -> None:
+        """Load the lexicon. Does nothing if it is already loaded."""
+        with self.__load_lock:
+            if self.__loaded.is_set():
+                return
+
+            self.__logger.info("Loading sentiment lexicon for the %s engine", self.__engine)
+            start = perf_counter()
+            # A compiled lexicon is mapped rather than parsed
+            lexicon = CompiledLexicon(self.__lexicon_path) if self.__lexicon_path is not None else None
+            if self.__engine == "vectorized":
+                # Imported on demand as NumPy is an optional dependency
+                from bot.vectorized import VectorizedSentimentIntensityAnalyzer  # pylint: disable=import-outside-toplevel
+                self.__analyzer = VectorizedSentimentIntensityAnalyzer(lexicon=lexicon)
+            elif lexicon is not None:
+                # VADER's lookups are too frequent to be done in place, the lexicon is decoded
+                self.__logger.warning(
+                    "The vader engine decodes the compiled lexicon, only the vectorized engine reads it in place"
+                )
+                self.__analyzer = CompiledSentimentIntensityAnalyzer(lexicon)
+                lexicon.close()
+            else:
+                self.__analyzer = SentimentIntensityAnalyzer()
+            self.__load_time = perf_counter() - start
+            self.__loaded.set()
+            self.__logger.info("Loaded sentiment lexicon in %.3fms", self.__load_time * 1000)
+
+    def warm_up(self) -> Thread:
+        """Load the lexicon in a background thread, returning the thread."""
+        thread = Thread(target=self.load, name="analyzer-warm-up")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the lexicon to be loaded. Returns whether or not it was loaded."""
+        return self.__loaded.wait(timeout)
+
+    def polarity_scores(self, text: str) -> Dict[str, Any]:
+        """Analyze a text, loading the lexicon first if necessary."""
+        if not self.__loaded.is_set():
+            self.load()
+
+        assert self.__analyzer is not None
+        start = perf_counter()
+        scores: Dict[str, Any] = self.__analyzer.polarity_scores(text)
+        elapsed = perf_counter() - start
+
+        self.__record(1, elapsed)
+        self.__logger.debug("Analyzed message in %.3fms", elapsed * 1000)
+        return scores
+
+    def polarity_scores_batch(self, texts: Sequence[str]) -> List[Dict[str, Any]]:
+        """Analyze a batch of texts, loading the lexicon first if necessary."""
+        if not self.__loaded.is_set():
+            self.load()
+
+        assert self.__analyzer is not None
+        start = perf_counter()
+        if self.__engine == "vectorized":
+            scores: List[Dict[str, Any]] = self.__analyzer.polarity_scores_batch(texts)
+        else:
+            scores = [self.__analyzer.polarity_scores(text) for text in texts]
+        elapsed = perf_counter() - start
+
+        self.__record(len(texts), elapsed)
+        self.__logger.debug("Analyzed %d messages in %.3fms", len(texts), elapsed * 1000)
+        return scores
+
+    def __record(self, calls: int, elapsed: float) -> None:
+        """Record the time spent analyzing a number of messages."""
+        if calls == 0:
+            return
+
+        with self.__stats_lock:
+            self.__calls += calls
+            self.__total_call_time += elapsed
+            self.__max_call_time = max(self.__max_call_time, elapsed / calls)
+            if self.__call_seconds is not None:
+                self.__call_seconds.observe(elapsed)
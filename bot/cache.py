@@ -0,0 +1,105 @@
+"""Bounded LRU cache of sentiment scores."""
+
+import logging
+from collections import OrderedDict
+from logging import Logger
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from bot.analyzer import Analyzer
+
+
+def is_case_insensitive(word: str) -> bool:
+    """Whether or not lowercasing a word can never change its score."""
+    # VADER only looks at the case of words written in ALL CAPS. A word which
+    # is either all lowercase or capitalized like "Hej" can therefore never be
+    # considered to be in ALL CAPS, even if an emoji within it splits it up
+    if not any(character.isupper() for character in word):
+        return True
+
+    return len(word) > 1 and word[0].isupper() and word[1].islower() and not any(
+        character.isupper() for character in word[2:]
+    )
+
+
+def normalize(text: str) -> str:
+    """Normalize a text to a cache key that scores the same as the text."""
+    words = text.split()
+    key = " ".join(words)
+    if all(is_case_insensitive(word) for word in words):
+        return key.lower()
+    return key
+
+
+class ScoreCache:
+    """A cache of polarity scores in front of an analyzer, evicting the least recently used."""
+
+    def __init__(self, analyzer: Analyzer, max_size: int = 1024, logger: Optional[Logger] = None) -> None:
+        self.__analyzer = analyzer
+        self.__max_size = max_size
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        self.__lock = Lock()
+        self.__scores: OrderedDict[str, Dict[str, Any]] = OrderedDict()  # pylint: disable=unsubscriptable-object
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def analyzer(self) -> Analyzer:
+        """The analyzer used on cache misses."""
+        return self.__analyzer
+
+    @property
+    def max_size(self) -> int:
+        """The maximum number of cached scores."""
+        return self.__max_size
+
+    @property
+    def size(self) -> int:
+        """The number of currently cached scores."""
+        return len(self.__scores)
+
+    @property
+    def hits(self) -> int:
+        """The number of lookups served from the cache."""
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """The number of lookups which required an analysis."""
+        return self.__misses
+
+    @property
+    def evictions(self) -> int:
+        """The number of scores evicted to stay within the maximum size."""
+        return self.__evictions
+
+    def polarity_scores(self, text: str) -> Dict[str, Any]:
+        """Analyze a text, using a cached result if available. The result must not be modified."""
+        if self.__max_size <= 0:
+            return self.__analyzer.polarity_scores(text)
+
+        key = normalize(text)
+        with self.__lock:
+            scores = self.__scores.get(key)
+            if scores is not None:
+                self.__scores.move_to_end(key)
+                self.__hits += 1
+                return scores
+            self.__misses += 1
+
+        # Analyze outside of the lock - two threads may analyze the same text
+        # at once, which is harmless as they produce the same result
+        scores = self.__analyzer.polarity_scores(text)
+
+        with self.__lock:
+            self.__scores[key] = scores
+            self.__scores.move_to_end(key)
+            while len(self.__scores) > self.__max_size:
+                self.__scores.popitem(last=False)
+                self.__evictions += 1
+
+        self.__logger.debug("Cached score, %d hits, %d misses, %d evictions", self.__hits, self.__misses, self.__evictions)
+        return scores
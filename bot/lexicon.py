@@ -0,0 +1,338 @@
+"""Compiled, memory-mapped sentiment lexicon."""
+
+import logging
+import mmap
+import os
+import struct
+import sys
+from argparse import ArgumentParser
+from array import array
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from vaderSentiment.vaderSentiment import BOOSTER_DICT, NEGATE, SentimentIntensityAnalyzer
+
+# The file starts with a magic string, including the format version, and the size of each section
+magic = b"SBLEX\x00\x00\x01"
+header = struct.Struct("<8sIIII")
+
+# Flags describing each word
+flag_lexicon = 1
+flag_booster = 2
+flag_negation = 4
+
+# Sections are aligned to allow reading them as arrays in place
+alignment = 8
+
+
+def _align(offset: int) -> int:
+    """Align an offset to the next section boundary."""
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _layout(word_count: int, word_width: int, emoji_count: int, descriptions_size: int) -> Tuple[int, ...]:
+    """Calculate the offsets of each section and the total size of a compiled lexicon."""
+    words = _align(header.size)
+    valences = _align(words + word_count * word_width)
+    boosters = _align(valences + word_count * 8)
+    flags = _align(boosters + word_count * 8)
+    emojis = _align(flags + word_count)
+    description_offsets = _align(emojis + emoji_count * 4)
+    descriptions = _align(description_offsets + (emoji_count + 1) * 4)
+    size = descriptions + descriptions_size
+    return words, valences, boosters, flags, emojis, description_offsets, descriptions, size
+
+
+def compile_lexicon(analyzer: SentimentIntensityAnalyzer) -> bytes:
+    """Compile the lexicon, boosters, negations and emojis of an analyzer."""
+    # VADER only ever looks up single characters as emojis
+    emojis = sorted((ord(emoji), description) for emoji, description in analyzer.emojis.items() if len(emoji) == 1)
+
+    # Words are stored as a sorted table of fixed width, NUL padded, strings
+    encoded_words = sorted(word.encode() for word in set(analyzer.lexicon) | set(BOOSTER_DICT) | set(NEGATE))
+    word_width = max(len(word) for word in encoded_words)
+
+    valences = array("d")
+    boosters = array("d")
+    flags = array("B")
+    for encoded_word in encoded_words:
+        word = encoded_word.decode()
+        valences.append(analyzer.lexicon.get(word, 0.0))
+        boosters.append(BOOSTER_DICT.get(word, 0.0))
+        flags.append(
+            (flag_lexicon if word in analyzer.lexicon else 0)
+            | (flag_booster if word in BOOSTER_DICT else 0)
+            | (flag_negation if word in NEGATE or "n't" in word else 0)
+        )
+
+    codepoints = array("I", [codepoint for codepoint, _ in emojis])
+    description_offsets = array("I", [0])
+    descriptions = bytearray()
+    for _, description in emojis:
+        descriptions += description.encode()
+        description_offsets.append(len(descriptions))
+
+    if sys.byteorder != "little":
+        for section in (valences, boosters, codepoints, description_offsets):
+            section.byteswap()
+
+    offsets = _layout(len(encoded_words), word_width, len(emojis), len(descriptions))
+    data = bytearray(offsets[-1])
+    header.pack_into(data, 0, magic, len(encoded_words), word_width, len(emojis), len(descriptions))
+    sections = (
+        b"".join(word.ljust(word_width, b"\x00") for word in encoded_words),
+        valences.tobytes(),
+        boosters.tobytes(),
+        flags.tobytes(),
+        codepoints.tobytes(),
+        description_offsets.tobytes(),
+        bytes(descriptions)
+    )
+    for offset, section in zip(offsets, sections):
+        data[offset:offset + len(section)] = section
+
+    return bytes(data)
+
+
+def write_lexicon(analyzer: SentimentIntensityAnalyzer, path: str) -> int:
+    """Compile the lexicon of an analyzer to a file. Returns the size of the file."""
+    data = compile_lexicon(analyzer)
+    # Replace the file atomically, running bots may have the previous version mapped
+    temporary_path = "{}.tmp".format(path)
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+    return len(data)
+
+
+class CompiledLexicon:  # pylint: disable=too-many-instance-attributes
+    """A compiled lexicon, read in place from a memory-mapped file or a buffer."""
+
+    def __init__(self, source: Union[str, bytes]) -> None:
+        self.__mmap: Optional[mmap.mmap] = None
+        self.__buffer: Union[bytes, mmap.mmap]
+        if isinstance(source, bytes):
+            self.__buffer = source
+        else:
+            # The pages of a read-only mapping are shared by all processes mapping the file
+            with open(source, "rb") as file:
+                self.__mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__buffer = self.__mmap
+
+        if len(self.__buffer) < header.size:
+            raise ValueError("Not a compiled lexicon")
+        file_magic, self.__word_count, self.__word_width, self.__emoji_count, descriptions_size = \
+            header.unpack_from(self.__buffer, 0)
+        if file_magic != magic:
+            raise ValueError("Not a compiled lexicon, or compiled by an unsupported version")
+
+        self.__offsets = _layout(self.__word_count, self.__word_width, self.__emoji_count, descriptions_size)
+        if len(self.__buffer) != self.__offsets[-1]:
+            raise ValueError("Truncated compiled lexicon")
+
+    @property
+    def buffer(self) -> Union[bytes, mmap.mmap]:
+        """The underlaying buffer."""
+        return self.__buffer
+
+    @property
+    def word_count(self) -> int:
+        """The number of words in the word table."""
+        return self.__word_count
+
+    @property
+    def word_width(self) -> int:
+        """The width of each entry in the word table, in bytes."""
+        return self.__word_width
+
+    @property
+    def emoji_count(self) -> int:
+        """The number of emojis."""
+        return self.__emoji_count
+
+    @property
+    def words_offset(self) -> int:
+        """The offset of the sorted, NUL padded, UTF-8 encoded word table."""
+        return self.__offsets[0]
+
+    @property
+    def valences_offset(self) -> int:
+        """The offset of the little-endian float64 valence of each word."""
+        return self.__offsets[1]
+
+    @property
+    def boosters_offset(self) -> int:
+        """The offset of the little-endian float64 booster value of each word."""
+        return self.__offsets[2]
+
+    @property
+    def flags_offset(self) -> int:
+        """The offset of the uint8 flags of each word."""
+        return self.__offsets[3]
+
+    def words(self) -> List[str]:
+        """Decode all words in the word table."""
+        start = self.words_offset
+        return [
+            bytes(self.__buffer[offset:offset + self.__word_width]).rstrip(b"\x00").decode()
+            for offset in range(start, start + self.__word_count * self.__word_width, self.__word_width)
+        ]
+
+    def lexicon(self) -> Dict[str, float]:
+        """Decode the lexicon to a dictionary, as used by VADER."""
+        valences = struct.unpack_from("<{}d".format(self.__word_count), self.__buffer, self.valences_offset)
+        flags = self.__buffer[self.flags_offset:self.flags_offset + self.__word_count]
+        return {
+            word: valence for word, valence, word_flags in zip(self.words(), valences, flags)
+            if word_flags & flag_lexicon
+        }
+
+    def emojis(self) -> Dict[str, str]:
+        """Decode the emojis to a dictionary, as used by VADER."""
+        _, _, _, _, emojis_offset, description_offsets_offset, descriptions_offset, _ = self.__offsets
+        codepoints = struct.unpack_from("<{}I".format(self.__emoji_count), self.__buffer, emojis_offset)
+        offsets = struct.unpack_from("<{}I".format(self.__emoji_count + 1), self.__buffer, description_offsets_offset)
+        return {
+            chr(codepoint): bytes(self.__buffer[descriptions_offset + start:descriptions_offset + end]).decode()
+            for codepoint, start, end in zip(codepoints, offsets, offsets[1:])
+        }
+
+    def close(self) -> None:
+        """Unmap the file, if mapped."""
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
+
+
+class MappedLexicon(Mapping[str, float]):
+    """The valences of a compiled lexicon, looked up in place by a binary search of the word table."""
+
+    def __init__(self, lexicon: CompiledLexicon) -> None:
+        self.__lexicon = lexicon
+        self.__length: Optional[int] = None
+
+    def __find(self, word: str) -> int:
+        """The index of a word of the lexicon, or -1 if it is not in the lexicon."""
+        buffer = self.__lexicon.buffer
+        width = self.__lexicon.word_width
+        encoded_word = word.encode()
+        if len(encoded_word) > width:
+            return -1
+        # Padding with NUL keeps the order of the table, words never contain NUL
+        key = encoded_word.ljust(width, b"\x00")
+
+        start = self.__lexicon.words_offset
+        low = 0
+        high = self.__lexicon.word_count
+        while low < high:
+            middle = (low + high) // 2
+            offset = start + middle * width
+            if buffer[offset:offset + width] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self.__lexicon.word_count or buffer[start + low * width:start + (low + 1) * width] != key:
+            return -1
+        return low if buffer[self.__lexicon.flags_offset + low] & flag_lexicon else -1
+
+    def __getitem__(self, word: str) -> float:
+        index = self.__find(word) if isinstance(word, str) else -1
+        if index == -1:
+            raise KeyError(word)
+        valence: float = struct.unpack_from("<d", self.__lexicon.buffer, self.__lexicon.valences_offset + index * 8)[0]
+        return valence
+
+    def __contains__(self, word: object) -> bool:
+        return isinstance(word, str) and self.__find(word) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        flags_offset = self.__lexicon.flags_offset
+        for index, word in enumerate(self.__lexicon.words()):
+            if self.__lexicon.buffer[flags_offset + index] & flag_lexicon:
+                yield word
+
+    def __len__(self) -> int:
+        if self.__length is None:
+            self.__length = sum(1 for _ in self)
+        return self.__length
+
+
+class CompiledSentimentIntensityAnalyzer(SentimentIntensityAnalyzer):
+    """VADER's analyzer, reading a compiled lexicon instead of parsing the text files.
+
+    The lexicon is decoded, unless looked up in place. Looking words up in place is slower, but keeps
+    the lexicon in the mapped pages shared by all processes. Already decoded emojis may be given.
+    """
+
+    def __init__(  # pylint: disable=super-init-not-called
+            self,
+            lexicon: CompiledLexicon,
+            in_place: bool = False,
+            emojis: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.lexicon: Mapping[str, float] = MappedLexicon(lexicon) if in_place else lexicon.lexicon()
+        self.emojis = lexicon.emojis() if emojis is None else emojis
+
+
+def check_lexicon(analyzer: SentimentIntensityAnalyzer, lexicon: CompiledLexicon) -> List[str]:
+    """Compare a compiled lexicon with the source lexicon of an analyzer. Returns the differences."""
+    differences = []
+
+    expected_lexicon = analyzer.lexicon
+    compiled_lexicon = lexicon.lexicon()
+    for word in sorted(set(expected_lexicon) | set(compiled_lexicon)):
+        if expected_lexicon.get(word) != compiled_lexicon.get(word):
+            differences.append("word {!r}: expected {}, was {}".format(
+                word, expected_lexicon.get(word), compiled_lexicon.get(word)
+            ))
+
+    expected_emojis = {emoji: description for emoji, description in analyzer.emojis.items() if len(emoji) == 1}
+    compiled_emojis = lexicon.emojis()
+    for emoji in sorted(set(expected_emojis) | set(compiled_emojis)):
+        if expected_emojis.get(emoji) != compiled_emojis.get(emoji):
+            differences.append("emoji {!r}: expected {!r}, was {!r}".format(
+                emoji, expected_emojis.get(emoji), compiled_emojis.get(emoji)
+            ))
+
+    if lexicon.buffer[:] != compile_lexicon(analyzer):
+        differences.append("file differs from a freshly compiled lexicon")
+
+    return differences
+
+
+def main() -> None:
+    """Main entrypoint for compiling and checking lexicons."""
+    logging.basicConfig(
+        format="[%(asctime)s] [%(levelname)-5s] %(message)s",
+        level=logging.INFO,
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    parser = ArgumentParser(description="Compile the sentiment lexicon to a memory-mappable file")
+    parser.add_argument("command", choices=("compile", "check"), help="Compile the lexicon or check a compiled lexicon")
+    parser.add_argument("path", help="Path of the compiled lexicon")
+    options = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    analyzer = SentimentIntensityAnalyzer()
+    if options.command == "compile":
+        size = write_lexicon(analyzer, options.path)
+        logger.info("Compiled lexicon to %s (%d bytes)", options.path, size)
+        return
+
+    try:
+        lexicon = CompiledLexicon(options.path)
+    except (OSError, ValueError) as exception:
+        logger.error("Unable to read %s: %s", options.path, exception)
+        sys.exit(1)
+    differences = check_lexicon(analyzer, lexicon)
+    lexicon.close()
+    for difference in differences:
+        logger.error("%s", difference)
+    if differences:
+        sys.exit(1)
+    logger.info("Compiled lexicon %s matches the source lexicon", options.path)
+
+
+if __name__ == "__main__":
+    main()
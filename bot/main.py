@@ -1,12 +1,27 @@
+import asyncio
+import codecs
 import csv
 import logging
 import random
-from argparse import ArgumentParser
+import re
+import signal
+from argparse import Action, ArgumentParser, Namespace
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from irc import IRC
-from irc.messages import IRCMessage
-
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from bot.analyzer import Analyzer
+from bot.cache import ScoreCache
+from bot.mood import MoodTracker, default_max_tracked, default_window_duration, default_window_size
+from bot.pipeline import AnalysisPipeline
+from bot.prefilter import LexiconFilter
+from bot.profiling import Profiler, default_sampling_interval
+from bot.sharding import ShardedPipeline
+from irc import IRC, AsyncIRC, EgressPriority, IRCManager, IRCNetwork, OverflowPolicy
+from irc.backoff import default_max_wait
+from irc.decoding import default_encodings
+from irc.flood import default_burst, default_max_queued_reactions, default_rate
+from irc.messages import IRCBaseMessage, IRCMessage
+from irc.metrics import Metrics, MetricsServer
 
 positives = [
     "(˶‾᷄ ⁻̫ ‾᷅˵)",
@@ -29,6 +44,347 @@ negatives = [
     "┻━┻ ︵ヽ(`Д´)ﾉ︵ ┻━┻"
 ]
 
+class ServerAction(Action):  # pylint: disable=too-few-public-methods
+    """Add a server, given as host or host:port, joining the channels given after it."""
+
+    def __call__(self, parser, namespace, values, option_string=None):  # type: ignore
+        host, separator, port = values.rpartition(":")
+        if not separator or not port.isdigit():
+            host, port = values, ""
+        servers = getattr(namespace, self.dest) or []
+        servers.append((host, int(port) if port else None, []))
+        setattr(namespace, self.dest, servers)
+
+
+class ChannelAction(Action):  # pylint: disable=too-few-public-methods
+    """Add a channel to the server given before it."""
+
+    def __call__(self, parser, namespace, values, option_string=None):  # type: ignore
+        servers = getattr(namespace, "server", None)
+        if servers:
+            servers[-1][2].append(values)
+        else:
+            # Channels given before any server belong to the first server
+            setattr(namespace, self.dest, (getattr(namespace, self.dest) or []) + [values])
+
+
+def create_pipeline(
+        options: Namespace,
+        on_result: Callable[[Any, Dict[str, Any]], None],
+        metrics: Optional[Metrics] = None
+) -> Tuple[Union[AnalysisPipeline, ShardedPipeline], Optional[LexiconFilter]]:
+    """Create the scoring stage shared by all connections and the pre-filter of messages submitted to it."""
+    # Create the analyzer shared by all handlers, loading the lexicon in the
+    # background while the connection (and TLS handshake) is established.
+    # Analyses are only timed in threads, worker processes use their own analyzers
+    analyzer = Analyzer(engine=options.engine, lexicon_path=options.lexicon, metrics=metrics)
+    # Worker processes load their own analyzers when started, the pre-filter
+    # reads the lexicon of this one
+    if not options.no_warm_up and (options.analysis_mode == "thread" or not options.no_prefilter):
+        analyzer.warm_up()
+
+    # Most messages contain no word of the lexicon and always score 0, never analyze them
+    prefilter = None if options.no_prefilter else LexiconFilter(analyzer)
+
+    pipeline: Union[AnalysisPipeline, ShardedPipeline]
+    if options.analysis_mode == "sharded":
+        # Route each channel to its own worker process, each loading its own analyzer
+        pipeline = ShardedPipeline(
+            analyzer,
+            options.cache_size,
+            on_result,
+            workers=options.analysis_workers,
+            max_pending=options.max_pending_analyses
+        )
+    else:
+        # Repeated messages are common, cache their scores
+        scores_cache = ScoreCache(analyzer, max_size=options.cache_size)
+
+        # Analyze messages in a pool of workers so that commands are never
+        # stuck behind a slow analysis
+        pipeline = AnalysisPipeline(
+            scores_cache,
+            on_result,
+            mode=options.analysis_mode,
+            workers=options.analysis_workers,
+            max_pending=options.max_pending_analyses
+        )
+
+    if metrics is not None:
+        metrics.gauge("bot_analysis_pending", "Number of messages submitted for analysis, not yet reported") \
+            .labels().set_function(lambda: pipeline.pending)
+        if prefilter is not None:
+            metrics.gauge("bot_prefilter_checked", "Number of messages checked by the pre-filter") \
+                .labels().set_function(lambda: prefilter.checked)
+            metrics.gauge("bot_prefilter_skipped", "Number of messages without any word of the lexicon, never analyzed") \
+                .labels().set_function(lambda: prefilter.skipped)
+    return pipeline, prefilter
+
+
+def create_handler(  # pylint: disable=too-many-arguments
+        options: Namespace,
+        irc: Union[IRC, AsyncIRC, IRCNetwork],
+        pipeline: Union[AnalysisPipeline, ShardedPipeline],
+        network: str = "",
+        metrics: Optional[Metrics] = None,
+        profiler: Optional[Profiler] = None,
+        prefilter: Optional[LexiconFilter] = None
+) -> Tuple[Callable[[IRCBaseMessage], None], Callable[[str, Dict[str, Any]], None]]:
+    """Create the handler of received messages and the reaction to analyzed messages.
+
+    Messages are submitted to the pipeline keyed by the network and target, unless ruled out by the pre-filter.
+    The mood of each target, a channel or a user in private, is tracked.
+    """
+    # Such as "sentiment-bot: profile 30s sampling", only accepted from admins
+    profile_command = re.compile(r"{}: profile(?: (\d+)([sm]?))?(?: ({}))?$".format(
+        re.escape(options.nick), "|".join(Profiler.modes)
+    ))
+    # Such as "sentiment-bot: mood #random"
+    mood_command = re.compile(r"{}: mood(?: (\S+))?$".format(re.escape(options.nick)))
+
+    # The rolling sentiment and last reaction of each target
+    moods = MoodTracker(options.mood_window, options.mood_duration * 60, options.max_tracked_moods)
+
+    reactions = None
+    if metrics is not None:
+        reactions = metrics.counter("bot_reactions_total", "Reactions sent", ("network", "target", "sentiment"))
+
+    def react(target: str, scores: Dict[str, Any]) -> None:
+        """React to an analyzed message."""
+        key = (network, target)
+        compound = scores["compound"]
+        # Private messages are labeled together, nicks would make the labels unbounded
+        label = target if target.startswith(("#", "&", "+", "!")) else "private"
+
+        # Optionally react to messages standing out from the mood of the target before them
+        baseline = 0.0
+        if options.relative_reactions:
+            mood = moods.mood(key)
+            baseline = 0.0 if mood is None else mood.mean
+        moods.record(key, compound)
+
+        if compound - baseline >= 0.6:
+            irc.send_message(target, random.choice(positives), EgressPriority.REACTION)
+            moods.record_reaction(key, scores)
+            if reactions is not None:
+                reactions.labels(network, label, "positive").inc()
+        elif compound - baseline <= -0.6:
+            irc.send_message(target, random.choice(negatives), EgressPriority.REACTION)
+            moods.record_reaction(key, scores)
+            if reactions is not None:
+                reactions.labels(network, label, "negative").inc()
+
+    def describe_mood(target: str, message: IRCMessage) -> None:
+        """Handle a command to describe the mood of the target or of a given channel."""
+        match = mood_command.match(message.message)
+        if match is None:
+            irc.send_message(target, "Usage: {}: mood [channel]".format(options.nick))
+            return
+
+        subject = match.group(1) or target
+        mood = moods.mood((network, subject))
+        if mood is None:
+            irc.send_message(target, "I have not seen any messages in {} lately".format(subject))
+            return
+
+        sentiment = "positive" if mood.mean >= 0.05 else "negative" if mood.mean <= -0.05 else "neutral"
+        trend = "rising" if mood.trend >= 0.05 else "falling" if mood.trend <= -0.05 else "steady"
+        irc.send_message(target, "The mood in {} is {} and {}: {:.2f} over the last {} messages, {:.2f} over {} messages in the last {} minutes".format(
+            subject,
+            sentiment,
+            trend,
+            mood.mean,
+            mood.messages,
+            mood.recent_mean,
+            mood.recent_messages,
+            options.mood_duration
+        ))
+
+    def is_admin(message: IRCMessage) -> bool:
+        """Whether or not the author of a message matches an admin mask."""
+        mask = "{}!{}".format(message.author, message.hostname)
+        return any(fnmatchcase(mask, pattern) for pattern in options.admin)
+
+    def profile(target: str, message: IRCMessage) -> None:
+        """Handle a command to start profiling."""
+        if profiler is None or not is_admin(message):
+            return
+
+        match = profile_command.match(message.message)
+        if match is None:
+            irc.send_message(target, "Usage: {}: profile [seconds[s|m]] [{}]".format(options.nick, "|".join(Profiler.modes)))
+            return
+
+        duration = options.profile_duration if match.group(1) is None else int(match.group(1))
+        if match.group(2) == "m":
+            duration *= 60
+        mode = match.group(3) or profiler.mode
+        if profiler.start(duration, mode):
+            irc.send_message(target, "Profiling for {}s using {}, writing to {}".format(duration, mode, profiler.directory))
+        else:
+            irc.send_message(target, "Already profiling")
+
+    def handle(message: IRCBaseMessage) -> None:
+        """Handle a received message."""
+        if not isinstance(message, IRCMessage):
+            return
+
+        target = message.author if message.target == options.nick else message.target
+
+        if message.message == "{}: help".format(options.nick):
+            irc.send_message(target, "I perform a simple sentiment analysis on your messages and respond with emojis")
+            irc.send_message(target, "You can debug the sentiment analysis of the last message like so:")
+            irc.send_message(target, "{}: debug".format(options.nick))
+            irc.send_message(target, "You can see the mood of the channel like so:")
+            irc.send_message(target, "{}: mood".format(options.nick))
+        elif message.message == "{}: debug".format(options.nick):
+            last_reaction = moods.last_reaction((network, target))
+            if last_reaction is not None:
+                compound = "compound: {}".format(last_reaction["compound"])
+                debug = ", ".join(["'{}': {}".format(text, valence) for text, valence in last_reaction["debug"]])
+                irc.send_message(target, "{}. {}".format(compound, debug))
+        elif message.message.startswith("{}: profile".format(options.nick)):
+            profile(target, message)
+        elif message.message.startswith("{}: mood".format(options.nick)):
+            describe_mood(target, message)
+        elif prefilter is None or prefilter.may_score(message.message):
+            pipeline.submit((network, target), message.message)
+        else:
+            # Messages ruled out by the pre-filter always score 0
+            moods.record((network, target), 0.0)
+
+    return handle, react
+
+
+def run(  # pylint: disable=too-many-arguments
+        options: Namespace,
+        server: str,
+        port: int,
+        channels: List[str],
+        metrics: Optional[Metrics] = None,
+        profiler: Optional[Profiler] = None
+) -> None:
+    """Run the bot using the thread-based IRC client."""
+    # Create an IRC connection
+    irc = IRC(
+        server,
+        port,
+        options.user,
+        options.nick,
+        timeout=options.timeout,
+        use_tls=options.use_tls,
+        rate=options.rate,
+        burst=options.burst,
+        max_queued_reactions=options.max_queued_reactions,
+        max_ingress_depth=options.max_ingress_depth,
+        overflow_policy=OverflowPolicy(options.overflow_policy),
+        metrics=metrics,
+        encodings=options.encodings,
+        max_reconnect_wait=options.max_reconnect_wait
+    )
+
+    reacts: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
+    pipeline, prefilter = create_pipeline(options, lambda key, scores: reacts[key[0]](key[1], scores), metrics)
+    handle, reacts[""] = create_handler(options, irc, pipeline, metrics=metrics, profiler=profiler, prefilter=prefilter)
+
+    irc.connect()
+
+    # Connect to specified channels
+    for channel in channels:
+        irc.join(channel)
+
+    # Handle all messages
+    for message in irc.messages:
+        handle(message)
+
+
+async def run_async(  # pylint: disable=too-many-arguments
+        options: Namespace,
+        server: str,
+        port: int,
+        channels: List[str],
+        metrics: Optional[Metrics] = None,
+        profiler: Optional[Profiler] = None
+) -> None:
+    """Run the bot on an event loop, using the asyncio IRC client."""
+    # Create an IRC connection
+    irc = AsyncIRC(
+        server,
+        port,
+        options.user,
+        options.nick,
+        timeout=options.timeout,
+        use_tls=options.use_tls,
+        rate=options.rate,
+        burst=options.burst,
+        max_queued_reactions=options.max_queued_reactions,
+        metrics=metrics,
+        encodings=options.encodings,
+        max_reconnect_wait=options.max_reconnect_wait
+    )
+
+    # Analysis results are handed back to the event loop, which owns the connection
+    loop = asyncio.get_running_loop()
+    reacts: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
+    pipeline, prefilter = create_pipeline(
+        options,
+        lambda key, scores: loop.call_soon_threadsafe(reacts[key[0]], key[1], scores),
+        metrics
+    )
+    handle, reacts[""] = create_handler(options, irc, pipeline, metrics=metrics, profiler=profiler, prefilter=prefilter)
+
+    await irc.connect()
+
+    # Connect to specified channels
+    for channel in channels:
+        irc.join(channel)
+
+    # Handle all messages
+    async for message in irc.messages:
+        handle(message)
+
+
+def run_networks(
+        options: Namespace,
+        servers: List[Tuple[str, int, List[str]]],
+        metrics: Optional[Metrics] = None,
+        profiler: Optional[Profiler] = None
+) -> None:
+    """Run the bot on many networks, multiplexing all connections on a single loop and sharing the analysis."""
+    manager = IRCManager()
+
+    reacts: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
+    handlers: Dict[str, Callable[[IRCBaseMessage], None]] = {}
+    pipeline, prefilter = create_pipeline(options, lambda key, scores: reacts[key[0]](key[1], scores), metrics)
+
+    for server, port, channels in servers:
+        network = manager.add(
+            "{}:{}".format(server, port),
+            server,
+            port,
+            options.user,
+            options.nick,
+            timeout=options.timeout,
+            use_tls=options.use_tls,
+            rate=options.rate,
+            burst=options.burst,
+            max_queued_reactions=options.max_queued_reactions,
+            metrics=metrics,
+            encodings=options.encodings,
+            max_reconnect_wait=options.max_reconnect_wait
+        )
+        handlers[network.name], reacts[network.name] = create_handler(
+            options, network, pipeline, network.name, metrics, profiler, prefilter
+        )
+
+        # Channels are joined once connected
+        for channel in channels:
+            network.join(channel)
+
+    # Handle all messages of all networks
+    manager.run(lambda network, message: handlers[network.name](message))
+
+
 def main() -> None:
     """Main entrypoint of the bot."""
     # Configure the default logging format
@@ -42,65 +398,89 @@ def main() -> None:
     parser = ArgumentParser(description="An IRC bot providing sentiment analysis and reactions using ASCII emojis")
 
     # Add parameters for the server connection
-    parser.add_argument("-s", "--server", required=True, type=str, help="The server to connect to")
+    parser.add_argument("-s", "--server", required=True, action=ServerAction, help="The server to connect to, as host or host:port. May be used more than once, each followed by its channels")
     # Add optional parameters for the server connection
     parser.add_argument("-p", "--port", default=6697, type=int, help="The port to connect to")
     parser.add_argument("--use-tls", default=True, type=bool, help="Whether or not to use TLS")
     parser.add_argument("-t", "--timeout", default=300, type=float, help="Connection timeout in seconds")
+    parser.add_argument("--max-reconnect-wait", default=default_max_wait, type=float, help="Longest number of seconds to wait between attempts to reconnect. Waits double from 1s up to this, with jitter")
+    parser.add_argument("--rate", default=default_rate, type=float, help="Number of lines per second to send once a burst is spent. Use 0 to disable flood control")
+    parser.add_argument("--burst", default=default_burst, type=float, help="Number of lines to send in a burst")
+    parser.add_argument("--max-queued-reactions", default=default_max_queued_reactions, type=int, help="Number of reactions to queue before replacing or dropping older ones")
+    parser.add_argument("--max-ingress-depth", default=10000, type=int, help="Number of received messages to queue before applying the overflow policy. Use 0 to disable")
+    parser.add_argument("--overflow-policy", default=OverflowPolicy.DROP_OLDEST.value, choices=[policy.value for policy in OverflowPolicy], help="Whether to block the reader, drop the oldest or drop new messages when the queue is full")
+    parser.add_argument("--encodings", default=",".join(default_encodings), type=lambda value: value.split(","), help="Comma-separated encodings to decode received messages with, tried in order. Messages not valid in any have invalid bytes replaced")
+    parser.add_argument("--use-asyncio", action="store_true", help="Run the connection on an asyncio event loop instead of in threads. Only used with a single server")
 
     # Add optional parameters for authentication etc.
     parser.add_argument("-u", "--user", default="sentiment-bot", help="Username to use when connecting to the IRC server")
     parser.add_argument("-n", "--nick", default="sentiment-bot", help="Nick to use when connecting to the IRC server")
     parser.add_argument("-g", "--gecos", default="Sentiment Bot v1.0.2 (github.com/AlexGustafsson/irc-sentiment-bot)")
-    parser.add_argument("-c", "--channel", required=True, action='append', help="Channel to join. May be used more than once")
+    parser.add_argument("-c", "--channel", required=True, action=ChannelAction, help="Channel to join on the server given before it. May be used more than once")
+
+    # Add optional parameters for the sentiment analysis
+    parser.add_argument("--no-warm-up", action="store_true", help="Load the lexicon on the first message instead of while connecting")
+    parser.add_argument("--engine", default="vader", choices=Analyzer.engines, help="Scoring engine to use. The vectorized engine requires NumPy and is fastest in batches")
+    parser.add_argument("--lexicon", help="Path to a lexicon compiled using python3 -m bot.lexicon compile")
+    parser.add_argument("--cache-size", default=1024, type=int, help="Number of scores to cache. Use 0 to disable")
+    parser.add_argument("--analysis-mode", default="thread", choices=AnalysisPipeline.modes + ("sharded",), help="Whether to analyze messages in threads, processes or processes each handling a share of the channels")
+    parser.add_argument("--no-prefilter", action="store_true", help="Analyze all messages, even those without any word of the lexicon which always score 0")
+    parser.add_argument("--analysis-workers", default=1, type=int, help="Number of threads or processes analyzing messages")
+    parser.add_argument("--max-pending-analyses", default=1000, type=int, help="Number of messages submitted for analysis, not yet reported, before waiting to read more messages. Use 0 to disable")
+    parser.add_argument("--mood-window", default=default_window_size, type=int, help="Number of last messages averaged into the mood of a channel")
+    parser.add_argument("--mood-duration", default=default_window_duration // 60, type=int, help="Number of minutes of messages averaged into the mood of a channel")
+    parser.add_argument("--max-tracked-moods", default=default_max_tracked, type=int, help="Number of channels and private conversations to track the mood of per server, forgetting the least recently active")
+    parser.add_argument("--relative-reactions", action="store_true", help="React to messages standing out from the mood of the last messages of the channel, instead of to all strongly positive or negative messages")
+
+    # Add optional parameters for monitoring
+    parser.add_argument("--metrics-port", default=0, type=int, help="Port to serve Prometheus metrics on. Use 0 to disable")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address to serve Prometheus metrics on")
+    parser.add_argument("--admin", default=[], action="append", help="Mask, such as nick!user@host, of a user allowed to run admin commands. Wildcards are supported. May be used more than once")
+    parser.add_argument("--profile-directory", default="profiles", help="Directory to write profiles to")
+    parser.add_argument("--profile-mode", default="sampling", choices=Profiler.modes, help="Whether to profile by periodically sampling stacks, writing collapsed stacks, or by tracing all calls using cProfile, writing pstats")
+    parser.add_argument("--profile-duration", default=30, type=int, help="Number of seconds to profile for when receiving SIGUSR1 or when not given in the profile command")
+    parser.add_argument("--sampling-interval", default=default_sampling_interval, type=float, help="Number of seconds between samples when profiling by sampling")
 
     # Parse the arguments
     options = parser.parse_args()
 
-    # Create an IRC connection
-    irc = IRC(
-        options.server,
-        options.port,
-        options.user,
-        options.nick,
-        timeout=options.timeout,
-        use_tls=options.use_tls
-    )
-
-    irc.connect()
+    for encoding in options.encodings:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            parser.error("unknown encoding: {}".format(encoding))
 
-    # Connect to specified channels
-    for channel in options.channel:
-        irc.join(channel)
+    if options.max_reconnect_wait < 1:
+        parser.error("the maximum reconnect wait must be at least one second")
+    if options.mood_window < 2:
+        parser.error("the mood window must hold at least two messages")
+    if options.mood_duration < 1:
+        parser.error("the mood duration must be at least one minute")
 
-    # The last analyzed result
-    lastMessageValence = None
+    # Resolve the port and channels of each server
+    servers = [(host, options.port if port is None else port, channels) for host, port, channels in options.server]
+    servers[0][2][:0] = options.channel or []
+    for host, _, channels in servers:
+        if not channels:
+            parser.error("no channel given for server {}".format(host))
 
-    # Handle all messages
-    for message in irc.messages:
-        if not isinstance(message, IRCMessage):
-            continue
+    # Metrics are only recorded if served
+    metrics = None
+    if options.metrics_port > 0:
+        metrics = Metrics()
+        MetricsServer(metrics, options.metrics_host, options.metrics_port).start()
 
-        target = message.author if message.target == options.nick else message.target
+    # Profile on demand, either on SIGUSR1 or when an admin sends the profile command
+    profiler = Profiler(options.profile_directory, options.profile_mode, options.sampling_interval)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: profiler.start(options.profile_duration))
 
-        if message.message == "{}: help".format(options.nick):
-            irc.send_message(target, "I perform a simple sentiment analysis on your messages and respond with emojis")
-            irc.send_message(target, "You can debug the sentiment analysis of the last message like so:")
-            irc.send_message(target, "{}: debug".format(options.nick))
-        elif message.message == "{}: debug".format(options.nick):
-            if lastMessageValence is not None:
-                compound = "compound: {}".format(lastMessageValence["compound"])
-                debug = ", ".join(["'{}': {}".format(text, valence) for text, valence in lastMessageValence["debug"]])
-                irc.send_message(target, "{}. {}".format(compound, debug))
-        else:
-            analyzer = SentimentIntensityAnalyzer()
-            scores = analyzer.polarity_scores(message.message)
-            if scores["compound"] >= 0.6:
-                irc.send_message(target, random.choice(positives))
-                lastMessageValence = scores
-            elif scores["compound"] <= -0.6:
-                irc.send_message(target, random.choice(negatives))
-                lastMessageValence = scores
+    if len(servers) > 1:
+        run_networks(options, servers, metrics, profiler)
+    elif options.use_asyncio:
+        asyncio.run(run_async(options, *servers[0], metrics, profiler))
+    else:
+        run(options, *servers[0], metrics, profiler)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+"""Rolling sentiment of channels and private conversations, kept in constant memory."""
+
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+# The number of last messages averaged
+default_window_size = 100
+
+# The number of seconds of messages averaged
+default_window_duration = 600
+
+# The number of buckets the duration is divided into, the precision of the time window
+default_buckets = 60
+
+# The number of channels and private conversations tracked
+default_max_tracked = 1024
+
+
+class MessageWindow:
+    """The scores of the last messages, kept in a ring buffer with incrementally updated sums.
+
+    The trend is the mean of the newer half of the window minus the mean of the older half.
+    """
+
+    def __init__(self, size: int = default_window_size) -> None:
+        if size < 2:
+            raise ValueError("The window must hold at least two messages")
+
+        self.__scores = array("d", bytes(8 * size))
+        self.__size = size
+        self.__half = size // 2
+        # The slot written next, holding the oldest score once full
+        self.__next = 0
+        self.__count = 0
+        self.__sum = 0.0
+        self.__newer_sum = 0.0
+
+    @property
+    def count(self) -> int:
+        """The number of messages in the window."""
+        return self.__count
+
+    @property
+    def mean(self) -> float:
+        """The mean score of the messages in the window."""
+        return self.__sum / self.__count if self.__count > 0 else 0.0
+
+    @property
+    def trend(self) -> float:
+        """The mean score of the newer half of the window minus that of the older half."""
+        older_count = self.__count - self.__half
+        if older_count <= 0:
+            return 0.0
+        return self.__newer_sum / self.__half - (self.__sum - self.__newer_sum) / older_count
+
+    def add(self, score: float) -> None:
+        """Add the score of a message, dropping the oldest if full."""
+        scores = self.__scores
+        if self.__count == self.__size:
+            self.__sum -= scores[self.__next]
+        else:
+            self.__count += 1
+        # The score half a window back moves on to the older half
+        if self.__count > self.__half:
+            self.__newer_sum -= scores[(self.__next - self.__half) % self.__size]
+
+        scores[self.__next] = score
+        self.__sum += score
+        self.__newer_sum += score
+        self.__next = (self.__next + 1) % self.__size
+
+        # Recompute the sums once per lap, keeping rounding errors from accumulating
+        if self.__next == 0:
+            self.__sum = sum(scores)
+            self.__newer_sum = sum(scores[self.__size - self.__half:])
+
+
+class TimeWindow:
+    """The scores of messages within a duration, summed in a ring of fixed time buckets.
+
+    Buckets are dropped as a whole, the window covers the duration to within the width of a bucket.
+    """
+
+    def __init__(self, duration: float = default_window_duration, buckets: int = default_buckets) -> None:
+        if duration <= 0 or buckets < 1:
+            raise ValueError("The window must have a positive duration and at least one bucket")
+
+        self.__duration = duration
+        self.__width = duration / buckets
+        self.__sums = array("d", bytes(8 * buckets))
+        self.__counts = array("L", bytes(array("L").itemsize * buckets))
+        self.__buckets = buckets
+        # The number of the current bucket, counted in bucket widths since the epoch of the clock
+        self.__current = 0
+        self.__count = 0
+        self.__sum = 0.0
+
+    @property
+    def duration(self) -> float:
+        """The number of seconds covered by the window."""
+        return self.__duration
+
+    def count(self, now: Optional[float] = None) -> int:
+        """The number of messages in the window."""
+        self.__advance(monotonic() if now is None else now)
+        return self.__count
+
+    def mean(self, now: Optional[float] = None) -> float:
+        """The mean score of the messages in the window."""
+        self.__advance(monotonic() if now is None else now)
+        return self.__sum / self.__count if self.__count > 0 else 0.0
+
+    def add(self, score: float, now: Optional[float] = None) -> None:
+        """Add the score of a message."""
+        self.__advance(monotonic() if now is None else now)
+        index = self.__current % self.__buckets
+        self.__sums[index] += score
+        self.__counts[index] += 1
+        self.__sum += score
+        self.__count += 1
+
+    def __advance(self, now: float) -> None:
+        """Drop the buckets which have fallen out of the window."""
+        current = int(now // self.__width)
+        elapsed = current - self.__current
+        if elapsed <= 0:
+            return
+
+        if elapsed >= self.__buckets or self.__count == 0:
+            # All buckets have expired, also resetting any rounding errors
+            for index in range(self.__buckets):
+                self.__sums[index] = 0.0
+                self.__counts[index] = 0
+            self.__sum = 0.0
+            self.__count = 0
+        else:
+            for bucket in range(self.__current + 1, current + 1):
+                index = bucket % self.__buckets
+                self.__sum -= self.__sums[index]
+                self.__count -= self.__counts[index]
+                self.__sums[index] = 0.0
+                self.__counts[index] = 0
+        self.__current = current
+
+
+class Mood(NamedTuple):
+    """The rolling sentiment of a channel or private conversation."""
+
+    messages: int
+    mean: float
+    trend: float
+    recent_messages: int
+    recent_mean: float
+
+
+class _Tracked:  # pylint: disable=too-few-public-methods
+    """The windows of a tracked channel or private conversation."""
+
+    __slots__ = ("messages", "recent", "last_reaction")
+
+    def __init__(self, window_size: int, window_duration: float) -> None:
+        self.messages = MessageWindow(window_size)
+        self.recent = TimeWindow(window_duration)
+        self.last_reaction: Optional[Dict[str, Any]] = None
+
+
+class MoodTracker:
+    """Tracks the rolling sentiment of channels and private conversations, forgetting the least recently active."""
+
+    def __init__(
+            self,
+            window_size: int = default_window_size,
+            window_duration: float = default_window_duration,
+            max_tracked: int = default_max_tracked
+    ) -> None:
+        # Fail early on invalid windows
+        MessageWindow(window_size)
+        TimeWindow(window_duration)
+
+        self.__window_size = window_size
+        self.__window_duration = window_duration
+        self.__max_tracked = max_tracked
+
+        self.__lock = Lock()
+        self.__tracked: OrderedDict[Hashable, _Tracked] = OrderedDict()  # pylint: disable=unsubscriptable-object
+        self.__evictions = 0
+
+    @property
+    def window_size(self) -> int:
+        """The number of last messages averaged."""
+        return self.__window_size
+
+    @property
+    def window_duration(self) -> float:
+        """The number of seconds of messages averaged."""
+        return self.__window_duration
+
+    @property
+    def tracked(self) -> int:
+        """The number of tracked channels and private conversations."""
+        return len(self.__tracked)
+
+    @property
+    def evictions(self) -> int:
+        """The number of channels and private conversations forgotten to stay within the limit."""
+        return self.__evictions
+
+    def record(self, key: Hashable, score: float, now: Optional[float] = None) -> None:
+        """Record the compound score of a message."""
+        now = monotonic() if now is None else now
+        with self.__lock:
+            tracked = self.__track(key)
+            tracked.messages.add(score)
+            tracked.recent.add(score, now)
+
+    def record_reaction(self, key: Hashable, scores: Dict[str, Any]) -> None:
+        """Remember the scores of the last message reacted to."""
+        with self.__lock:
+            self.__track(key).last_reaction = scores
+
+    def last_reaction(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """The scores of the last message reacted to, if any."""
+        with self.__lock:
+            tracked = self.__tracked.get(key)
+            return None if tracked is None else tracked.last_reaction
+
+    def mood(self, key: Hashable, now: Optional[float] = None) -> Optional[Mood]:
+        """The mood of a channel or private conversation, if tracked."""
+        now = monotonic() if now is None else now
+        with self.__lock:
+            tracked = self.__tracked.get(key)
+            if tracked is None or tracked.messages.count == 0:
+                return None
+            return Mood(
+                tracked.messages.count,
+                tracked.messages.mean,
+                tracked.messages.trend,
+                tracked.recent.count(now),
+                tracked.recent.mean(now)
+            )
+
+    def __track(self, key: Hashable) -> _Tracked:
+        """Get the windows of a channel or private conversation, marking it as the most recently active."""
+        tracked = self.__tracked.get(key)
+        if tracked is not None:
+            self.__tracked.move_to_end(key)
+            return tracked
+
+        tracked = _Tracked(self.__window_size, self.__window_duration)
+        self.__tracked[key] = tracked
+        if len(self.__tracked) > self.__max_tracked:
+            self.__tracked.popitem(last=False)
+            self.__evictions += 1
+        return tracked
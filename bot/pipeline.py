@@ -0,0 +1,128 @@
+"""Pipeline stage offloading sentiment analysis to a pool of workers."""
+
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from logging import Logger
+from threading import Lock, Semaphore
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from bot.analyzer import Analyzer
+from bot.cache import ScoreCache
+
+# The cache of each worker process, created when the process starts
+_worker_scores_cache: Optional[ScoreCache] = None
+
+
+def _initialize_worker(engine: str, lexicon_path: Optional[str], cache_size: int) -> None:
+    """Initialize a worker process with a preloaded analyzer."""
+    global _worker_scores_cache  # pylint: disable=global-statement
+    analyzer = Analyzer(engine=engine, lexicon_path=lexicon_path)
+    analyzer.load()
+    _worker_scores_cache = ScoreCache(analyzer, max_size=cache_size)
+
+
+def _analyze_in_worker(text: str) -> Dict[str, Any]:
+    """Analyze a text using the worker process' analyzer."""
+    assert _worker_scores_cache is not None
+    return _worker_scores_cache.polarity_scores(text)
+
+
+class AnalysisPipeline:
+    """Analyzes messages in a pool of workers, reporting results in order per channel."""
+
+    modes = ("thread", "process")
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            scores_cache: ScoreCache,
+            on_result: Callable[[Hashable, Dict[str, Any]], None],
+            mode: str = "thread",
+            workers: int = 1,
+            max_pending: int = 0,
+            logger: Optional[Logger] = None
+    ) -> None:
+        if mode not in AnalysisPipeline.modes:
+            raise ValueError("Unsupported analysis mode: {}".format(mode))
+
+        self.__scores_cache = scores_cache
+        self.__on_result = on_result
+        self.__mode = mode
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        self.__executor: Executor
+        if mode == "process":
+            # Each process keeps its own preloaded analyzer and cache
+            self.__executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_initialize_worker,
+                initargs=(scores_cache.analyzer.engine, scores_cache.analyzer.lexicon_path, scores_cache.max_size)
+            )
+        else:
+            # Threads share the analyzer and cache of the bot
+            self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+
+        # Pending analyses per channel, in the order they were submitted
+        self.__lock = Lock()
+        self.__pending: Dict[Hashable, Deque[Future]] = {}  # pylint: disable=unsubscriptable-object
+        # Slots for pending analyses, a maximum of zero or less leaves them unbounded
+        self.__slots = Semaphore(max_pending) if max_pending > 0 else None
+
+    @property
+    def mode(self) -> str:
+        """The kind of worker pool used, either "thread" or "process"."""
+        return self.__mode
+
+    @property
+    def pending(self) -> int:
+        """The number of submitted messages not yet reported."""
+        with self.__lock:
+            return sum(len(futures) for futures in self.__pending.values())
+
+    def submit(self, channel: Hashable, text: str) -> None:
+        """Submit a message for analysis. The result is reported once all earlier messages in the channel are.
+
+        Blocks while the maximum number of analyses are pending, holding up the reading of messages.
+        """
+        if self.__slots is not None:
+            self.__slots.acquire()  # pylint: disable=consider-using-with
+
+        future: Future
+        if self.__mode == "process":
+            future = self.__executor.submit(_analyze_in_worker, text)
+        else:
+            future = self.__executor.submit(self.__scores_cache.polarity_scores, text)
+
+        with self.__lock:
+            self.__pending.setdefault(channel, deque()).append(future)
+
+        # Added outside of the lock as the callback is called immediately if already done
+        future.add_done_callback(lambda _: self.__report(channel))
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers, by default waiting for pending analyses to complete."""
+        self.__executor.shutdown(wait=wait)
+
+    def __report(self, channel: Hashable) -> None:
+        """Report all completed analyses at the front of a channel's queue."""
+        # The lock is held while reporting to keep the order within the channel
+        with self.__lock:
+            futures = self.__pending.get(channel)
+            while futures and futures[0].done():
+                future = futures.popleft()
+                if self.__slots is not None:
+                    self.__slots.release()
+                try:
+                    scores = future.result()
+                except Exception:  # pylint: disable=broad-except
+                    self.__logger.error("Unable to analyze message", exc_info=True)
+                    continue
+
+                try:
+                    self.__on_result(channel, scores)
+                except Exception:  # pylint: disable=broad-except
+                    self.__logger.error("Unable to handle analyzed message", exc_info=True)
+
+            if futures is not None and len(futures) == 0:
+                del self.__pending[channel]
+
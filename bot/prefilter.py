@@ -0,0 +1,93 @@
+"""Cheap pre-filter ruling out messages which can never be given a sentiment."""
+
+import logging
+from logging import Logger
+from string import punctuation
+from typing import Dict, FrozenSet, Optional
+
+from bot.analyzer import Analyzer
+
+# The number of checked messages between reports of the skip ratio
+default_report_interval = 10000
+
+
+class LexiconFilter:
+    """Rules out messages without any word of the lexicon, which VADER always scores 0.
+
+    VADER only gives a valence to words in the lexicon. Boosters, negations and idioms only
+    modify the valence of such words, so a message without any of them scores 0. Emojis are
+    replaced by their descriptions first, as VADER does.
+    """
+
+    def __init__(
+            self,
+            analyzer: Analyzer,
+            report_interval: int = default_report_interval,
+            logger: Optional[Logger] = None
+    ) -> None:
+        self.__analyzer = analyzer
+        self.__report_interval = report_interval
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        # Read from the analyzer on first use, once its lexicon is loaded
+        self.__words: Optional[FrozenSet[str]] = None
+        self.__emojis: FrozenSet[str] = frozenset()
+        self.__emoji_table: Dict[int, str] = {}
+
+        self.__checked = 0
+        self.__skipped = 0
+
+    @property
+    def checked(self) -> int:
+        """The number of checked messages."""
+        return self.__checked
+
+    @property
+    def skipped(self) -> int:
+        """The number of messages ruled out."""
+        return self.__skipped
+
+    @property
+    def skip_ratio(self) -> float:
+        """The share of checked messages ruled out."""
+        return self.__skipped / self.__checked if self.__checked > 0 else 0.0
+
+    def may_score(self, text: str) -> bool:
+        """Whether or not a text may have a sentiment. If not, it always scores 0."""
+        words = self.__words
+        if words is None:
+            words = self.__load()
+
+        # All emojis are non-ASCII, skip the translation for plain text and text without emojis
+        if not text.isascii() and not self.__emojis.isdisjoint(text):
+            text = text.translate(self.__emoji_table)
+
+        may_score = False
+        for word in text.split():
+            # VADER strips punctuation unless it leaves two characters or less, try both
+            lowercase = word.lower()
+            if lowercase in words or lowercase.strip(punctuation) in words:
+                may_score = True
+                break
+
+        self.__checked += 1
+        if not may_score:
+            self.__skipped += 1
+        if self.__report_interval > 0 and self.__checked % self.__report_interval == 0:
+            self.__logger.info(
+                "Skipped %d of %d messages without any word of the lexicon (%.1f%%)",
+                self.__skipped, self.__checked, self.skip_ratio * 100
+            )
+
+        return may_score
+
+    def __load(self) -> FrozenSet[str]:
+        """Read the words and emojis of the analyzer's lexicon."""
+        # VADER only ever looks up single characters as emojis
+        self.__emoji_table = {
+            ord(emoji): " " + description for emoji, description in self.__analyzer.emojis.items() if len(emoji) == 1
+        }
+        self.__emojis = frozenset(chr(emoji) for emoji in self.__emoji_table)
+        # The word table of a compiled lexicon is read without decoding the valences
+        self.__words = self.__analyzer.lexicon_words
+        return self.__words
@@ -0,0 +1,138 @@
+"""Time-bounded profiling sessions of all threads, started while running."""
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+from logging import Logger
+from threading import Lock, Thread
+from time import monotonic, sleep, strftime
+from typing import Dict, Optional
+
+# The number of seconds between samples in the sampling mode
+default_sampling_interval = 0.01
+
+# The longest allowed session, in seconds
+max_duration = 3600
+
+
+class Profiler:
+    """Profiles all threads for a limited time, writing the results to a directory.
+
+    The deterministic mode writes pstats files using cProfile. It sees all threads on Python 3.12
+    and later, older versions fall back to sampling. The sampling mode periodically records the
+    stacks of all threads, writing collapsed stacks for flame graphs, and is light enough to use
+    in production.
+    """
+
+    modes = ("sampling", "deterministic")
+
+    def __init__(
+            self,
+            directory: str,
+            mode: str = "sampling",
+            sampling_interval: float = default_sampling_interval,
+            logger: Optional[Logger] = None
+    ) -> None:
+        if mode not in Profiler.modes:
+            raise ValueError("Unsupported profiling mode: {}".format(mode))
+
+        self.__directory = directory
+        self.__mode = mode
+        self.__sampling_interval = sampling_interval
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        self.__lock = Lock()
+        self.__session: Optional[Thread] = None
+
+    @property
+    def directory(self) -> str:
+        """The directory profiles are written to."""
+        return self.__directory
+
+    @property
+    def mode(self) -> str:
+        """The default mode of sessions."""
+        return self.__mode
+
+    @property
+    def is_running(self) -> bool:
+        """Whether or not a session is running."""
+        return self.__session is not None and self.__session.is_alive()
+
+    def start(self, duration: float, mode: Optional[str] = None) -> bool:
+        """Start a session in the background, unless one is already running. Returns whether or not it was started."""
+        mode = self.__mode if mode is None else mode
+        if mode not in Profiler.modes:
+            raise ValueError("Unsupported profiling mode: {}".format(mode))
+        duration = min(max(0.0, duration), max_duration)
+
+        with self.__lock:
+            if self.is_running:
+                return False
+
+            self.__session = Thread(target=self.__run, args=(duration, mode), name="profiler")
+            self.__session.daemon = True
+            self.__session.start()
+            return True
+
+    def __run(self, duration: float, mode: str) -> None:
+        """Run a session, writing its result."""
+        # Before 3.12, cProfile only sees the thread enabling it
+        if mode == "deterministic" and sys.version_info < (3, 12):
+            self.__logger.warning("Deterministic profiling of all threads requires Python 3.12, sampling instead")
+            mode = "sampling"
+
+        self.__logger.info("Profiling all threads for %.0fs using %s", duration, mode)
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            path = os.path.join(self.__directory, "profile-{}".format(strftime("%Y%m%d-%H%M%S")))
+            if mode == "deterministic":
+                path += ".pstats"
+                self.__profile(duration, path)
+            else:
+                path += ".collapsed"
+                self.__sample(duration, path)
+        except Exception:  # pylint: disable=broad-except
+            self.__logger.error("Unable to profile", exc_info=True)
+            return
+
+        self.__logger.info("Wrote profile to %s", path)
+
+    def __profile(self, duration: float, path: str) -> None:
+        """Profile all function calls using cProfile, writing pstats."""
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            sleep(duration)
+        finally:
+            profile.disable()
+        profile.dump_stats(path)
+
+    def __sample(self, duration: float, path: str) -> None:
+        """Sample the stacks of all other threads, writing collapsed stacks."""
+        own_ident = threading.get_ident()
+        samples: Dict[str, int] = {}
+        end = monotonic() + duration
+        while monotonic() < end:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == own_ident:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back  # type: ignore
+                stack.append(names.get(ident, str(ident)))
+
+                # Collapsed stacks list the outermost frame first
+                key = ";".join(reversed(stack))
+                samples[key] = samples.get(key, 0) + 1
+            sleep(self.__sampling_interval)
+
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in sorted(samples.items()):
+                file.write("{} {}\n".format(stack, count))
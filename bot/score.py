@@ -0,0 +1,368 @@
+"""Offline scoring of chat logs, streaming lines from files or stdin."""
+
+import csv
+import json
+import logging
+import os
+import re
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from logging import Logger
+from time import monotonic
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Tuple
+
+from bot.analyzer import Analyzer
+from bot.prefilter import LexiconFilter
+from irc.decoding import LineDecoder, default_encodings
+from irc.messages import IRCMessage
+
+# Plain text log formats, each capturing the time, nick and message of a line
+log_formats: Dict[str, Pattern] = {
+    # 12:34 < nick> message
+    "irssi": re.compile(r"^(\d\d:\d\d(?::\d\d)?) < ?[~&@%+]?([^>]+)> (.*)$"),
+    # [12:34:56] <nick> message
+    "znc": re.compile(r"^\[([^\]]+)\] <([^>]+)> (.*)$"),
+    # 2024-01-31 12:34:56\tnick\tmessage, skipping joins, parts and actions
+    "weechat": re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\t[~&@%+]?([^\t\s*<>-][^\t]*)\t(.*)$"),
+}
+
+# Raw IRC lines, as sent by the server
+formats = ("auto", "irc") + tuple(log_formats)
+
+output_formats = ("jsonl", "csv")
+
+# The fields of each result, in order
+fields = ("file", "offset", "time", "channel", "nick", "compound", "positive", "negative", "neutral", "message")
+
+# The analyzer and pre-filter of each worker process, created when the process starts
+_worker_analyzer: Optional[Analyzer] = None
+_worker_prefilter: Optional[LexiconFilter] = None
+
+
+class LogLine(NamedTuple):
+    """A message read from a log."""
+
+    file: str
+    offset: int
+    time: str
+    channel: str
+    nick: str
+    message: str
+
+
+def _initialize_worker(engine: str, lexicon_path: Optional[str], prefilter: bool) -> None:
+    """Initialize a worker process with a preloaded analyzer."""
+    global _worker_analyzer, _worker_prefilter  # pylint: disable=global-statement
+    _worker_analyzer = Analyzer(engine=engine, lexicon_path=lexicon_path)
+    _worker_analyzer.load()
+    _worker_prefilter = LexiconFilter(_worker_analyzer, report_interval=0) if prefilter else None
+
+
+def _score_batch(texts: List[str]) -> List[Tuple[float, float, float, float]]:
+    """Score a batch of texts using the worker's analyzer, as compound, positive, negative and neutral scores."""
+    assert _worker_analyzer is not None
+    # Texts without any word of the lexicon score 0, and are entirely neutral unless empty
+    results: List[Tuple[float, float, float, float]] = [
+        (0.0, 0.0, 0.0, 1.0 if text.split() else 0.0) for text in texts
+    ]
+    indices = [
+        index for index, text in enumerate(texts) if _worker_prefilter is None or _worker_prefilter.may_score(text)
+    ]
+    for index, scores in zip(indices, _worker_analyzer.polarity_scores_batch([texts[index] for index in indices])):
+        results[index] = (scores["compound"], scores["pos"], scores["neg"], scores["neu"])
+    return results
+
+
+def parse_line(line: str, log_format: str) -> Optional[Tuple[str, str, str, str]]:
+    """Parse a line as the time, channel, nick and message of a message. The channel of log formats is empty."""
+    if log_format in ("auto", "irc"):
+        message = IRCMessage.parse(line)
+        if message is not None:
+            return "", message.target, message.author, message.message
+        if log_format == "irc":
+            return None
+
+    patterns = log_formats.values() if log_format == "auto" else (log_formats[log_format],)
+    for pattern in patterns:
+        match = pattern.match(line)
+        if match is not None:
+            return match.group(1), "", match.group(2), match.group(3)
+    return None
+
+
+def read_lines(file: IO[bytes], decoder: LineDecoder, offset: int = 0) -> Iterator[Tuple[int, str]]:
+    """Read the lines of a file opened at an offset, yielding the byte offset of each line and the line."""
+    for raw_line in file:
+        yield offset, decoder.decode(raw_line.rstrip(b"\r\n"))
+        offset += len(raw_line)
+
+
+def read_messages(
+        paths: Iterable[str],
+        log_format: str,
+        decoder: LineDecoder,
+        resume_point: Optional[Tuple[str, int]] = None,
+        start_offset: int = 0
+) -> Iterator[LogLine]:
+    """Read the messages of files, or stdin given as "-", after a resume point if given.
+
+    Without a resume point, the first file is read from a byte offset.
+    """
+    for index, path in enumerate(paths):
+        offset = start_offset if index == 0 and resume_point is None else 0
+        # The line at a resume point was the last scored, unlike the line at a start offset
+        skip_line = False
+        if resume_point is not None:
+            # Skip the files before the one last scored
+            if path != resume_point[0]:
+                continue
+            offset = resume_point[1]
+            skip_line = True
+            resume_point = None
+
+        # The channel of plain text logs is given by their name, such as "#random.log"
+        default_channel = "" if path == "-" else os.path.splitext(os.path.basename(path))[0]
+
+        file = sys.stdin.buffer if path == "-" else open(path, "rb")  # pylint: disable=consider-using-with
+        try:
+            if offset > 0:
+                if file.seekable():
+                    file.seek(offset)
+                else:
+                    skip(file, offset)
+            if skip_line:
+                offset += len(file.readline())
+
+            for line_offset, line in read_lines(file, decoder, offset):
+                parsed = parse_line(line, log_format)
+                if parsed is not None:
+                    time, channel, nick, message = parsed
+                    yield LogLine(path, line_offset, time, channel or default_channel, nick, message)
+        finally:
+            if file is not sys.stdin.buffer:
+                file.close()
+
+    if resume_point is not None:
+        raise ValueError("The file to resume, {}, is not among the inputs".format(resume_point[0]))
+
+
+def skip(file: IO[bytes], size: int) -> None:
+    """Skip a number of bytes of an unseekable file."""
+    while size > 0:
+        skipped = len(file.read(min(size, 1 << 16)))
+        if skipped == 0:
+            break
+        size -= skipped
+
+
+def batched(lines: Iterable[LogLine], size: int) -> Iterator[List[LogLine]]:
+    """Group lines into batches of a size."""
+    batch: List[LogLine] = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ResultWriter:
+    """Writes scored lines as JSON lines or CSV, flushing each batch."""
+
+    def __init__(self, file: IO[str], output_format: str = "jsonl", header: bool = True) -> None:
+        if output_format not in output_formats:
+            raise ValueError("Unsupported output format: {}".format(output_format))
+
+        self.__file = file
+        self.__writer = csv.writer(file) if output_format == "csv" else None
+        if self.__writer is not None and header:
+            self.__writer.writerow(fields)
+
+    def write(self, lines: List[LogLine], scores: List[Tuple[float, float, float, float]]) -> None:
+        """Write a batch of scored lines."""
+        for line, line_scores in zip(lines, scores):
+            row = tuple(line[:5]) + line_scores + (line.message,)
+            if self.__writer is not None:
+                self.__writer.writerow(row)
+            else:
+                self.__file.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+        self.__file.flush()
+
+
+def find_resume_point(path: str, output_format: str) -> Optional[Tuple[str, int]]:
+    """Find the file and offset of the last line written to an output, truncating any partially written line."""
+    with open(path, "rb+") as file:
+        # Read backwards until the last complete line is found
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        tail = b""
+        while position > 0 and tail.count(b"\n") < 2:
+            position = max(0, position - (1 << 16))
+            file.seek(position)
+            tail = file.read(end - position)
+
+        complete = tail[:tail.rfind(b"\n") + 1]
+        if len(complete) < len(tail):
+            file.truncate(position + len(complete))
+
+    # Only the last line is complete, the read may have started within a character
+    lines = complete.split(b"\n")
+    if len(lines) < 2:
+        return None
+    last_line = lines[-2].decode("utf-8")
+
+    if output_format == "csv":
+        row = next(csv.reader([last_line]))
+        if row == list(fields):
+            return None
+        record: Dict[str, Any] = dict(zip(fields, row))
+    else:
+        record = json.loads(last_line)
+    return str(record["file"]), int(record["offset"])
+
+
+def score(  # pylint: disable=too-many-arguments,too-many-locals
+        lines: Iterable[LogLine],
+        writer: ResultWriter,
+        analyzer: Analyzer,
+        batch_size: int = 256,
+        workers: int = 1,
+        prefilter: bool = True,
+        progress_interval: float = 10,
+        logger: Optional[Logger] = None
+) -> int:
+    """Score lines in batches, writing the results in order. Returns the number of lines scored."""
+    logger = logging.getLogger(__name__) if logger is None else logger
+    start = monotonic()
+    last_report = start
+    scored = 0
+
+    def report(final: bool = False) -> None:
+        """Log the progress."""
+        elapsed = monotonic() - start
+        logger.info(
+            "%s %d lines in %.1fs (%.0f lines/s)",
+            "Scored" if final else "Scoring,", scored, elapsed, scored / elapsed if elapsed > 0 else 0
+        )
+
+    executor = None
+    if workers > 1:
+        # Each process keeps its own preloaded analyzer
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_initialize_worker,
+            initargs=(analyzer.engine, analyzer.lexicon_path, prefilter)
+        )
+    else:
+        _initialize_worker(analyzer.engine, analyzer.lexicon_path, prefilter)
+
+    # Batches being scored, in order. Keeping a few per worker bounds the memory used
+    in_flight: Deque[Tuple[List[LogLine], Future]] = deque()  # pylint: disable=unsubscriptable-object
+    try:
+        for batch in batched(lines, batch_size):
+            if executor is None:
+                writer.write(batch, _score_batch([line.message for line in batch]))
+            else:
+                in_flight.append((batch, executor.submit(_score_batch, [line.message for line in batch])))
+                if len(in_flight) < 2 * workers:
+                    continue
+                batch, future = in_flight.popleft()
+                writer.write(batch, future.result())
+            scored += len(batch)
+
+            if progress_interval > 0 and monotonic() - last_report >= progress_interval:
+                last_report = monotonic()
+                report()
+
+        while in_flight:
+            batch, future = in_flight.popleft()
+            writer.write(batch, future.result())
+            scored += len(batch)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    report(final=True)
+    return scored
+
+
+def main() -> None:
+    """Main entrypoint for scoring logs."""
+    logging.basicConfig(
+        format="[%(asctime)s] [%(levelname)-5s] %(message)s",
+        level=logging.INFO,
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    parser = ArgumentParser(description="Score the messages of chat logs, writing the scores of each message")
+    parser.add_argument("inputs", nargs="*", default=["-"], help="Logs to score, in order. Use - for stdin, the default")
+    parser.add_argument("-f", "--format", default="auto", choices=formats, help="Format of the logs. Raw IRC lines or plain text logs of a channel, named after the channel")
+    parser.add_argument("-o", "--output", help="File to write results to, stdout by default")
+    parser.add_argument("--output-format", choices=output_formats, help="Format of the results. Inferred from the output file's extension, JSON lines by default")
+    parser.add_argument("--resume", action="store_true", help="Continue after the last line written to the output, appending to it")
+    parser.add_argument("--offset", default=0, type=int, help="Byte offset of the first input to start reading from")
+    parser.add_argument("--engine", default="vader", choices=Analyzer.engines, help="Scoring engine to use. The vectorized engine requires NumPy and is fastest in batches")
+    parser.add_argument("--lexicon", help="Path to a lexicon compiled using python3 -m bot.lexicon compile")
+    parser.add_argument("--batch-size", default=256, type=int, help="Number of messages scored at once")
+    parser.add_argument("--workers", default=1, type=int, help="Number of processes scoring batches. Use 1 to score in this process")
+    parser.add_argument("--no-prefilter", action="store_true", help="Score all messages, even those without any word of the lexicon which always score 0")
+    parser.add_argument("--encodings", default=",".join(default_encodings), type=lambda value: value.split(","), help="Comma-separated encodings to decode lines with, tried in order")
+    parser.add_argument("--progress-interval", default=10, type=float, help="Number of seconds between reports of the progress. Use 0 to disable")
+    options = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    output_format = options.output_format
+    if output_format is None:
+        output_format = "csv" if options.output is not None and options.output.endswith(".csv") else "jsonl"
+
+    try:
+        decoder = LineDecoder(options.encodings)
+    except LookupError as exception:
+        parser.error(str(exception))
+    if options.batch_size < 1:
+        parser.error("the batch size must be at least 1")
+
+    resume_point = None
+    if options.offset < 0:
+        parser.error("the offset must not be negative")
+    if options.resume:
+        if options.output is None:
+            parser.error("--resume requires --output")
+        if os.path.exists(options.output):
+            resume_point = find_resume_point(options.output, output_format)
+        if resume_point is not None:
+            logger.info("Resuming %s after offset %d", *resume_point)
+    append = options.resume and options.output is not None and os.path.exists(options.output)
+
+    output = sys.stdout if options.output is None else open(  # pylint: disable=consider-using-with
+        options.output, "a" if append else "w", encoding="utf-8", newline=""
+    )
+    writer = ResultWriter(output, output_format, header=not append or os.path.getsize(options.output) == 0)
+    analyzer = Analyzer(engine=options.engine, lexicon_path=options.lexicon)
+    try:
+        score(
+            read_messages(options.inputs, options.format, decoder, resume_point, options.offset),
+            writer,
+            analyzer,
+            batch_size=options.batch_size,
+            workers=options.workers,
+            prefilter=not options.no_prefilter,
+            progress_interval=options.progress_interval,
+            logger=logger
+        )
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, continue using --resume")
+        sys.exit(130)
+    except (OSError, ValueError) as exception:
+        logger.error("Unable to score: %s", exception)
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
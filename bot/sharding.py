@@ -0,0 +1,250 @@
+"""Pipeline stage sharding channels across worker processes."""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from logging import Logger
+from multiprocessing.connection import Connection
+from threading import Event, Lock, Semaphore, Thread
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from bot.analyzer import Analyzer
+from bot.cache import ScoreCache
+
+
+def _run_shard(connection: Connection, engine: str, lexicon_path: Optional[str], cache_size: int) -> None:
+    """Entrypoint of a worker process, analyzing messages in the order they are received."""
+    analyzer = Analyzer(engine=engine, lexicon_path=lexicon_path)
+    analyzer.load()
+    scores_cache = ScoreCache(analyzer, max_size=cache_size)
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        # None tells the worker to stop
+        if request is None:
+            break
+
+        channel, text = request
+        try:
+            scores: Optional[Dict[str, Any]] = scores_cache.polarity_scores(text)
+        except Exception:  # pylint: disable=broad-except
+            logging.getLogger(__name__).error("Unable to analyze message", exc_info=True)
+            scores = None
+        connection.send((channel, scores))
+
+
+class _Shard:  # pylint: disable=too-few-public-methods
+    """A worker process and the messages sent to it, not yet analyzed."""
+
+    def __init__(self, process: multiprocessing.Process, connection: Connection) -> None:
+        self.process = process
+        self.connection = connection
+        self.in_flight: Deque[Tuple[Hashable, str]] = deque()
+        # Messages not yet resubmitted to a restarted worker, followed by those submitted meanwhile
+        self.backlog: Deque[Optional[Tuple[Hashable, str]]] = deque()
+        self.lock = Lock()
+
+
+class ShardedPipeline:
+    """Analyzes messages in worker processes, each channel always handled by the same worker.
+
+    Each worker analyzes its messages in order, keeping the order within a channel. A worker
+    that exits is restarted, resubmitting the messages it had not yet analyzed.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            analyzer: Analyzer,
+            cache_size: int,
+            on_result: Callable[[Hashable, Dict[str, Any]], None],
+            workers: int = 1,
+            max_pending: int = 0,
+            logger: Optional[Logger] = None
+    ) -> None:
+        self.__engine = analyzer.engine
+        self.__lexicon_path = analyzer.lexicon_path
+        self.__cache_size = cache_size
+        self.__on_result = on_result
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        # Slots for messages in flight, a maximum of zero or less leaves them unbounded
+        self.__slots = Semaphore(max_pending) if max_pending > 0 else None
+
+        self.__restarts = 0
+        self.__shards: List[_Shard] = [self.__start_shard() for _ in range(max(1, workers))]
+
+        # Results of all workers are collected by a single thread
+        self.__should_run = Event()
+        self.__should_run.set()
+        self.__collector = Thread(target=self.__collect, name="shard-collector")
+        self.__collector.daemon = True
+        self.__collector.start()
+
+    @property
+    def workers(self) -> int:
+        """The number of worker processes."""
+        return len(self.__shards)
+
+    @property
+    def restarts(self) -> int:
+        """The number of times a worker process was restarted."""
+        return self.__restarts
+
+    @property
+    def pending(self) -> int:
+        """The number of submitted messages not yet reported."""
+        return sum(len(shard.in_flight) for shard in self.__shards)
+
+    def submit(self, channel: Hashable, text: str) -> None:
+        """Submit a message for analysis by the worker handling the channel.
+
+        Blocks while the maximum number of messages are in flight, holding up the reading of messages.
+        """
+        if self.__slots is not None:
+            self.__slots.acquire()  # pylint: disable=consider-using-with
+
+        shard = self.__shards[hash(channel) % len(self.__shards)]
+        with shard.lock:
+            shard.in_flight.append((channel, text))
+            # Keep the order of the channel behind messages being resubmitted to a restarted worker
+            if shard.backlog:
+                shard.backlog.append((channel, text))
+                return
+            try:
+                shard.connection.send((channel, text))
+            except (BrokenPipeError, OSError):
+                # The worker is restarted by the collector, which resubmits the message
+                self.__logger.debug("Unable to submit message to worker", exc_info=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers, by default waiting for pending analyses to complete."""
+        self.__should_run.clear()
+        for shard in self.__shards:
+            with shard.lock:
+                if shard.backlog:
+                    shard.backlog.append(None)
+                    continue
+                try:
+                    shard.connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        if wait:
+            for shard in self.__shards:
+                shard.process.join()
+        self.__collector.join()
+
+    def __start_shard(self) -> _Shard:
+        """Start a worker process."""
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_run_shard,
+            args=(worker_connection, self.__engine, self.__lexicon_path, self.__cache_size),
+            name="analysis-shard"
+        )
+        process.daemon = True
+        process.start()
+        # Only the worker keeps its end of the pipe open, allowing its exit to be noticed
+        worker_connection.close()
+        return _Shard(process, connection)
+
+    def __restart_shard(self, index: int) -> None:
+        """Replace an exited worker, resubmitting all messages but the one it was analyzing."""
+        shard = self.__shards[index]
+        with shard.lock:
+            shard.process.join()
+            shard.connection.close()
+            self.__logger.error(
+                "Analysis worker exited with code %s, restarting it", shard.process.exitcode
+            )
+
+            # The first message is the one likely to have caused the exit, skip it
+            if shard.in_flight:
+                shard.in_flight.popleft()
+                if self.__slots is not None:
+                    self.__slots.release()
+
+            replacement = self.__start_shard()
+            shard.process = replacement.process
+            shard.connection = replacement.connection
+            shard.backlog = deque(shard.in_flight)
+            self.__restarts += 1
+
+        # Sending may block until the worker's results are collected, so never resubmit from the collector
+        if shard.backlog:
+            feeder = Thread(target=self.__resubmit, args=(shard, shard.connection), name="shard-feeder")
+            feeder.daemon = True
+            feeder.start()
+
+    def __resubmit(self, shard: _Shard, connection: Connection) -> None:
+        """Send the backlog of a restarted worker, one message at a time to let submits queue behind it."""
+        while True:
+            with shard.lock:
+                # The worker exited again and its replacement has a feeder of its own
+                if shard.connection is not connection or not shard.backlog:
+                    return
+                try:
+                    connection.send(shard.backlog[0])
+                except (BrokenPipeError, OSError):
+                    # The worker is restarted by the collector, which resubmits the backlog
+                    self.__logger.debug("Unable to resubmit message to worker", exc_info=True)
+                    return
+                shard.backlog.popleft()
+
+    def __collect(self) -> None:
+        """Collect results from all workers, restarting workers that exit."""
+        while True:
+            connections = {shard.connection: index for index, shard in enumerate(self.__shards)}
+            sentinels = {shard.process.sentinel: index for index, shard in enumerate(self.__shards)}
+            for ready in multiprocessing.connection.wait(list(connections) + list(sentinels), timeout=1):
+                if ready in connections:
+                    index = connections[ready]
+                    try:
+                        channel, scores = ready.recv()  # type: ignore
+                    except (EOFError, OSError):
+                        continue
+                    self.__report(index, channel, scores)
+
+            if not self.__should_run.is_set():
+                if all(not shard.process.is_alive() for shard in self.__shards):
+                    # Report the results still buffered in the pipes of the stopped workers
+                    for index in range(len(self.__shards)):
+                        self.__drain_shard(index)
+                    break
+                continue
+
+            for index, shard in enumerate(self.__shards):
+                if not shard.process.is_alive():
+                    self.__drain_shard(index)
+                    self.__restart_shard(index)
+
+    def __drain_shard(self, index: int) -> None:
+        """Report all results sent by an exited worker."""
+        connection = self.__shards[index].connection
+        try:
+            while connection.poll():
+                channel, scores = connection.recv()
+                self.__report(index, channel, scores)
+        except (EOFError, OSError):
+            pass
+
+    def __report(self, index: int, channel: Hashable, scores: Optional[Dict[str, Any]]) -> None:
+        """Report an analyzed message."""
+        # Not holding the lock, a submit may be blocked waiting for the worker, which may be
+        # waiting for its results to be received. Removing from the deque is atomic
+        in_flight = self.__shards[index].in_flight
+        if in_flight:
+            in_flight.popleft()
+            if self.__slots is not None:
+                self.__slots.release()
+
+        if scores is None:
+            return
+
+        try:
+            self.__on_result(channel, scores)
+        except Exception:  # pylint: disable=broad-except
+            self.__logger.error("Unable to handle analyzed message", exc_info=True)
@@ -0,0 +1,298 @@
+"""Sentiment analysis engine scoring batches of messages using NumPy arrays."""
+
+import math
+from string import punctuation
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+from vaderSentiment.vaderSentiment import BOOSTER_DICT, C_INCR, N_SCALAR, SPECIAL_CASE_IDIOMS
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer, normalize
+
+from bot.lexicon import CompiledLexicon, CompiledSentimentIntensityAnalyzer, compile_lexicon
+from bot.lexicon import flag_booster, flag_lexicon, flag_negation
+
+# Compound scores are identical to VADER's, apart from the order floating point
+# values are summed in. That may change the last rounded decimal
+compound_tolerance = 1e-4
+
+# Words triggering rules for English phrases such as "kind of" or "at least".
+# They are rare in Swedish text, so messages containing them are scored by VADER itself
+fallback_words = frozenset(["no", "least", "but", "kind", "never", "without", "so", "this"])
+
+# Phrases which VADER matches across several words
+fallback_phrases = frozenset(
+    [idiom for idiom in SPECIAL_CASE_IDIOMS if " " in idiom] + [booster for booster in BOOSTER_DICT if " " in booster]
+)
+# Pairs of words starting each phrase, such as ("då", "och")
+fallback_phrase_starts = frozenset(tuple(phrase.split()[:2]) for phrase in fallback_phrases)
+fallback_phrase_second_words = frozenset(second for _, second in fallback_phrase_starts)
+
+
+class VectorizedSentimentIntensityAnalyzer:
+    """A drop-in replacement for VADER's analyzer, scoring using a compiled lexicon."""
+
+    def __init__(
+            self,
+            reference: Optional[SentimentIntensityAnalyzer] = None,
+            lexicon: Optional[CompiledLexicon] = None
+    ) -> None:
+        # The original analyzer scores messages using rare rules. When using a
+        # precompiled lexicon, it is created from that lexicon on first use
+        self.__reference = reference
+        if lexicon is None:
+            if self.__reference is None:
+                self.__reference = SentimentIntensityAnalyzer()
+            lexicon = CompiledLexicon(compile_lexicon(self.__reference))
+        self.__lexicon = lexicon
+
+        # Emojis are replaced by their description, separated by a space
+        self.__emojis = lexicon.emojis()
+        self.__emoji_table = {ord(emoji): " " + description for emoji, description in self.__emojis.items()}
+
+        # The sorted word table and the attributes of each word, read in place
+        self.__words = numpy.frombuffer(
+            lexicon.buffer,
+            dtype="S{}".format(lexicon.word_width),
+            count=lexicon.word_count,
+            offset=lexicon.words_offset
+        )
+        self.__valences = numpy.frombuffer(lexicon.buffer, "<f8", lexicon.word_count, lexicon.valences_offset)
+        self.__boosters = numpy.frombuffer(lexicon.buffer, "<f8", lexicon.word_count, lexicon.boosters_offset)
+        self.__flags = numpy.frombuffer(lexicon.buffer, numpy.uint8, lexicon.word_count, lexicon.flags_offset)
+
+    @property
+    def reference(self) -> SentimentIntensityAnalyzer:
+        """The original analyzer, used for messages relying on rare rules."""
+        if self.__reference is None:
+            # Few messages need the original analyzer, look words up in place rather than decoding the lexicon
+            self.__reference = CompiledSentimentIntensityAnalyzer(self.__lexicon, in_place=True, emojis=self.__emojis)
+        return self.__reference
+
+    @property
+    def lexicon(self) -> Mapping[str, float]:
+        """The lexicon of word valences."""
+        return self.reference.lexicon
+
+    @property
+    def lexicon_words(self) -> FrozenSet[str]:
+        """The words of the lexicon, read from the word table without decoding their valences."""
+        in_lexicon = (self.__flags & flag_lexicon) != 0
+        return frozenset(word.decode() for word in self.__words[in_lexicon].tolist())
+
+    @property
+    def emojis(self) -> Dict[str, str]:
+        """The emojis and their descriptions."""
+        return self.__emojis
+
+    def polarity_scores(self, text: str) -> Dict[str, Any]:
+        """Analyze a text."""
+        return self.polarity_scores_batch([text])[0]
+
+    def polarity_scores_batch(self, texts: Sequence[str]) -> List[Dict[str, Any]]:  # pylint: disable=too-many-locals
+        """Analyze a batch of texts."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+
+        # Tokenize all messages into one flat list of words
+        prepared_texts: List[str] = []
+        indices: List[int] = []
+        words: List[List[str]] = []
+        lowercase_words: List[str] = []
+        uppercase: List[bool] = []
+        for index, text in enumerate(texts):
+            prepared_text, message_words, message_lowercase_words, fallback = self.__tokenize(text)
+            if fallback:
+                results[index] = self.reference.polarity_scores(text)
+                continue
+            prepared_texts.append(prepared_text)
+            indices.append(index)
+            words.append(message_words)
+            lowercase_words.extend(message_lowercase_words)
+            uppercase.extend(word.isupper() for word in message_words)
+
+        lengths = numpy.fromiter((len(message_words) for message_words in words), dtype=numpy.intp, count=len(words))
+        valences, boosters, flags = self.__lookup(lowercase_words)
+        sentiments, scored = self.__sentiments(valences, boosters, flags, numpy.array(uppercase, dtype=bool), lengths)
+        is_booster = (flags & flag_booster) != 0
+
+        # The final scores are summed in the same order as VADER, so that the
+        # sign of a score close to zero is never changed by rounding errors
+        sentiment_values = sentiments.tolist()
+        positive_values = numpy.where(sentiments > 0, sentiments + 1, 0.0).tolist()
+        negative_values = numpy.where(sentiments < 0, sentiments - 1, 0.0).tolist()
+        neutral_values = (sentiments == 0).tolist()
+        debug_values = [
+            (value if word_is_scored else 0, word_is_booster)
+            for value, word_is_scored, word_is_booster in zip(sentiment_values, scored.tolist(), is_booster.tolist())
+        ]
+
+        start = 0
+        for message, index in enumerate(indices):
+            end = start + len(words[message])
+            scores = self.__score(
+                prepared_texts[message],
+                sum(sentiment_values[start:end]),
+                sum(positive_values[start:end]),
+                sum(negative_values[start:end]),
+                sum(neutral_values[start:end]),
+                end - start
+            )
+            scores["debug"] = [
+                (word, value)
+                for word, (value, word_is_booster) in zip(words[message], debug_values[start:end])
+                if not word_is_booster
+            ]
+            results[index] = scores
+            start = end
+
+        return results  # type: ignore
+
+    def __tokenize(self, text: str) -> Tuple[str, List[str], List[str], bool]:
+        """Split a text into words. Returns whether or not VADER must score the text."""
+        # All emojis are non-ASCII, skip the translation for plain text
+        prepared_text = text.strip() if text.isascii() else text.translate(self.__emoji_table).strip()
+
+        words = []
+        lowercase_words = []
+        fallback = False
+        may_contain_phrase = False
+        previous = ""
+        for word in prepared_text.split():
+            # Strip punctuation, keeping emoticons such as ":)" intact
+            stripped = word.strip(punctuation)
+            if len(stripped) > 2:
+                word = stripped
+            words.append(word)
+
+            lowercase = word.lower()
+            lowercase_words.append(lowercase)
+            if lowercase in fallback_words:
+                fallback = True
+            elif lowercase in fallback_phrase_second_words and (previous, lowercase) in fallback_phrase_starts:
+                may_contain_phrase = True
+            previous = lowercase
+
+        if not fallback and may_contain_phrase:
+            joined = " {} ".format(" ".join(lowercase_words))
+            fallback = any(" {} ".format(phrase) in joined for phrase in fallback_phrases)
+
+        return prepared_text, words, lowercase_words, fallback
+
+    def __lookup(self, lowercase_words: List[str]) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Look up the valence, booster value and flags of each word in the sorted word table."""
+        if len(lowercase_words) == 0:
+            return numpy.zeros(0, dtype=numpy.float64), numpy.zeros(0, dtype=numpy.float64), numpy.zeros(0, numpy.uint8)
+
+        # Words wider than the table can never be found, replace them to avoid
+        # them being truncated to a word which is in the table
+        width = self.__words.dtype.itemsize
+        encoded_words = [word.encode() for word in lowercase_words]
+        keys = numpy.array([word if len(word) <= width else b"" for word in encoded_words], dtype=self.__words.dtype)
+
+        positions = numpy.minimum(numpy.searchsorted(self.__words, keys), len(self.__words) - 1)
+        found = (self.__words[positions] == keys) & (keys != b"")
+
+        valences = numpy.where(found, self.__valences[positions], 0.0)
+        boosters = numpy.where(found, self.__boosters[positions], 0.0)
+        flags = numpy.where(found, self.__flags[positions], 0).astype(numpy.uint8)
+
+        # Any word containing "n't" negates, even if not in the table
+        for index, word in enumerate(lowercase_words):
+            if "n't" in word:
+                flags[index] |= flag_negation
+
+        return valences, boosters, flags
+
+    def __sentiments(  # pylint: disable=too-many-arguments,too-many-locals
+            self,
+            word_valences: numpy.ndarray,
+            word_boosters: numpy.ndarray,
+            flags: numpy.ndarray,
+            uppercase: numpy.ndarray,
+            lengths: numpy.ndarray
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Calculate the sentiment of each word using VADER's booster, negation and capitalization rules.
+
+        Returns the sentiments and whether or not each word is a scored lexicon word.
+        """
+        count = len(word_valences)
+        if count == 0:
+            return numpy.zeros(0, dtype=numpy.float64), numpy.zeros(0, dtype=bool)
+
+        in_lexicon = (flags & flag_lexicon) != 0
+        is_booster = (flags & flag_booster) != 0
+        is_negation = (flags & flag_negation) != 0
+
+        # The position of each word within its message
+        starts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(count) - numpy.repeat(starts, lengths)
+
+        # Whether or not some, but not all, words of each word's message are in ALL CAPS
+        non_empty = lengths > 0
+        uppercase_counts = numpy.repeat(
+            numpy.add.reduceat(uppercase.astype(numpy.intp), starts[non_empty]),
+            lengths[non_empty]
+        )
+        message_lengths = numpy.repeat(lengths, lengths)
+        differential = message_lengths - uppercase_counts
+        is_cap_diff = (differential > 0) & (differential < message_lengths)
+
+        # Only lexicon words which are not boosters carry a sentiment
+        scored = in_lexicon & ~is_booster
+        valences = word_valences.copy()
+
+        # Emphasize words in ALL CAPS
+        emphasized = scored & uppercase & is_cap_diff
+        valences[emphasized] += numpy.where(valences[emphasized] > 0, C_INCR, -C_INCR)
+
+        # Apply boosters and negations of the three preceding words, nearest first
+        for distance, dampening in ((1, 1.0), (2, 0.95), (3, 0.9)):
+            previous = numpy.maximum(numpy.arange(count) - distance, 0)
+            applies = scored & (positions >= distance) & ~in_lexicon[previous]
+
+            scalars = numpy.where(valences < 0, -word_boosters[previous], word_boosters[previous])
+            emphasized = is_booster[previous] & uppercase[previous] & is_cap_diff
+            scalars = numpy.where(emphasized, numpy.where(valences > 0, scalars + C_INCR, scalars - C_INCR), scalars)
+            valences = numpy.where(applies, valences + scalars * dampening, valences)
+
+            negated = applies & is_negation[previous]
+            valences = numpy.where(negated, valences * N_SCALAR, valences)
+
+        return numpy.where(scored, valences, 0.0), scored
+
+    @staticmethod
+    def __score(  # pylint: disable=too-many-arguments
+            text: str,
+            sum_s: float,
+            pos_sum: float,
+            neg_sum: float,
+            neu_count: int,
+            length: int
+    ) -> Dict[str, Any]:
+        """Calculate the final scores of a message, the same way as VADER."""
+        if length == 0:
+            return {"neg": 0.0, "neu": 0.0, "pos": 0.0, "compound": 0.0}
+
+        # Emphasis from exclamation points (up to four) and question marks (two or more)
+        question_marks = text.count("?")
+        punct_emph_amplifier = min(text.count("!"), 4) * 0.292
+        if question_marks > 1:
+            punct_emph_amplifier += question_marks * 0.18 if question_marks <= 3 else 0.96
+
+        if sum_s > 0:
+            sum_s += punct_emph_amplifier
+        elif sum_s < 0:
+            sum_s -= punct_emph_amplifier
+        compound = normalize(sum_s)
+
+        if pos_sum > math.fabs(neg_sum):
+            pos_sum += punct_emph_amplifier
+        elif pos_sum < math.fabs(neg_sum):
+            neg_sum -= punct_emph_amplifier
+
+        total = pos_sum + math.fabs(neg_sum) + neu_count
+        return {
+            "neg": round(math.fabs(neg_sum / total), 3),
+            "neu": round(math.fabs(neu_count / total), 3),
+            "pos": round(math.fabs(pos_sum / total), 3),
+            "compound": round(compound, 4)
+        }
@@ -7,3 +7,10 @@ __package__ = "irc"
 # pylint: disable=useless-import-alias
 
 from irc.irc import IRC as IRC  # noqa: F401
+from irc.async_irc import AsyncIRC as AsyncIRC  # noqa: F401
+from irc.flood import EgressPriority as EgressPriority  # noqa: F401
+from irc.ingress import OverflowPolicy as OverflowPolicy  # noqa: F401
+from irc.manager import IRCManager as IRCManager  # noqa: F401
+from irc.manager import IRCNetwork as IRCNetwork  # noqa: F401
+from irc.metrics import Metrics as Metrics  # noqa: F401
+from irc.metrics import MetricsServer as MetricsServer  # noqa: F401
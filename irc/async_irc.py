@@ -0,0 +1,406 @@
+"""IRC connector running on an asyncio event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from asyncio import StreamReader, StreamWriter, Task
+from logging import Logger
+from ssl import SSLError, create_default_context
+from time import monotonic, perf_counter
+from typing import AsyncGenerator, List, Optional, Sequence, Set
+
+from irc.backoff import Backoff, default_max_wait
+from irc.connector import Connector
+from irc.decoding import LineDecoder, default_encodings
+from irc.encoding import MessageEncoder
+from irc.exception import IRCConnectionException, IRCException, IRCSocketException
+from irc.flood import EgressPriority, EgressScheduler, default_burst, default_max_queued_reactions, default_rate
+from irc.framing import LineBuffer
+from irc.irc import default_max_write_size, default_timeout, join_lines, version
+from irc.messages import IRCBaseMessage, IRCControlMessage, IRCControlMessageType, IRCJoinMessage, IRCNickMessage, IRCPingMessage, parse_message
+from irc.metrics import ConnectionMetrics, Metrics
+from irc.socket import receive_buffer_size
+
+
+class AsyncIRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
+    """IRC connector, handling all I/O as tasks on the running event loop."""
+
+    def __init__(
+            self,
+            server: str,
+            port: int,
+            user: str,
+            nick: str,
+            gecos: str = "",
+            timeout: float = default_timeout,
+            use_tls: bool = False,
+            logger: Optional[Logger] = None,
+            max_write_size: int = default_max_write_size,
+            rate: float = default_rate,
+            burst: float = default_burst,
+            max_queued_reactions: int = default_max_queued_reactions,
+            metrics: Optional[Metrics] = None,
+            encodings: Sequence[str] = default_encodings,
+            max_reconnect_wait: float = default_max_wait
+    ) -> None:
+        self.__server = server
+        self.__port = port
+        self.__timeout = timeout
+        self.__use_tls = use_tls
+        # A single TLS context is kept for all connections. Streams cannot offer a session to resume
+        self.__tls_context = create_default_context() if use_tls else None
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+        self.__user = user
+        self.__nick = nick
+        self.__gecos = gecos
+        # Encodes messages into lines fitting within the limit of IRC as relayed by the server
+        self.__encoder = MessageEncoder(nick, user)
+
+        self.__channels: Set[str] = set()
+        # Channels not yet rejoined after reconnecting, in lowercase, and when the connection was lost
+        self.__rejoining: Set[str] = set()
+        self.__disconnected_at = 0.0
+        # Waits between attempts to reconnect
+        self.__backoff = Backoff(max_wait=max_reconnect_wait)
+        # Races the addresses of the server, remembering addresses which failed
+        self.__connector = Connector(logger=self.__logger)
+
+        # Buffer of received bytes, carrying partial lines over to the next read
+        self.__line_buffer = LineBuffer()
+        # Decoder of received lines, trying each encoding in order
+        self.__decoder = LineDecoder(encodings)
+
+        self.__reader: Optional[StreamReader] = None
+        self.__writer: Optional[StreamWriter] = None
+        # Set while there is a connection to write to
+        self.__is_connected = asyncio.Event()
+
+        self.__ingress_task: Optional[Task] = None
+        self.__egress_task: Optional[Task] = None
+        self.__reconnect_task: Optional[Task] = None
+
+        # Queue of parsed messages received from the server
+        self.__ingress_messages: asyncio.Queue[IRCBaseMessage] = asyncio.Queue()
+        # Lines to send to the server, released in priority order at the allowed rate
+        self.__egress_scheduler = EgressScheduler(rate, burst, max_queued_reactions)
+        # Set when lines are queued
+        self.__egress_queued = asyncio.Event()
+        self.__max_write_size = max_write_size
+        self.__egress_writes = 0
+        self.__egress_lines = 0
+        self.__egress_bytes = 0
+
+        # Metrics are only recorded if enabled, leaving a single check in the hot paths otherwise
+        self.__metrics: Optional[ConnectionMetrics] = None
+        if metrics is not None:
+            self.__metrics = ConnectionMetrics(metrics, "{}:{}".format(server, port))
+            self.__metrics.track_queue_depth("ingress", self.__ingress_messages.qsize)
+            self.__metrics.track_queue_depth("egress", lambda: self.__egress_scheduler.depth)
+
+    @property
+    async def messages(self) -> AsyncGenerator[IRCBaseMessage, None]:
+        """An asynchronous generator containing all received messages as they come."""
+        while True:
+            message = await self.__ingress_messages.get()
+            self.__ingress_messages.task_done()
+            yield message
+
+    @property
+    def decoder(self) -> LineDecoder:
+        """The decoder of received lines, counting lines not valid UTF-8."""
+        return self.__decoder
+
+    @property
+    def egress_scheduler(self) -> EgressScheduler:
+        """The scheduler of outgoing lines, exposing queue depths and wait times."""
+        return self.__egress_scheduler
+
+    @property
+    def egress_writes(self) -> int:
+        """The number of writes of queued messages."""
+        return self.__egress_writes
+
+    @property
+    def egress_lines(self) -> int:
+        """The number of lines written."""
+        return self.__egress_lines
+
+    @property
+    def egress_bytes(self) -> int:
+        """The number of bytes written."""
+        return self.__egress_bytes
+
+    @property
+    def egress_bytes_per_write(self) -> float:
+        """The average number of bytes per write."""
+        return self.__egress_bytes / self.__egress_writes if self.__egress_writes > 0 else 0
+
+    @property
+    def version(self) -> str:
+        """The version of the IRC library."""
+        return version
+
+    async def __open(self) -> None:
+        """Open a connection to the server, performing the TLS handshake on the event loop."""
+        self.__logger.debug("Opening connection to %s:%s", self.__server, self.__port)
+        # Race the addresses of the server, including the TLS handshake
+        self.__reader, self.__writer = await self.__connector.open_connection(
+            self.__server,
+            self.__port,
+            self.__timeout,
+            self.__tls_context
+        )
+
+        self.__backoff.connected()
+        if self.__metrics is not None and self.__use_tls:
+            self.__metrics.tls_full_handshakes.inc()
+        self.__logger.debug("Connected")
+
+    async def __close(self) -> None:
+        """Close the current connection, if any."""
+        self.__is_connected.clear()
+        writer = self.__writer
+        self.__reader = None
+        self.__writer = None
+        if writer is None:
+            return
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, SSLError):
+            self.__logger.debug("Error while closing connection", exc_info=True)
+
+    async def connect(self) -> None:
+        """Connect to the server."""
+        if self.__ingress_task is not None or self.__egress_task is not None:
+            raise IRCConnectionException("Already connected")
+
+        self.__logger.info("Connecting to server")
+        await self.__open()
+
+        self.__logger.info("Connected to server")
+
+        self.login()
+        self.__is_connected.set()
+
+        self.__logger.info("Starting ingress and egress tasks")
+        self.__ingress_task = asyncio.create_task(self.__handle_ingress_messages())
+        self.__egress_task = asyncio.create_task(self.__handle_egress_messages())
+
+    def login(self) -> None:
+        """Login to the server."""
+        self.__logger.info("Logging in")
+        self.send("User {0} {0} {0} :{1}\r\n".format(self.__user, self.__gecos), EgressPriority.CONNECTION)
+        self.send("NICK {0}\r\n".format(self.__nick), EgressPriority.CONNECTION)
+
+    def reconnect(self) -> Task:
+        """Reconnect to the server in a task. Returns the task, which may be awaited."""
+        if self.__ingress_task is None or self.__egress_task is None:
+            raise IRCConnectionException("Not connected")
+
+        # Only ever reconnect once at a time
+        if self.__reconnect_task is None or self.__reconnect_task.done():
+            self.__reconnect_task = asyncio.create_task(self.__reconnect())
+        return self.__reconnect_task
+
+    async def __reconnect(self) -> None:
+        """Reconnect to the server, may continue indefinetely."""
+        await self.__close()
+        self.__disconnected_at = monotonic()
+        self.__backoff.disconnected(self.__disconnected_at)
+
+        while True:
+            wait = self.__backoff.next_wait()
+            if wait > 0:
+                self.__logger.info("Trying to reconnect in %.1fs", wait)
+                await asyncio.sleep(wait)
+            try:
+                self.__logger.info("Attempting to reconnect")
+                await self.__open()
+            except IRCSocketException:
+                self.__logger.error("Unable to reconnect", exc_info=True)
+                continue
+            break
+
+        self.__logger.info("Reconnected to server")
+        if self.__metrics is not None:
+            self.__metrics.reconnects.inc()
+            self.__metrics.reconnect_seconds.observe(monotonic() - self.__disconnected_at)
+
+        # Any partial line belonged to the previous connection
+        self.__line_buffer.clear()
+
+        # Send the login and all joins at once, without waiting for replies
+        self.login()
+        self.__rejoining = {channel.lower() for channel in self.__channels}
+        for line in join_lines(self.__channels):
+            self.send(line, EgressPriority.CONNECTION)
+        self.__is_connected.set()
+
+    def __track_nick(self, message: IRCBaseMessage) -> None:
+        """Track the nick of the bot as assigned when registering or changed later, for the prefix of relayed lines."""
+        if isinstance(message, IRCNickMessage):
+            if message.nick.lower() == self.__encoder.nick.lower():
+                self.__encoder.nick = message.new_nick
+        elif isinstance(message, IRCControlMessage) and message.message_type == IRCControlMessageType.RPL_WELCOME:
+            self.__encoder.nick = message.target
+
+    def __joined(self, message: IRCJoinMessage) -> None:
+        """Learn the relayed hostname of the bot from its joins, recording channels rejoined after reconnecting."""
+        if message.nick.lower() != self.__encoder.nick.lower():
+            return
+
+        self.__encoder.learn_hostname(message.hostname)
+        if not self.__rejoining:
+            return
+
+        self.__rejoining.discard(message.channel.lower())
+        if not self.__rejoining:
+            elapsed = monotonic() - self.__disconnected_at
+            self.__logger.info("Rejoined all channels %.2fs after losing the connection", elapsed)
+            if self.__metrics is not None:
+                self.__metrics.rejoin_seconds.observe(elapsed)
+
+    async def disconnect(self) -> None:
+        """Disconnect from the server."""
+        self.__logger.info("Disconnecting from server")
+
+        self.__logger.debug("Cancelling the message tasks")
+        tasks = [task for task in (self.__ingress_task, self.__egress_task, self.__reconnect_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__ingress_task = None
+        self.__egress_task = None
+        self.__reconnect_task = None
+
+        await self.__close()
+
+    def send(
+            self,
+            message: str,
+            priority: EgressPriority = EgressPriority.COMMAND,
+            key: Optional[str] = None
+    ) -> None:
+        """Send a raw message to the server. Reactions with the same key may be coalesced. Must be called from the event loop's thread."""
+        line = message.encode()
+        if len(line) > 512:
+            raise IRCException("Message is too long. Cannot be longer than 512 bytes - was {}".format(len(line)))
+        self.__queue([line], priority, key)
+
+    def __queue(self, lines: List[bytes], priority: EgressPriority, key: Optional[str]) -> None:
+        """Queue encoded lines to be sent."""
+        for line in lines:
+            self.__egress_scheduler.put(line, priority, key)
+        self.__egress_queued.set()
+
+    def send_message(self, target: str, message: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a message, split into as many lines as needed."""
+        self.__logger.debug("Sending message to %s", target)
+        self.__queue(self.__encoder.encode("PRIVMSG", target, message), priority, target)
+
+    def send_notice(self, target: str, notice: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a notice, split into as many lines as needed."""
+        self.__logger.debug("Sending notice to %s", target)
+        self.__queue(self.__encoder.encode("NOTICE", target, notice), priority, target)
+
+    def join(self, channel: str, ignore_duplicate: bool = False) -> None:
+        """Join a channel."""
+        if not ignore_duplicate and channel in self.__channels:
+            raise IRCException("Already part of that channel")
+
+        self.__logger.info("Joining channel %s", channel)
+        self.send("JOIN {}\r\n".format(channel), EgressPriority.CONNECTION)
+        self.__channels.add(channel)
+
+    async def __handle_ingress_messages(self) -> None:
+        """Ingress task of the IRC client."""
+        metrics = self.__metrics
+        decoder = self.__decoder
+        while True:
+            if self.__reader is None:
+                await self.reconnect()
+                continue
+
+            try:
+                data = await asyncio.wait_for(self.__reader.read(receive_buffer_size), self.__timeout)
+            except asyncio.TimeoutError:
+                self.__logger.debug("Timeout while reading data - reconnecting")
+                await self.reconnect()
+                continue
+            except (OSError, SSLError):
+                self.__logger.info("Lost connection to server, reconnecting", exc_info=True)
+                await self.reconnect()
+                continue
+
+            if not data:
+                self.__logger.info("Socket has closed, reconnecting")
+                await self.reconnect()
+                continue
+
+            if metrics is not None:
+                metrics.read_bytes.inc(len(data))
+
+            self.__line_buffer.feed(data)
+            for raw_line in self.__line_buffer.lines():
+                # Tolerate clients using other encodings than UTF-8, bad input must not stop the ingress
+                line = decoder.decode(raw_line)
+
+                # Tokenize the line once and dispatch it to the parser of its command
+                if metrics is None:
+                    message = parse_message(line)
+                else:
+                    started = perf_counter()
+                    message = parse_message(line)
+                    metrics.parse_seconds(type(message)).observe(perf_counter() - started)
+                    metrics.read_lines.inc()
+
+                if message is None:
+                    self.__logger.debug("Unhandled message: <%s>", line)
+                elif isinstance(message, IRCPingMessage):
+                    # Handle pinging internally - don't expose it as a message
+                    self.__logger.debug("Got PING, responding with PONG")
+                    self.send("PONG :{}\r\n".format(message.token), EgressPriority.CONNECTION)
+                else:
+                    if isinstance(message, IRCJoinMessage):
+                        self.__joined(message)
+                    elif isinstance(message, (IRCNickMessage, IRCControlMessage)):
+                        self.__track_nick(message)
+                    self.__ingress_messages.put_nowait(message)
+                    self.__logger.debug("Parsed message and added it to the queue")
+
+    async def __handle_egress_messages(self) -> None:
+        """Egress task of the IRC client."""
+        while True:
+            # Wait for lines to be allowed, then take all allowed lines in a single write
+            batch, wait = self.__egress_scheduler.take(self.__max_write_size)
+            if not batch:
+                self.__egress_queued.clear()
+                try:
+                    await asyncio.wait_for(self.__egress_queued.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Hold lines while reconnecting, writing them after the login and joins of the new connection
+            writer = None
+            while writer is None:
+                if not self.__is_connected.is_set():
+                    await self.__is_connected.wait()
+                    registration, _ = self.__egress_scheduler.take(self.__max_write_size, EgressPriority.CONNECTION)
+                    batch = registration + batch
+                writer = self.__writer
+            try:
+                data = b"".join(batch)
+                started = perf_counter()
+                writer.write(data)
+                await writer.drain()
+                if self.__metrics is not None:
+                    self.__metrics.egress_write_seconds.observe(perf_counter() - started)
+                self.__egress_writes += 1
+                self.__egress_lines += len(batch)
+                self.__egress_bytes += len(data)
+            except (OSError, SSLError):
+                self.__logger.error("Unable to send message", exc_info=True)
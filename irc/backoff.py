@@ -0,0 +1,84 @@
+"""Capped exponential backoff with jitter, for reconnecting."""
+
+import random
+from time import monotonic
+from typing import Optional
+
+# The number of seconds waited after the first failed attempt, doubled for each failed attempt after it
+default_initial_wait = 1.0
+
+# The longest wait between attempts, in seconds
+default_max_wait = 300.0
+
+# The share of each wait which is randomized
+default_jitter = 0.5
+
+# The number of seconds a connection must last before the backoff is reset
+default_stable_after = 60.0
+
+
+class Backoff:
+    """Waits between attempts to reconnect, doubling up to a cap, randomized by jitter.
+
+    The first attempt is immediate. Attempts are only reset once a connection has lasted, so a server
+    accepting connections only to drop them is not hammered. The jitter keeps clients disconnected at
+    the same time from reconnecting in lockstep.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            initial_wait: float = default_initial_wait,
+            max_wait: float = default_max_wait,
+            jitter: float = default_jitter,
+            stable_after: float = default_stable_after,
+            generator: Optional[random.Random] = None
+    ) -> None:
+        if initial_wait <= 0 or max_wait < initial_wait:
+            raise ValueError("The initial wait must be positive and no longer than the maximum wait")
+        if not 0 <= jitter <= 1:
+            raise ValueError("The jitter must be between 0 and 1")
+
+        self.__initial_wait = initial_wait
+        self.__max_wait = max_wait
+        self.__jitter = jitter
+        self.__stable_after = stable_after
+        self.__generator = random.Random() if generator is None else generator
+
+        self.__attempts = 0
+        self.__connected_at: Optional[float] = None
+
+    @property
+    def attempts(self) -> int:
+        """The number of attempts since the backoff was last reset."""
+        return self.__attempts
+
+    @property
+    def max_wait(self) -> float:
+        """The longest wait between attempts, in seconds."""
+        return self.__max_wait
+
+    def next_wait(self) -> float:
+        """The number of seconds to wait before the next attempt."""
+        attempts = self.__attempts
+        self.__attempts += 1
+        if attempts == 0:
+            return 0.0
+
+        # Limit the exponent, the cap is reached long before
+        wait = min(self.__max_wait, self.__initial_wait * 2 ** min(attempts - 1, 64))
+        return wait * (1 - self.__jitter * self.__generator.random())
+
+    def connected(self, now: Optional[float] = None) -> None:
+        """Mark an attempt as successful."""
+        self.__connected_at = monotonic() if now is None else now
+
+    def disconnected(self, now: Optional[float] = None) -> None:
+        """Mark a connection as lost, resetting the attempts if it was stable."""
+        now = monotonic() if now is None else now
+        if self.__connected_at is not None and now - self.__connected_at >= self.__stable_after:
+            self.reset()
+        self.__connected_at = None
+
+    def reset(self) -> None:
+        """Make the next attempt immediate again."""
+        self.__attempts = 0
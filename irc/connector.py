@@ -0,0 +1,446 @@
+"""Connection establishment racing the resolved addresses of a server, in the style of happy eyeballs (RFC 8305)."""
+
+import asyncio
+import errno
+import logging
+import selectors
+import socket
+from collections import deque
+from logging import Logger
+from ssl import SSLContext, SSLError, SSLSocket, SSLWantReadError, SSLWantWriteError
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from irc.exception import IRCSocketException
+
+# The number of seconds to wait for an attempt before racing it with the next address, as recommended by RFC 8305
+default_attempt_delay = 0.25
+
+# The number of seconds resolved addresses are reused
+default_resolution_ttl = 300.0
+
+# The number of seconds an address is skipped after failing, doubled for each consecutive failure
+default_failure_penalty = 30.0
+
+# The longest number of seconds an address is skipped
+default_max_penalty = 600.0
+
+# Resolves a server and port the way socket.getaddrinfo does
+Resolver = Callable[[str, int], List[Tuple[Any, ...]]]
+
+
+class Address(NamedTuple):
+    """A resolved address of a server."""
+
+    family: int
+    protocol: int
+    address: Tuple[Any, ...]
+
+    def __str__(self) -> str:
+        return "[{}]:{}".format(*self.address[:2]) if self.family == socket.AF_INET6 else "{}:{}".format(*self.address[:2])
+
+
+class AddressStats:  # pylint: disable=too-few-public-methods
+    """The outcomes of connecting to an address."""
+
+    __slots__ = ("attempts", "failures", "consecutive_failures", "skipped_until")
+
+    def __init__(self) -> None:
+        self.attempts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.skipped_until = 0.0
+
+
+def resolve(server: str, port: int) -> List[Tuple[Any, ...]]:
+    """Resolve the addresses of a server, the default resolver."""
+    return socket.getaddrinfo(server, port, type=socket.SOCK_STREAM)
+
+
+def interleave(addresses: List[Address]) -> List[Address]:
+    """Alternate address families, starting with the family of the first, preferred, address."""
+    if len(addresses) < 2:
+        return list(addresses)
+
+    preferred = [address for address in addresses if address.family == addresses[0].family]
+    others = [address for address in addresses if address.family != addresses[0].family]
+    interleaved = []
+    for index in range(max(len(preferred), len(others))):
+        interleaved.extend(family[index] for family in (preferred, others) if index < len(family))
+    return interleaved
+
+
+class _Attempt:  # pylint: disable=too-few-public-methods
+    """An attempt to connect to an address."""
+
+    __slots__ = ("address", "socket", "started", "handshaking")
+
+    def __init__(self, address: Address, raw_socket: socket.socket, started: float) -> None:
+        self.address = address
+        self.socket = raw_socket
+        self.started = started
+        self.handshaking = False
+
+
+class Connector:  # pylint: disable=too-many-instance-attributes
+    """Connects to a server by racing its resolved addresses with staggered attempts, the first to connect winning.
+
+    Resolved addresses are cached for a while. Addresses which fail are skipped for a while, only being
+    tried once all other addresses have failed. A connector is meant to be used by a single connection.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            attempt_delay: float = default_attempt_delay,
+            resolution_ttl: float = default_resolution_ttl,
+            failure_penalty: float = default_failure_penalty,
+            max_penalty: float = default_max_penalty,
+            resolver: Resolver = resolve,
+            logger: Optional[Logger] = None
+    ) -> None:
+        self.__attempt_delay = attempt_delay
+        self.__resolution_ttl = resolution_ttl
+        self.__failure_penalty = failure_penalty
+        self.__max_penalty = max_penalty
+        self.__resolver = resolver
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        # Resolved addresses and when they expire, per server and port
+        self.__resolved: Dict[Tuple[str, int], Tuple[float, List[Address]]] = {}
+        self.__stats: Dict[Address, AddressStats] = {}
+
+    @property
+    def stats(self) -> Dict[Address, AddressStats]:
+        """The outcomes of connecting to each address attempted."""
+        return dict(self.__stats)
+
+    def forget(self, server: str, port: int) -> None:
+        """Forget the resolved addresses of a server, resolving it again on the next connect."""
+        self.__resolved.pop((server, port), None)
+
+    def resolve(self, server: str, port: int) -> List[Address]:
+        """Resolve the addresses of a server, using cached addresses if not expired."""
+        addresses = self.__cached(server, port)
+        if addresses is None:
+            try:
+                addresses = self.__cache(server, port, self.__resolver(server, port))
+            except socket.gaierror as exception:
+                raise IRCSocketException("No such server") from exception
+        return addresses
+
+    async def resolve_async(self, server: str, port: int) -> List[Address]:
+        """Resolve the addresses of a server on the event loop, using cached addresses if not expired."""
+        addresses = self.__cached(server, port)
+        if addresses is None:
+            loop = asyncio.get_running_loop()
+            try:
+                # Custom resolvers are blocking, run them in the default executor
+                if self.__resolver is resolve:
+                    resolved = await loop.getaddrinfo(server, port, type=socket.SOCK_STREAM)
+                else:
+                    resolved = await loop.run_in_executor(None, self.__resolver, server, port)
+            except socket.gaierror as exception:
+                raise IRCSocketException("No such server") from exception
+            addresses = self.__cache(server, port, resolved)
+        return addresses
+
+    def candidates(self, server: str, port: int, now: Optional[float] = None) -> Tuple[List[Address], List[Address]]:
+        """The addresses to attempt in order, and the addresses skipped since they recently failed."""
+        now = monotonic() if now is None else now
+        addresses = interleave(self.resolve(server, port))
+        return self.__partition(addresses, now)
+
+    def connect(
+            self,
+            server: str,
+            port: int,
+            timeout: float,
+            wrap: Optional[Callable[[socket.socket], SSLSocket]] = None
+    ) -> socket.socket:
+        """Connect to a server, returning the non-blocking socket of the first attempt to connect.
+
+        With wrap, attempts are wrapped for TLS once connected and the first to complete its handshake wins.
+        """
+        started = monotonic()
+        deadline = started + timeout
+        attempting, skipped = self.candidates(server, port, started)
+        pending: Deque[Address] = deque(attempting)
+        fallback: Deque[Address] = deque(skipped)
+
+        selector = selectors.DefaultSelector()
+        attempts: Dict[int, _Attempt] = {}
+        winner: Optional[_Attempt] = None
+        last_error: Optional[BaseException] = None
+        next_attempt_at = started
+        try:
+            while winner is None:
+                now = monotonic()
+                if now >= deadline:
+                    raise IRCSocketException("Connection timed out") from last_error
+
+                # Skipped addresses are only attempted once all other attempts have failed
+                if not pending and not attempts:
+                    pending, fallback = fallback, pending
+
+                # Start the next attempt when due, or right away if no attempt is in flight or one has failed
+                if pending and (now >= next_attempt_at or not attempts):
+                    address = pending.popleft()
+                    try:
+                        attempt = self.__start(address, now)
+                        selector.register(attempt.socket, selectors.EVENT_WRITE, attempt)
+                        attempts[attempt.socket.fileno()] = attempt
+                        next_attempt_at = now + self.__attempt_delay
+                    except OSError as exception:
+                        last_error = exception
+                        self.__failed(address, exception, now)
+                    continue
+
+                if not attempts:
+                    raise self.__exception(last_error)
+
+                wait = deadline - now
+                if pending:
+                    wait = min(wait, next_attempt_at - now)
+                for key, _ in selector.select(max(wait, 0)):
+                    attempt = key.data
+                    try:
+                        if self.__advance(attempt, selector, wrap, server):
+                            winner = attempt
+                            break
+                    except (OSError, SSLError) as exception:
+                        last_error = exception
+                        if key.fd in selector.get_map():
+                            selector.unregister(key.fd)
+                        del attempts[key.fd]
+                        attempt.socket.close()
+                        next_attempt_at = monotonic()
+                        self.__failed(attempt.address, exception, next_attempt_at)
+        finally:
+            self.__settle(attempts.values(), winner, monotonic())
+            selector.close()
+            if winner is None:
+                # The addresses may have changed, resolve them again on the next connect
+                self.forget(server, port)
+
+        self.__succeeded(winner.address, monotonic() - started)
+        return winner.socket
+
+    async def open_connection(
+            self,
+            server: str,
+            port: int,
+            timeout: float,
+            tls_context: Optional[SSLContext] = None
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open streams to a server, returning those of the first attempt to connect and complete any TLS handshake."""
+        loop = asyncio.get_running_loop()
+        started = monotonic()
+        deadline = started + timeout
+        attempting, skipped = self.__partition(interleave(await self.resolve_async(server, port)), started)
+        pending: Deque[Address] = deque(attempting)
+        fallback: Deque[Address] = deque(skipped)
+
+        async def attempt(address: Address) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+            raw_socket = socket.socket(address.family, socket.SOCK_STREAM, address.protocol)
+            try:
+                raw_socket.setblocking(False)
+                await loop.sock_connect(raw_socket, address.address)
+                return await asyncio.open_connection(
+                    sock=raw_socket,
+                    ssl=tls_context,
+                    server_hostname=server if tls_context is not None else None
+                )
+            except BaseException:
+                raw_socket.close()
+                raise
+
+        # The address and start of each attempt in flight
+        tasks: Dict[asyncio.Task, Tuple[Address, float]] = {}
+        winner: Optional[asyncio.Task] = None
+        winner_address: Optional[Tuple[Address, float]] = None
+        last_error: Optional[BaseException] = None
+        next_attempt_at = started
+        try:
+            while winner is None:
+                now = monotonic()
+                if now >= deadline:
+                    raise IRCSocketException("Connection timed out") from last_error
+
+                if not pending and not tasks:
+                    pending, fallback = fallback, pending
+
+                # Start the next attempt when due, or right away if no attempt is in flight or one has failed
+                if pending and (now >= next_attempt_at or not tasks):
+                    address = pending.popleft()
+                    self.__stats.setdefault(address, AddressStats()).attempts += 1
+                    self.__logger.debug("Attempting to connect to %s", address)
+                    tasks[asyncio.create_task(attempt(address))] = (address, now)
+                    next_attempt_at = now + self.__attempt_delay
+                    continue
+
+                if not tasks:
+                    raise self.__exception(last_error)
+
+                wait = deadline - now
+                if pending:
+                    wait = min(wait, next_attempt_at - now)
+                done, _ = await asyncio.wait(tasks, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    address, attempt_started = tasks.pop(task)
+                    exception = task.exception()
+                    if exception is None and winner is None:
+                        winner = task
+                        winner_address = (address, attempt_started)
+                    elif exception is None:
+                        # Another attempt completed at the same time, it lost
+                        task.result()[1].close()
+                    else:
+                        last_error = exception
+                        next_attempt_at = monotonic()
+                        self.__failed(address, exception, next_attempt_at)
+        finally:
+            now = monotonic()
+            losers = list(tasks)
+            for task in losers:
+                task.cancel()
+            # Attempts may complete while being cancelled, close their streams
+            for task, result in zip(losers, await asyncio.gather(*losers, return_exceptions=True)):
+                if isinstance(result, tuple):
+                    result[1].close()
+                address, attempt_started = tasks[task]
+                self.__lost(address, attempt_started, None if winner_address is None else winner_address[1], now)
+            if winner is None:
+                self.forget(server, port)
+
+        assert winner_address is not None
+        self.__succeeded(winner_address[0], monotonic() - started)
+        return winner.result()
+
+    def __cached(self, server: str, port: int) -> Optional[List[Address]]:
+        """The cached addresses of a server, if not expired."""
+        cached = self.__resolved.get((server, port))
+        if cached is None or cached[0] <= monotonic():
+            return None
+        return cached[1]
+
+    def __cache(self, server: str, port: int, resolved: List[Tuple[Any, ...]]) -> List[Address]:
+        """Cache the addresses of a server, as resolved by getaddrinfo."""
+        addresses = []
+        for family, _, protocol, _, address in resolved:
+            candidate = Address(family, protocol, address)
+            if candidate not in addresses:
+                addresses.append(candidate)
+        if not addresses:
+            raise IRCSocketException("No such server")
+
+        self.__logger.debug("Resolved %s to %s", server, ", ".join(str(address) for address in addresses))
+        self.__resolved[(server, port)] = (monotonic() + self.__resolution_ttl, addresses)
+        return addresses
+
+    def __partition(self, addresses: List[Address], now: float) -> Tuple[List[Address], List[Address]]:
+        """Split addresses into those to attempt and those skipped since they recently failed."""
+        attempting = []
+        skipped = []
+        for address in addresses:
+            stats = self.__stats.get(address)
+            (skipped if stats is not None and stats.skipped_until > now else attempting).append(address)
+        if skipped:
+            self.__logger.debug("Skipping recently failed addresses %s", ", ".join(str(address) for address in skipped))
+        return attempting, skipped
+
+    def __start(self, address: Address, now: float) -> _Attempt:
+        """Start a non-blocking attempt to connect to an address."""
+        self.__stats.setdefault(address, AddressStats()).attempts += 1
+        self.__logger.debug("Attempting to connect to %s", address)
+        raw_socket = socket.socket(address.family, socket.SOCK_STREAM, address.protocol)
+        try:
+            raw_socket.setblocking(False)
+            error = raw_socket.connect_ex(address.address)
+            if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                raise OSError(error, errno.errorcode.get(error, "Unable to connect"))
+        except OSError:
+            raw_socket.close()
+            raise
+        return _Attempt(address, raw_socket, now)
+
+    @staticmethod
+    def __advance(
+            attempt: _Attempt,
+            selector: selectors.BaseSelector,
+            wrap: Optional[Callable[[socket.socket], SSLSocket]],
+            server: str
+    ) -> bool:
+        """Advance an attempt which is ready. Returns whether or not it has connected."""
+        if not attempt.handshaking:
+            error = attempt.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error != 0:
+                raise OSError(error, "Unable to connect to {}".format(server))
+            if wrap is None:
+                selector.unregister(attempt.socket)
+                return True
+
+            # Wrapping takes over the file descriptor of the raw socket
+            selector.unregister(attempt.socket)
+            attempt.socket = wrap(attempt.socket)
+            attempt.handshaking = True
+            selector.register(attempt.socket, selectors.EVENT_WRITE, attempt)
+
+        try:
+            attempt.socket.do_handshake()
+        except SSLWantReadError:
+            selector.modify(attempt.socket, selectors.EVENT_READ, attempt)
+            return False
+        except SSLWantWriteError:
+            selector.modify(attempt.socket, selectors.EVENT_WRITE, attempt)
+            return False
+        selector.unregister(attempt.socket)
+        return True
+
+    def __settle(self, attempts: Iterable[_Attempt], winner: Optional[_Attempt], now: float) -> None:
+        """Close all attempts but the winner, recording those that lost to a later attempt as failed."""
+        for attempt in attempts:
+            if attempt is winner:
+                continue
+            attempt.socket.close()
+            self.__lost(attempt.address, attempt.started, None if winner is None else winner.started, now)
+
+    def __lost(self, address: Address, started: float, winner_started: Optional[float], now: float) -> None:
+        """Record an attempt still in flight once connecting ended."""
+        # An attempt started before the winner, or in flight until giving up, is slow or black-holed
+        if winner_started is None or started < winner_started:
+            self.__failed(address, IRCSocketException("Connection timed out"), now)
+
+    def __failed(self, address: Address, exception: BaseException, now: float) -> None:
+        """Record a failed attempt, skipping the address for a while."""
+        stats = self.__stats.setdefault(address, AddressStats())
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        penalty = min(self.__max_penalty, self.__failure_penalty * 2 ** min(stats.consecutive_failures - 1, 64))
+        stats.skipped_until = now + penalty
+        self.__logger.info("Failed to connect to %s, skipping it for %.0fs: %s", address, penalty, exception)
+
+    def __succeeded(self, address: Address, elapsed: float) -> None:
+        """Record a successful attempt."""
+        stats = self.__stats.setdefault(address, AddressStats())
+        stats.consecutive_failures = 0
+        stats.skipped_until = 0.0
+        self.__logger.debug("Connected to %s in %.3fs", address, elapsed)
+
+    @staticmethod
+    def __exception(last_error: Optional[BaseException]) -> IRCSocketException:
+        """The exception raised once all attempts have failed, after the last failure."""
+        if isinstance(last_error, IRCSocketException):
+            return last_error
+        if isinstance(last_error, SSLError):
+            message = "Failed to connect via TLS"
+        elif isinstance(last_error, OSError) and last_error.errno == errno.ECONNREFUSED:
+            message = "Connection refused"
+        elif isinstance(last_error, ConnectionResetError):
+            message = "Failed to connect via TLS"
+        elif isinstance(last_error, (socket.timeout, asyncio.TimeoutError)):
+            message = "Connection timed out"
+        else:
+            message = "Unable to connect"
+        exception = IRCSocketException(message)
+        exception.__cause__ = last_error
+        return exception
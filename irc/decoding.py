@@ -0,0 +1,61 @@
+"""Decoding of received lines, tolerating clients which do not use UTF-8."""
+
+import codecs
+from typing import Sequence, Tuple
+
+# Encodings tried in order. Latin-1 decodes any bytes, ending the chain
+default_encodings = ("utf-8", "cp1252", "latin-1")
+
+
+class LineDecoder:
+    """Decodes received lines, trying each encoding of a chain in order.
+
+    Lines not valid in any of the encodings have their invalid bytes replaced, decoding never raises.
+    """
+
+    def __init__(self, encodings: Sequence[str] = default_encodings) -> None:
+        if len(encodings) == 0:
+            raise ValueError("At least one encoding is required")
+        # Fail early on unknown encodings, raising LookupError
+        for encoding in encodings:
+            codecs.lookup(encoding)
+
+        self.__encodings: Tuple[str, ...] = tuple(encodings)
+        self.__encoding = self.__encodings[0]
+        self.__fallback_encodings = self.__encodings[1:]
+
+        self.__fallbacks = 0
+        self.__errors = 0
+
+    @property
+    def encodings(self) -> Tuple[str, ...]:
+        """The encodings tried, in order."""
+        return self.__encodings
+
+    @property
+    def fallbacks(self) -> int:
+        """The number of lines not valid in the first encoding."""
+        return self.__fallbacks
+
+    @property
+    def errors(self) -> int:
+        """The number of lines not valid in any encoding, decoded with their invalid bytes replaced."""
+        return self.__errors
+
+    def decode(self, line: bytes) -> str:
+        """Decode a line."""
+        # Nearly all lines are valid in the first encoding, keep that path to a single call
+        try:
+            return line.decode(self.__encoding)
+        except UnicodeDecodeError:
+            pass
+
+        self.__fallbacks += 1
+        for encoding in self.__fallback_encodings:
+            try:
+                return line.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+
+        self.__errors += 1
+        return line.decode(self.__encoding, errors="replace")
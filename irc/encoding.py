@@ -0,0 +1,113 @@
+"""Encoding of outgoing messages, split into lines fitting within the byte limit of IRC."""
+
+from typing import Dict, List, Optional, Tuple
+
+from irc.exception import IRCException
+
+# The longest line, including the trailing CR LF
+max_line_length = 512
+
+# The length assumed for the hostname of the bot until it is known, the limit of most servers
+default_hostname_length = 63
+
+# The number of PRIVMSG and NOTICE prefixes kept encoded
+max_cached_prefixes = 1024
+
+# Bytes which would end or corrupt a line, replaced by spaces
+_unsafe_bytes = bytes.maketrans(b"\0\r\n", b"   ")
+
+
+def split_payload(payload: bytes, budget: int) -> List[bytes]:
+    """Split UTF-8 text into parts of at most budget bytes, at the last space fitting or otherwise between characters.
+
+    Spaces around the parts are dropped and parts of only spaces are skipped.
+    """
+    payload = payload.strip(b" ")
+    if len(payload) <= budget:
+        return [payload] if payload else []
+
+    parts = []
+    start = 0
+    end = len(payload)
+    while end - start > budget:
+        cut = start + budget
+        # Prefer splitting at a space, the space itself may be just past the budget
+        space = payload.rfind(b" ", start, cut + 1)
+        if space > start:
+            parts.append(payload[start:space].rstrip(b" "))
+            start = space + 1
+        else:
+            # Never split a character, continuation bytes are 0b10xxxxxx
+            while cut > start and payload[cut] & 0xC0 == 0x80:
+                cut -= 1
+            parts.append(payload[start:cut])
+            start = cut
+        while start < end and payload[start] == 0x20:
+            start += 1
+    if start < end:
+        parts.append(payload[start:])
+    return parts
+
+
+class MessageEncoder:
+    """Encodes messages into lines which fit within 512 bytes as relayed by the server to other clients.
+
+    The server prefixes relayed lines with the nick, user and hostname of the bot. Until the bot's own
+    hostname is learned from a relayed line, the longest hostname is assumed.
+    """
+
+    def __init__(self, nick: str, user: str, hostname_length: int = default_hostname_length) -> None:
+        self.__nick = nick
+        self.__user = user
+        self.__hostname_length = hostname_length
+        # The relayed user and hostname of the bot, as in user@host, once learned
+        self.__hostname: Optional[str] = None
+        self.__relayed_prefix_length = self.__prefix_length()
+
+        # Encoded prefixes, such as b"PRIVMSG #channel :", per command and target
+        self.__prefixes: Dict[Tuple[str, str], bytes] = {}
+
+    @property
+    def nick(self) -> str:
+        """The current nick of the bot."""
+        return self.__nick
+
+    @nick.setter
+    def nick(self, nick: str) -> None:
+        """Use the nick of the bot as changed or assigned by the server."""
+        self.__nick = nick
+        self.__relayed_prefix_length = self.__prefix_length()
+
+    @property
+    def relayed_prefix_length(self) -> int:
+        """The number of bytes the server prefixes relayed lines with."""
+        return self.__relayed_prefix_length
+
+    def learn_hostname(self, hostname: str) -> None:
+        """Use the relayed user and hostname of the bot, as in user@host, for the exact prefix length."""
+        self.__hostname = hostname
+        self.__relayed_prefix_length = self.__prefix_length()
+
+    def __prefix_length(self) -> int:
+        """The length of the prefix of relayed lines, assuming the longest hostname until it is learned."""
+        if self.__hostname is not None:
+            return len(":{}!{} ".format(self.__nick, self.__hostname).encode())
+        # Servers without ident prefix the user with a tilde
+        return len(":{}!~{}@ ".format(self.__nick, self.__user).encode()) + self.__hostname_length
+
+    def encode(self, command: str, target: str, text: str) -> List[bytes]:
+        """Encode a message into lines ready to be written, including CR LF. Returns no lines for empty text."""
+        prefix = self.__prefixes.get((command, target))
+        if prefix is None:
+            # Targets come and go, start over instead of tracking their use
+            if len(self.__prefixes) >= max_cached_prefixes:
+                self.__prefixes.clear()
+            prefix = "{} {} :".format(command, target).encode()
+            self.__prefixes[(command, target)] = prefix
+
+        budget = max_line_length - self.__relayed_prefix_length - len(prefix) - 2
+        if budget < 4:
+            raise IRCException("Target is too long. No room for a message to {}".format(target))
+
+        payload = text.encode().translate(_unsafe_bytes)
+        return [b"%s%s\r\n" % (prefix, part) for part in split_payload(payload, budget)]
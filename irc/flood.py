@@ -0,0 +1,169 @@
+"""Flood control of outgoing lines."""
+
+from collections import deque
+from enum import IntEnum, unique
+from time import monotonic
+from typing import Deque, List, Optional, Tuple
+
+# Most networks accept a short burst of lines, followed by about a line per second
+default_rate = 1.0
+default_burst = 5
+# The number of reactions kept queued before older ones are replaced or dropped
+default_max_queued_reactions = 10
+
+
+@unique
+class EgressPriority(IntEnum):
+    """Priority classes of outgoing lines, lower values are sent first."""
+
+    # PONG and registration, needed to stay connected. Never delayed by the rate limit
+    CONNECTION = 0
+    # Commands and replies to users
+    COMMAND = 1
+    # Reactions, which may be coalesced or dropped when too many are queued
+    REACTION = 2
+
+
+class TokenBucket:
+    """A token bucket, refilled at a constant rate up to the size of a burst."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst
+        self.__updated = monotonic()
+
+    @property
+    def rate(self) -> float:
+        """The number of tokens added per second."""
+        return self.__rate
+
+    @property
+    def burst(self) -> float:
+        """The maximum number of tokens."""
+        return self.__burst
+
+    def tokens(self, now: float) -> float:
+        """The number of tokens available at a point in time. Negative when in debt."""
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+        return self.__tokens
+
+    def consume(self, count: float, now: float) -> None:
+        """Consume tokens, possibly going into debt."""
+        self.__tokens = self.tokens(now) - count
+
+    def wait_time(self, count: float, now: float) -> float:
+        """The number of seconds until the given number of tokens are available."""
+        return max(0.0, (count - self.tokens(now)) / self.__rate)
+
+
+class EgressScheduler:  # pylint: disable=too-many-instance-attributes
+    """Queue of outgoing lines, ordered by priority and released at the rate allowed by a token bucket.
+
+    Not thread-safe, the owner is expected to hold a lock or run on a single event loop.
+    """
+
+    def __init__(
+            self,
+            rate: float = default_rate,
+            burst: float = default_burst,
+            max_queued_reactions: int = default_max_queued_reactions
+    ) -> None:
+        # A rate of zero or less disables the rate limit
+        self.__bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.__max_queued_reactions = max_queued_reactions
+
+        # Lines queued per priority, with the time they were queued and their coalescing key
+        self.__queues: List[Deque[Tuple[float, bytes, Optional[str]]]] = [deque() for _ in EgressPriority]
+
+        self.__dropped = 0
+        self.__coalesced = 0
+        self.__sent = 0
+        self.__total_wait = 0.0
+        self.__max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        """The number of queued lines."""
+        return sum(len(queue) for queue in self.__queues)
+
+    def depth_of(self, priority: EgressPriority) -> int:
+        """The number of queued lines of a priority."""
+        return len(self.__queues[priority])
+
+    @property
+    def dropped(self) -> int:
+        """The number of reactions dropped for the queue being over budget."""
+        return self.__dropped
+
+    @property
+    def coalesced(self) -> int:
+        """The number of reactions replaced by a newer reaction to the same target."""
+        return self.__coalesced
+
+    @property
+    def sent(self) -> int:
+        """The number of lines released."""
+        return self.__sent
+
+    @property
+    def average_wait(self) -> float:
+        """The average number of seconds lines were queued."""
+        return self.__total_wait / self.__sent if self.__sent > 0 else 0
+
+    @property
+    def max_wait(self) -> float:
+        """The longest number of seconds a line was queued."""
+        return self.__max_wait
+
+    def put(self, data: bytes, priority: EgressPriority = EgressPriority.COMMAND, key: Optional[str] = None) -> None:
+        """Queue a line. Reactions with the same key, such as a target, may be coalesced."""
+        queue = self.__queues[priority]
+        if priority == EgressPriority.REACTION and len(queue) >= self.__max_queued_reactions:
+            # Prefer replacing a queued reaction to the same target, the newest reaction is the most relevant
+            for index, (_, _, queued_key) in enumerate(queue):
+                if key is not None and queued_key == key:
+                    del queue[index]
+                    self.__coalesced += 1
+                    break
+            else:
+                queue.popleft()
+                self.__dropped += 1
+
+        queue.append((monotonic(), data, key))
+
+    def take(
+            self,
+            max_size: int,
+            max_priority: EgressPriority = EgressPriority.REACTION
+    ) -> Tuple[List[bytes], Optional[float]]:
+        """Take the lines allowed to be sent, in priority order, up to max_size bytes and of at most max_priority.
+
+        Returns the lines and, if no line may be sent, the seconds to wait before trying again.
+        The number of seconds is None if there are no queued lines.
+        """
+        now = monotonic()
+        batch: List[bytes] = []
+        size = 0
+        for priority, queue in zip(EgressPriority, self.__queues[:max_priority + 1]):
+            while queue:
+                queued_at, data, _ = queue[0]
+                if batch and size + len(data) > max_size:
+                    return batch, None
+
+                if self.__bucket is not None:
+                    if priority != EgressPriority.CONNECTION and self.__bucket.tokens(now) < 1:
+                        return batch, None if batch else self.__bucket.wait_time(1, now)
+                    self.__bucket.consume(1, now)
+
+                queue.popleft()
+                batch.append(data)
+                size += len(data)
+
+                wait = now - queued_at
+                self.__sent += 1
+                self.__total_wait += wait
+                self.__max_wait = max(self.__max_wait, wait)
+
+        return batch, None
@@ -0,0 +1,70 @@
+"""Framing of received bytes into IRC lines."""
+
+from typing import Generator
+
+# The longest line accepted. IRCv3 allows 8191 bytes of tags in front of
+# the 512 bytes of the message itself
+default_max_line_length = 8191 + 512
+
+
+class LineBuffer:
+    """A buffer of received bytes, yielding complete lines and keeping the partial tail."""
+
+    def __init__(self, max_line_length: int = default_max_line_length) -> None:
+        self.__max_line_length = max_line_length
+        self.__buffer = bytearray()
+        self.__discarded_bytes = 0
+        # Whether or not the rest of the current line is being discarded for being too long
+        self.__discarding = False
+
+    @property
+    def buffer(self) -> bytearray:
+        """The underlaying buffer, to append received bytes to."""
+        return self.__buffer
+
+    @property
+    def pending_bytes(self) -> int:
+        """The number of buffered bytes not yet part of a complete line."""
+        return len(self.__buffer)
+
+    @property
+    def discarded_bytes(self) -> int:
+        """The number of bytes discarded as part of too long lines."""
+        return self.__discarded_bytes
+
+    def feed(self, data: bytes) -> None:
+        """Add received bytes to the buffer."""
+        self.__buffer += data
+
+    def clear(self) -> None:
+        """Discard all buffered bytes, such as when the connection is lost."""
+        self.__buffer.clear()
+        self.__discarding = False
+
+    def lines(self) -> Generator[bytes, None, None]:
+        """Yield all complete lines, without their line endings."""
+        buffer = self.__buffer
+        start = 0
+        try:
+            while True:
+                # Lines should end with CRLF, but accept a lone LF as well
+                end = buffer.find(b"\n", start)
+                if end == -1:
+                    break
+
+                line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+                if self.__discarding or line_end - start > self.__max_line_length:
+                    self.__discarded_bytes += line_end - start
+                    self.__discarding = False
+                elif line_end > start:
+                    yield bytes(buffer[start:line_end])
+                start = end + 1
+        finally:
+            # Remove all consumed lines at once, keeping the partial tail
+            del buffer[:start]
+
+            # Never let a line without an end grow the buffer indefinitely
+            if len(buffer) > self.__max_line_length:
+                self.__discarded_bytes += len(buffer)
+                self.__discarding = True
+                buffer.clear()
@@ -0,0 +1,124 @@
+"""Bounded queue of received messages."""
+
+from collections import deque
+from enum import Enum, unique
+from threading import Condition
+from time import monotonic
+from typing import Deque, Optional
+
+from irc.messages import IRCBaseMessage, IRCMessage
+
+
+@unique
+class OverflowPolicy(Enum):
+    """What to do with a received private message when the queue is full."""
+
+    # Hold the message back until there is room, delaying all following messages
+    BLOCK = "block"
+    # Drop the oldest queued private message to make room
+    DROP_OLDEST = "drop-oldest"
+    # Drop the received private message
+    DROP_NEWEST = "drop-newest"
+
+
+class IngressQueue:
+    """A thread-safe queue of received messages, bounded by the number of queued private messages.
+
+    Only private messages are ever dropped or blocked on, other messages are always queued.
+    """
+
+    def __init__(self, max_depth: int = 0, policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> None:
+        # A maximum depth of zero or less leaves the queue unbounded
+        self.__max_depth = max_depth
+        self.__policy = policy
+
+        self.__messages: Deque[IRCBaseMessage] = deque()
+        self.__condition = Condition()
+
+        self.__dropped = 0
+        self.__blocked = 0
+        self.__high_water_mark = 0
+
+    @property
+    def max_depth(self) -> int:
+        """The maximum number of queued messages, private messages exceeding it are subject to the policy."""
+        return self.__max_depth
+
+    @property
+    def policy(self) -> OverflowPolicy:
+        """The policy applied when the queue is full."""
+        return self.__policy
+
+    @property
+    def depth(self) -> int:
+        """The number of queued messages."""
+        return len(self.__messages)
+
+    @property
+    def dropped(self) -> int:
+        """The number of private messages dropped."""
+        return self.__dropped
+
+    @property
+    def blocked(self) -> int:
+        """The number of times the reader was blocked by a full queue."""
+        return self.__blocked
+
+    @property
+    def high_water_mark(self) -> int:
+        """The highest number of messages queued at once."""
+        return self.__high_water_mark
+
+    def put(self, message: IRCBaseMessage, timeout: Optional[float] = None) -> bool:
+        """Queue a message, applying the overflow policy to private messages if full.
+
+        Returns False if the policy blocks and the queue is still full after waiting at most timeout seconds.
+        """
+        with self.__condition:
+            is_full = 0 < self.__max_depth <= len(self.__messages)
+            if is_full and isinstance(message, IRCMessage):
+                if self.__policy == OverflowPolicy.DROP_NEWEST:
+                    self.__dropped += 1
+                    return True
+
+                if self.__policy == OverflowPolicy.DROP_OLDEST:
+                    # Control messages stay, only a queued private message may make room
+                    for index, queued_message in enumerate(self.__messages):
+                        if isinstance(queued_message, IRCMessage):
+                            del self.__messages[index]
+                            self.__dropped += 1
+                            break
+                else:
+                    self.__blocked += 1
+                    if not self.__wait_for_room(timeout):
+                        return False
+
+            self.__messages.append(message)
+            self.__high_water_mark = max(self.__high_water_mark, len(self.__messages))
+            self.__condition.notify_all()
+            return True
+
+    def wait_for_room(self, timeout: Optional[float] = None) -> bool:
+        """Wait at most timeout seconds for room for a private message, returning whether there is room."""
+        with self.__condition:
+            return self.__policy != OverflowPolicy.BLOCK or self.__wait_for_room(timeout)
+
+    def __wait_for_room(self, timeout: Optional[float]) -> bool:
+        """Wait at most timeout seconds for the queue not to be full. The condition must be held."""
+        deadline = None if timeout is None else monotonic() + timeout
+        while 0 < self.__max_depth <= len(self.__messages):
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.__condition.wait(remaining)
+        return True
+
+    def get(self) -> IRCBaseMessage:
+        """Take the oldest message, waiting for one to be received."""
+        with self.__condition:
+            while not self.__messages:
+                self.__condition.wait()
+            message = self.__messages.popleft()
+            # Wake a reader blocked by a full queue
+            self.__condition.notify_all()
+            return message
@@ -3,16 +3,22 @@
 from __future__ import annotations
 
 import logging
-import textwrap
 import threading
+from collections import deque
 from logging import Logger
-from queue import Queue
-from threading import Event, Thread
-from time import sleep
-from typing import Generator, Optional, Set, Type
+from threading import Condition, Event, Thread
+from time import monotonic, perf_counter, sleep
+from typing import Deque, Generator, Iterable, List, Optional, Sequence, Set
 
+from irc.backoff import Backoff, default_max_wait
+from irc.decoding import LineDecoder, default_encodings
+from irc.encoding import MessageEncoder
 from irc.exception import IRCConnectionException, IRCException, IRCSocketClosedException, IRCSocketException
-from irc.messages import IRCBaseMessage, IRCControlMessage, IRCMessage
+from irc.flood import EgressPriority, EgressScheduler, default_burst, default_max_queued_reactions, default_rate
+from irc.framing import LineBuffer
+from irc.ingress import IngressQueue, OverflowPolicy
+from irc.messages import IRCBaseMessage, IRCControlMessage, IRCControlMessageType, IRCJoinMessage, IRCNickMessage, IRCPingMessage, parse_message
+from irc.metrics import ConnectionMetrics, Metrics
 from irc.socket import Socket
 
 # Many IRC servers will kick the user if it does not reply for about 240s
@@ -22,9 +28,31 @@ from irc.socket import Socket
 # is an issue with the socket
 default_timeout = 300
 
+# The number of bytes of queued messages written at once. Lines ready to be
+# sent are coalesced into a single write, up to this size
+default_max_write_size = 4096
+
+# The longest wait for room in a full ingress queue before reading again. Reading
+# goes on while messages are held back, to keep answering PING messages
+blocked_wait = 0.5
+
 version = "1.0.0"
 
 
+def join_lines(channels: Iterable[str]) -> List[str]:
+    """Lines joining channels, listing as many channels per line as fit within the 512 byte limit."""
+    lines = []
+    line = ""
+    for channel in sorted(channels):
+        if line and len("JOIN {},{}\r\n".format(line, channel).encode()) > 512:
+            lines.append("JOIN {}\r\n".format(line))
+            line = ""
+        line = "{},{}".format(line, channel) if line else channel
+    if line:
+        lines.append("JOIN {}\r\n".format(line))
+    return lines
+
+
 class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
     """IRC connector."""
 
@@ -37,38 +65,116 @@ class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
             gecos: str = "",
             timeout: float = default_timeout,
             use_tls: bool = False,
-            logger: Optional[Logger] = None
+            logger: Optional[Logger] = None,
+            max_write_size: int = default_max_write_size,
+            rate: float = default_rate,
+            burst: float = default_burst,
+            max_queued_reactions: int = default_max_queued_reactions,
+            max_ingress_depth: int = 0,
+            overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+            metrics: Optional[Metrics] = None,
+            encodings: Sequence[str] = default_encodings,
+            max_reconnect_wait: float = default_max_wait
     ) -> None:
         self.__timeout = timeout
+        self.__use_tls = use_tls
         self.__logger = logging.getLogger(__name__) if logger is None else logger
         self.__socket = Socket(server, port, timeout, logger=self.__logger, use_tls=use_tls)
         self.__user = user
         self.__nick = nick
         self.__gecos = gecos
+        # Encodes messages into lines fitting within the limit of IRC as relayed by the server
+        self.__encoder = MessageEncoder(nick, user)
 
         self.__channels: Set[str] = set()
+        # Channels not yet rejoined after reconnecting, in lowercase, and when the connection was lost
+        self.__rejoining: Set[str] = set()
+        self.__disconnected_at = 0.0
+        # Waits between attempts to reconnect
+        self.__backoff = Backoff(max_wait=max_reconnect_wait)
+
+        # Buffer of received bytes, carrying partial lines over to the next read
+        self.__line_buffer = LineBuffer()
+        # Decoder of received lines, trying each encoding in order
+        self.__decoder = LineDecoder(encodings)
 
         # Create a thread and event handler for ingress messages
         self.__ingress_thread_should_run = Event()
         self.__ingress_thread = Thread(target=self.__handle_ingress_messages)
         self.__ingress_thread.daemon = True
-        # Queue of parsed messages received from the server
-        self.__ingress_messages: Queue[IRCBaseMessage] = Queue()  # pylint: disable=unsubscriptable-object
+        # Queue of parsed messages received from the server, bounded if a maximum depth is given
+        self.__ingress_messages = IngressQueue(max_ingress_depth, overflow_policy)
 
         # Create a thread and event handler for egress messages
         self.__egress_thread_should_run = Event()
         self.__egress_thread = Thread(target=self.__handle_egress_messages)
         self.__egress_thread.daemon = True
-        # Queue of raw messages to send to the server
-        self.__egress_messages: Queue[bytes] = Queue()  # pylint: disable=unsubscriptable-object
+        # Lines to send to the server, released in priority order at the allowed rate
+        self.__egress_scheduler = EgressScheduler(rate, burst, max_queued_reactions)
+        # Guards the scheduler, notified when lines are queued
+        self.__egress_condition = Condition()
+        self.__max_write_size = max_write_size
+        self.__egress_writes = 0
+        self.__egress_lines = 0
+        self.__egress_bytes = 0
+
+        # Metrics are only recorded if enabled, leaving a single check in the hot paths otherwise
+        self.__metrics: Optional[ConnectionMetrics] = None
+        if metrics is not None:
+            self.__metrics = ConnectionMetrics(metrics, "{}:{}".format(server, port))
+            self.__metrics.track_queue_depth("ingress", lambda: self.__ingress_messages.depth)
+            self.__metrics.track_queue_depth("egress", lambda: self.__egress_scheduler.depth)
 
     @property
     def messages(self) -> Generator[IRCBaseMessage, None, None]:
         """A generator containing all received messages as they come."""
         while True:
-            message = self.__ingress_messages.get()
-            self.__ingress_messages.task_done()
-            yield message
+            yield self.__ingress_messages.get()
+
+    @property
+    def ingress_queue(self) -> IngressQueue:
+        """The queue of received messages, exposing its depth, high-water mark and dropped messages."""
+        return self.__ingress_messages
+
+    @property
+    def decoder(self) -> LineDecoder:
+        """The decoder of received lines, counting lines not valid UTF-8."""
+        return self.__decoder
+
+    @property
+    def egress_scheduler(self) -> EgressScheduler:
+        """The scheduler of outgoing lines, exposing queue depths and wait times."""
+        return self.__egress_scheduler
+
+    @property
+    def egress_writes(self) -> int:
+        """The number of writes of queued messages."""
+        return self.__egress_writes
+
+    @property
+    def egress_lines(self) -> int:
+        """The number of lines written."""
+        return self.__egress_lines
+
+    @property
+    def egress_bytes(self) -> int:
+        """The number of bytes written."""
+        return self.__egress_bytes
+
+    @property
+    def egress_syscalls(self) -> int:
+        """The number of system calls made to send data."""
+        return self.__socket.send_calls
+
+    @property
+    def egress_bytes_per_write(self) -> float:
+        """The average number of bytes per write."""
+        return self.__egress_bytes / self.__egress_writes if self.__egress_writes > 0 else 0
+
+    @property
+    def egress_syscalls_per_line(self) -> float:
+        """The average number of system calls made per line written."""
+        return self.__socket.send_calls / self.__egress_lines if self.__egress_lines > 0 else 0
 
     @property
     def version(self) -> str:
@@ -83,6 +189,7 @@ class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
         # Connect the underlaying socket
         self.__logger.info("Connecting to server")
         self.__socket.connect()
+        self.__connected()
 
         self.__logger.info("Connected to server")
 
@@ -101,34 +208,78 @@ class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
     def login(self) -> None:
         """Login to the server."""
         self.__logger.info("Logging in")
-        self.send("User {0} {0} {0} :{1}\r\n".format(self.__user, self.__gecos))
-        self.send("NICK {0}\r\n".format(self.__nick))
+        self.send("User {0} {0} {0} :{1}\r\n".format(self.__user, self.__gecos), EgressPriority.CONNECTION)
+        self.send("NICK {0}\r\n".format(self.__nick), EgressPriority.CONNECTION)
 
     def reconnect(self) -> None:
         """Reconnect to the server."""
         if not self.__ingress_thread_should_run.is_set() or not self.__egress_thread_should_run.is_set():
             raise IRCConnectionException("Not connected")
 
+        self.__disconnected_at = monotonic()
+        self.__backoff.disconnected(self.__disconnected_at)
+
         # Connect the underlaying socket, may continue indefinetely
-        # The number of seconds to wait before reconnecting, using exponential backoff
-        reconnect_wait = 1
         while True:
+            wait = self.__backoff.next_wait()
+            if wait > 0:
+                self.__logger.info("Trying to reconnect in %.1fs", wait)
+                sleep(wait)
             try:
                 self.__logger.info("Attempting to reconnect")
                 self.__socket.connect()
             except IRCSocketException:
                 self.__logger.error("Unable to reconnect", exc_info=True)
-                self.__logger.info("Trying to reconnect again in %ds", reconnect_wait)
-                sleep(reconnect_wait)
-                reconnect_wait += reconnect_wait
                 continue
             break
+        self.__connected()
 
         self.__logger.info("Reconnected to server")
+        if self.__metrics is not None:
+            self.__metrics.reconnects.inc()
+            self.__metrics.reconnect_seconds.observe(monotonic() - self.__disconnected_at)
+
+        # Any partial line belonged to the previous connection
+        self.__line_buffer.clear()
 
+        # Send the login and all joins at once, without waiting for replies
         self.login()
-        for channel in self.__channels:
-            self.join(channel, ignore_duplicate=True)
+        self.__rejoining = {channel.lower() for channel in self.__channels}
+        for line in join_lines(self.__channels):
+            self.send(line, EgressPriority.CONNECTION)
+
+    def __connected(self) -> None:
+        """Record a successful connection."""
+        self.__backoff.connected()
+        if self.__metrics is not None and self.__use_tls:
+            if self.__socket.session_reused:
+                self.__metrics.tls_resumed_handshakes.inc()
+            else:
+                self.__metrics.tls_full_handshakes.inc()
+
+    def __track_nick(self, message: IRCBaseMessage) -> None:
+        """Track the nick of the bot as assigned when registering or changed later, for the prefix of relayed lines."""
+        if isinstance(message, IRCNickMessage):
+            if message.nick.lower() == self.__encoder.nick.lower():
+                self.__encoder.nick = message.new_nick
+        elif isinstance(message, IRCControlMessage) and message.message_type == IRCControlMessageType.RPL_WELCOME:
+            self.__encoder.nick = message.target
+
+    def __joined(self, message: IRCJoinMessage) -> None:
+        """Learn the relayed hostname of the bot from its joins, recording channels rejoined after reconnecting."""
+        if message.nick.lower() != self.__encoder.nick.lower():
+            return
+
+        self.__encoder.learn_hostname(message.hostname)
+        if not self.__rejoining:
+            return
+
+        self.__rejoining.discard(message.channel.lower())
+        if not self.__rejoining:
+            elapsed = monotonic() - self.__disconnected_at
+            self.__logger.info("Rejoined all channels %.2fs after losing the connection", elapsed)
+            if self.__metrics is not None:
+                self.__metrics.rejoin_seconds.observe(elapsed)
 
     def disconnect(self) -> None:
         """Disconnect from the server."""
@@ -147,27 +298,34 @@ class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
             self.__ingress_thread.join()
             self.__egress_thread.join()
 
-    def send(self, message: str) -> None:
-        """Send a raw message to the server."""
-        if len(message.encode()) > 512:
-            raise IRCException("Message is too long. Cannot be longer than 512 bytes - was {}"
-                               .format(len(message.encode())))
-
-        self.__egress_messages.put(message.encode())
+    def send(
+            self,
+            message: str,
+            priority: EgressPriority = EgressPriority.COMMAND,
+            key: Optional[str] = None
+    ) -> None:
+        """Send a raw message to the server. Reactions with the same key may be coalesced."""
+        line = message.encode()
+        if len(line) > 512:
+            raise IRCException("Message is too long. Cannot be longer than 512 bytes - was {}".format(len(line)))
+        self.__queue([line], priority, key)
+
+    def __queue(self, lines: List[bytes], priority: EgressPriority, key: Optional[str]) -> None:
+        """Queue encoded lines to be sent."""
+        with self.__egress_condition:
+            for line in lines:
+                self.__egress_scheduler.put(line, priority, key)
+            self.__egress_condition.notify()
 
-    def send_message(self, target: str, message: str) -> None:
-        """Send a message."""
+    def send_message(self, target: str, message: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a message, split into as many lines as needed."""
         self.__logger.debug("Sending message to %s", target)
+        self.__queue(self.__encoder.encode("PRIVMSG", target, message), priority, target)
 
-        for line in textwrap.wrap(message, width=(512 - len(target) - 12)):
-            self.send("PRIVMSG {} :{}\r\n".format(target, line))
-
-    def send_notice(self, target: str, notice: str) -> None:
-        """Send a notice."""
+    def send_notice(self, target: str, notice: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a notice, split into as many lines as needed."""
         self.__logger.debug("Sending notice to %s", target)
-
-        for line in textwrap.wrap(notice, width=(512 - len(target) - 11)):
-            self.send("NOTICE {} :{}\r\n".format(target, line))
+        self.__queue(self.__encoder.encode("NOTICE", target, notice), priority, target)
 
     def join(self, channel: str, ignore_duplicate: bool = False) -> None:
         """Join a channel."""
@@ -175,59 +333,110 @@ class IRC:  # pylint: disable=too-many-instance-attributes,too-many-arguments
             raise IRCException("Already part of that channel")
 
         self.__logger.info("Joining channel %s", channel)
-        self.send("JOIN {}\r\n".format(channel))
+        self.send("JOIN {}\r\n".format(channel), EgressPriority.CONNECTION)
         self.__channels.add(channel)
 
     def __handle_ingress_messages(self) -> None:
         """Threaded ingress entrypoint of the IRC client."""
+        metrics = self.__metrics
+        decoder = self.__decoder
+
+        ingress_messages = self.__ingress_messages
+        # Messages read while the queue is full and its policy blocks, queued in order once there is room
+        held: Deque[IRCBaseMessage] = deque()
+
         # Run the connector's main loop for as long as it's not disconnected
         while self.__ingress_thread_should_run.is_set():
-            # Attempt to read once immediately
-            try:
-                raw_data = self.__socket.read_all()
-            except IRCSocketClosedException:
-                self.__logger.info("Socket has closed, reconnecting")
-                self.reconnect()
-                continue
+            while held and ingress_messages.wait_for_room(blocked_wait):
+                ingress_messages.put(held.popleft())
 
-            # If there is no data, poll the socket for more data
-            if raw_data is None:
-                self.__logger.debug("No data available, waiting %ds", self.__timeout)
+            if held:
+                # Stop reading once as many messages are held back as may be queued, checking for exit in between
+                if len(held) >= ingress_messages.max_depth:
+                    continue
+
+                # Keep reading to answer PING messages, a timeout only ends the wait
+                try:
+                    self.__socket.wait_for_data(blocked_wait)
+                except IRCSocketException:
+                    continue
+            else:
+                # Wait for data, returning right away if some is already available
                 try:
                     self.__socket.wait_for_data(self.__timeout)
                 except IRCSocketException:
-                    self.__logger.debug("Timeout while reading data - reconnecting")
+                    # Disconnecting ends the wait without reconnecting
+                    if self.__ingress_thread_should_run.is_set():
+                        self.__logger.debug("Timeout while reading data - reconnecting")
+                        self.reconnect()
+                    continue
+
+            # Read all available data without waiting
+            try:
+                received_bytes = self.__socket.read_into(self.__line_buffer.buffer)
+            except IRCSocketClosedException:
+                if self.__ingress_thread_should_run.is_set():
+                    self.__logger.info("Socket has closed, reconnecting")
                     self.reconnect()
                 continue
 
-            lines = raw_data.decode().splitlines()
-            self.__logger.debug("Server sent %d lines", len(lines))
-            for line in lines:
-                # Try to parse the line using all available message parsers
-                parsers: Set[Type[IRCBaseMessage]] = {IRCControlMessage, IRCMessage}
-                messages = [parser.parse(line) for parser in parsers]
-                # Add each non-null message to the message queue
-                parsed_messages = [message for message in messages if message is not None]
+            if received_bytes == 0:
+                continue
+
+            if metrics is not None:
+                metrics.read_bytes.inc(received_bytes)
 
-                if len(parsed_messages) == 0:
+            for raw_line in self.__line_buffer.lines():
+                # Tolerate clients using other encodings than UTF-8, bad input must not stop the ingress
+                line = decoder.decode(raw_line)
+
+                # Tokenize the line once and dispatch it to the parser of its command
+                if metrics is None:
+                    message = parse_message(line)
+                else:
+                    started = perf_counter()
+                    message = parse_message(line)
+                    metrics.parse_seconds(type(message)).observe(perf_counter() - started)
+                    metrics.read_lines.inc()
+
+                if message is None:
+                    self.__logger.debug("Unhandled message: <%s>", line)
+                elif isinstance(message, IRCPingMessage):
                     # Handle pinging internally - don't expose it as a message
-                    if line.startswith("PING"):
-                        self.__logger.debug("Got PING, responding with PONG")
-                        self.send("PONG {}\r\n".format(line.split(" ")[1:]))
-                    else:
-                        self.__logger.debug("Unhandled message: <%s>", line)
+                    self.__logger.debug("Got PING, responding with PONG")
+                    self.send("PONG :{}\r\n".format(message.token), EgressPriority.CONNECTION)
                 else:
-                    # Add all parsed messages to the message queue
-                    for parsed_message in parsed_messages:
-                        self.__ingress_messages.put(parsed_message)
-                    self.__logger.debug("Parsed %d messages and added them to the queue", len(parsed_messages))
+                    if isinstance(message, IRCJoinMessage):
+                        self.__joined(message)
+                    elif isinstance(message, (IRCNickMessage, IRCControlMessage)):
+                        self.__track_nick(message)
+                    if held or not ingress_messages.put(message, timeout=0):
+                        held.append(message)
+                        self.__logger.debug("Parsed message and held it back until the queue has room")
+                    else:
+                        self.__logger.debug("Parsed message and added it to the queue")
 
     def __handle_egress_messages(self) -> None:
         """Threaded egress entrypoint of the IRC client."""
         while self.__egress_thread_should_run.is_set():
-            message = self.__egress_messages.get()
+            # Wait for lines to be allowed, then take all allowed lines in a single write
+            with self.__egress_condition:
+                while True:
+                    batch, wait = self.__egress_scheduler.take(self.__max_write_size)
+                    if batch:
+                        break
+                    self.__egress_condition.wait(wait)
+
             try:
-                self.__socket.write(message)
-                self.__egress_messages.task_done()
+                data = b"".join(batch)
+                if self.__metrics is None:
+                    self.__socket.write(data)
+                else:
+                    started = perf_counter()
+                    self.__socket.write(data)
+                    self.__metrics.egress_write_seconds.observe(perf_counter() - started)
+                self.__egress_writes += 1
+                self.__egress_lines += len(batch)
+                self.__egress_bytes += len(data)
             except IRCSocketException:
                 self.__logger.error("Unable to send message", exc_info=True)
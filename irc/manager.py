@@ -0,0 +1,527 @@
+"""Many IRC connections multiplexed on a single selector loop."""
+
+import logging
+import selectors
+import socket
+from collections import deque
+from logging import Logger
+from threading import Event, Lock, Thread
+from time import monotonic, perf_counter
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from irc.backoff import Backoff, default_max_wait
+from irc.decoding import LineDecoder, default_encodings
+from irc.encoding import MessageEncoder
+from irc.exception import IRCException, IRCSocketClosedException, IRCSocketException
+from irc.flood import EgressPriority, EgressScheduler, default_burst, default_max_queued_reactions, default_rate
+from irc.framing import LineBuffer
+from irc.irc import default_max_write_size, default_timeout, join_lines, version
+from irc.messages import IRCBaseMessage, IRCControlMessage, IRCControlMessageType, IRCJoinMessage, IRCNickMessage, IRCPingMessage, parse_message
+from irc.metrics import ConnectionMetrics, Metrics
+from irc.socket import Socket
+
+
+class IRCNetwork:  # pylint: disable=too-many-instance-attributes
+    """A connection to a single network, with its I/O driven by an IRCManager.
+
+    Sending is thread-safe. All other methods are called by the manager, on the thread running its loop.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            name: str,
+            server: str,
+            port: int,
+            user: str,
+            nick: str,
+            gecos: str = "",
+            timeout: float = default_timeout,
+            use_tls: bool = False,
+            logger: Optional[Logger] = None,
+            max_write_size: int = default_max_write_size,
+            rate: float = default_rate,
+            burst: float = default_burst,
+            max_queued_reactions: int = default_max_queued_reactions,
+            on_queued: Optional[Callable[[], None]] = None,
+            metrics: Optional[Metrics] = None,
+            encodings: Sequence[str] = default_encodings,
+            max_reconnect_wait: float = default_max_wait
+    ) -> None:
+        self.__name = name
+        self.__timeout = timeout
+        self.__use_tls = use_tls
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+        self.__socket = Socket(server, port, timeout, logger=self.__logger, use_tls=use_tls)
+        self.__user = user
+        self.__nick = nick
+        self.__gecos = gecos
+        # Encodes messages into lines fitting within the limit of IRC as relayed by the server
+        self.__encoder = MessageEncoder(nick, user)
+        self.__on_queued = on_queued
+
+        self.__channels: Set[str] = set()
+        self.__is_connected = False
+        # The last time data was received, to detect dead connections
+        self.__last_received = 0.0
+        # When to attempt to reconnect, and the waits between attempts
+        self.__reconnect_at = 0.0
+        self.__backoff = Backoff(max_wait=max_reconnect_wait)
+        # When the connection was lost, if it was
+        self.__disconnected_at: Optional[float] = None
+        # Channels not yet rejoined after reconnecting, in lowercase
+        self.__rejoining: Set[str] = set()
+        self.__rejoin_started = 0.0
+
+        # Buffer of received bytes, carrying partial lines over to the next read
+        self.__line_buffer = LineBuffer()
+        # Decoder of received lines, trying each encoding in order
+        self.__decoder = LineDecoder(encodings)
+
+        # Lines to send to the server, released in priority order at the allowed rate
+        self.__egress_scheduler = EgressScheduler(rate, burst, max_queued_reactions)
+        self.__egress_lock = Lock()
+        # Lines taken from the scheduler, not yet accepted by the socket
+        self.__write_buffer = bytearray()
+        self.__max_write_size = max_write_size
+        self.__egress_writes = 0
+        self.__egress_lines = 0
+        self.__egress_bytes = 0
+
+        # Metrics are only recorded if enabled, leaving a single check in the hot paths otherwise
+        self.__metrics: Optional[ConnectionMetrics] = None
+        if metrics is not None:
+            self.__metrics = ConnectionMetrics(metrics, name)
+            self.__metrics.track_queue_depth("egress", lambda: self.__egress_scheduler.depth)
+
+    @property
+    def name(self) -> str:
+        """The name of the network."""
+        return self.__name
+
+    @property
+    def nick(self) -> str:
+        """The nick used on the network."""
+        return self.__nick
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether or not the network is connected."""
+        return self.__is_connected
+
+    @property
+    def timeout_at(self) -> float:
+        """The time at which the connection is considered dead, unless more data is received."""
+        return self.__last_received + self.__timeout
+
+    @property
+    def reconnect_at(self) -> float:
+        """The time at which to attempt to reconnect, if disconnected."""
+        return self.__reconnect_at
+
+    @property
+    def has_pending_writes(self) -> bool:
+        """Whether or not there are bytes waiting for the socket to be writable."""
+        return len(self.__write_buffer) > 0
+
+    @property
+    def decoder(self) -> LineDecoder:
+        """The decoder of received lines, counting lines not valid UTF-8."""
+        return self.__decoder
+
+    @property
+    def egress_scheduler(self) -> EgressScheduler:
+        """The scheduler of outgoing lines, exposing queue depths and wait times."""
+        return self.__egress_scheduler
+
+    @property
+    def egress_writes(self) -> int:
+        """The number of writes of queued messages."""
+        return self.__egress_writes
+
+    @property
+    def egress_lines(self) -> int:
+        """The number of lines written."""
+        return self.__egress_lines
+
+    @property
+    def egress_bytes(self) -> int:
+        """The number of bytes written."""
+        return self.__egress_bytes
+
+    @property
+    def version(self) -> str:
+        """The version of the IRC library."""
+        return version
+
+    def fileno(self) -> int:
+        """The file descriptor of the connection."""
+        return self.__socket.fileno()
+
+    def connect(self) -> None:
+        """Connect to the server and login, joining all previously joined channels."""
+        self.open()
+        self.start()
+
+    def open(self) -> None:
+        """Open a connection to the server, blocking until connected. May be called from any thread while disconnected."""
+        self.__logger.info("Connecting to %s", self.__name)
+        self.__socket.connect()
+        self.__logger.info("Connected to %s", self.__name)
+
+    def start(self) -> None:
+        """Start using an opened connection, logging in and joining all previously joined channels."""
+        self.__is_connected = True
+        self.__last_received = monotonic()
+        self.__backoff.connected(self.__last_received)
+        if self.__metrics is not None:
+            if self.__use_tls:
+                if self.__socket.session_reused:
+                    self.__metrics.tls_resumed_handshakes.inc()
+                else:
+                    self.__metrics.tls_full_handshakes.inc()
+            if self.__disconnected_at is not None:
+                self.__metrics.reconnects.inc()
+                self.__metrics.reconnect_seconds.observe(self.__last_received - self.__disconnected_at)
+        if self.__disconnected_at is not None:
+            self.__rejoining = {channel.lower() for channel in self.__channels}
+            self.__rejoin_started = self.__disconnected_at
+        self.__disconnected_at = None
+        # Any partial line or write belonged to a previous connection
+        self.__line_buffer.clear()
+        self.__write_buffer.clear()
+
+        # Send the login and all joins at once, without waiting for replies
+        self.login()
+        for line in join_lines(self.__channels):
+            self.send(line, EgressPriority.CONNECTION)
+
+    def disconnect(self) -> None:
+        """Close the connection."""
+        self.__logger.info("Disconnecting from %s", self.__name)
+        self.__is_connected = False
+        self.__disconnected_at = monotonic()
+        self.__backoff.disconnected(self.__disconnected_at)
+        self.__socket.close()
+
+    def schedule_reconnect(self) -> float:
+        """Schedule an attempt to reconnect, using capped exponential backoff. Returns the number of seconds to wait."""
+        wait = self.__backoff.next_wait()
+        self.__reconnect_at = monotonic() + wait
+        return wait
+
+    def login(self) -> None:
+        """Login to the server."""
+        self.__logger.info("Logging in to %s", self.__name)
+        self.send("User {0} {0} {0} :{1}\r\n".format(self.__user, self.__gecos), EgressPriority.CONNECTION)
+        self.send("NICK {0}\r\n".format(self.__nick), EgressPriority.CONNECTION)
+
+    def send(
+            self,
+            message: str,
+            priority: EgressPriority = EgressPriority.COMMAND,
+            key: Optional[str] = None
+    ) -> None:
+        """Send a raw message to the server. Reactions with the same key may be coalesced."""
+        line = message.encode()
+        if len(line) > 512:
+            raise IRCException("Message is too long. Cannot be longer than 512 bytes - was {}".format(len(line)))
+        self.__queue([line], priority, key)
+
+    def __queue(self, lines: List[bytes], priority: EgressPriority, key: Optional[str]) -> None:
+        """Queue encoded lines to be sent, waking up the manager."""
+        with self.__egress_lock:
+            for line in lines:
+                self.__egress_scheduler.put(line, priority, key)
+        if self.__on_queued is not None:
+            self.__on_queued()
+
+    def send_message(self, target: str, message: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a message, split into as many lines as needed."""
+        self.__logger.debug("Sending message to %s on %s", target, self.__name)
+        self.__queue(self.__encoder.encode("PRIVMSG", target, message), priority, target)
+
+    def send_notice(self, target: str, notice: str, priority: EgressPriority = EgressPriority.COMMAND) -> None:
+        """Send a notice, split into as many lines as needed."""
+        self.__logger.debug("Sending notice to %s on %s", target, self.__name)
+        self.__queue(self.__encoder.encode("NOTICE", target, notice), priority, target)
+
+    def join(self, channel: str, ignore_duplicate: bool = False) -> None:
+        """Join a channel."""
+        if not ignore_duplicate and channel in self.__channels:
+            raise IRCException("Already part of that channel")
+
+        self.__channels.add(channel)
+        # Channels are joined once logged in, when connecting
+        if self.__is_connected:
+            self.__logger.info("Joining channel %s on %s", channel, self.__name)
+            self.send("JOIN {}\r\n".format(channel), EgressPriority.CONNECTION)
+
+    def read(self) -> List[IRCBaseMessage]:
+        """Read all available data, returning the parsed messages. PINGs are answered and not returned."""
+        metrics = self.__metrics
+        decoder = self.__decoder
+        received_bytes = self.__socket.try_read_into(self.__line_buffer.buffer)
+        if received_bytes > 0:
+            self.__last_received = monotonic()
+            if metrics is not None:
+                metrics.read_bytes.inc(received_bytes)
+
+        messages = []
+        for raw_line in self.__line_buffer.lines():
+            # Tolerate clients using other encodings than UTF-8, bad input must not stop the ingress
+            line = decoder.decode(raw_line)
+
+            # Tokenize the line once and dispatch it to the parser of its command
+            if metrics is None:
+                message = parse_message(line)
+            else:
+                started = perf_counter()
+                message = parse_message(line)
+                metrics.parse_seconds(type(message)).observe(perf_counter() - started)
+                metrics.read_lines.inc()
+
+            if message is None:
+                self.__logger.debug("Unhandled message on %s: <%s>", self.__name, line)
+            elif isinstance(message, IRCPingMessage):
+                # Handle pinging internally - don't expose it as a message
+                self.__logger.debug("Got PING from %s, responding with PONG", self.__name)
+                self.send("PONG :{}\r\n".format(message.token), EgressPriority.CONNECTION)
+            else:
+                if isinstance(message, IRCJoinMessage):
+                    self.__joined(message)
+                elif isinstance(message, (IRCNickMessage, IRCControlMessage)):
+                    self.__track_nick(message)
+                messages.append(message)
+        return messages
+
+    def __track_nick(self, message: IRCBaseMessage) -> None:
+        """Track the nick of the bot as assigned when registering or changed later, for the prefix of relayed lines."""
+        if isinstance(message, IRCNickMessage):
+            if message.nick.lower() == self.__encoder.nick.lower():
+                self.__encoder.nick = message.new_nick
+        elif isinstance(message, IRCControlMessage) and message.message_type == IRCControlMessageType.RPL_WELCOME:
+            self.__encoder.nick = message.target
+
+    def __joined(self, message: IRCJoinMessage) -> None:
+        """Learn the relayed hostname of the bot from its joins, recording channels rejoined after reconnecting."""
+        if message.nick.lower() != self.__encoder.nick.lower():
+            return
+
+        self.__encoder.learn_hostname(message.hostname)
+        if not self.__rejoining:
+            return
+
+        self.__rejoining.discard(message.channel.lower())
+        if not self.__rejoining:
+            elapsed = monotonic() - self.__rejoin_started
+            self.__logger.info("Rejoined all channels on %s %.2fs after losing the connection", self.__name, elapsed)
+            if self.__metrics is not None:
+                self.__metrics.rejoin_seconds.observe(elapsed)
+
+    def flush(self) -> Optional[float]:
+        """Write as many allowed lines as the socket accepts without waiting.
+
+        Returns the number of seconds until more lines are allowed, if lines are held back by the rate limit.
+        """
+        wait = None
+        if not self.__write_buffer:
+            with self.__egress_lock:
+                batch, wait = self.__egress_scheduler.take(self.__max_write_size)
+            for line in batch:
+                self.__write_buffer += line
+            self.__egress_lines += len(batch)
+
+        if self.__write_buffer:
+            if self.__metrics is None:
+                written_bytes = self.__socket.try_write(memoryview(self.__write_buffer))
+            else:
+                started = perf_counter()
+                written_bytes = self.__socket.try_write(memoryview(self.__write_buffer))
+                self.__metrics.egress_write_seconds.observe(perf_counter() - started)
+            if written_bytes > 0:
+                del self.__write_buffer[:written_bytes]
+                self.__egress_writes += 1
+                self.__egress_bytes += written_bytes
+
+        return wait
+
+
+class IRCManager:
+    """Connections to many networks, multiplexing all reads and writes on a single selector loop."""
+
+    def __init__(self, logger: Optional[Logger] = None) -> None:
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+        self.__selector = selectors.DefaultSelector()
+        self.__networks: Dict[str, IRCNetwork] = {}
+        # The registered file descriptor and events of each connected network
+        self.__registrations: Dict[str, selectors.SelectorKey] = {}
+        self.__should_run = Event()
+
+        # Connecting blocks, so connections are opened by threads and handed back to the loop.
+        # The names of networks being connected, and the networks opened with the error if any
+        self.__connecting: Set[str] = set()
+        self.__opened: Deque[Tuple[IRCNetwork, Optional[Exception]]] = deque()
+
+        # Lines may be queued from other threads, which then wake the loop
+        self.__wake_reader, self.__wake_writer = socket.socketpair()
+        self.__wake_reader.setblocking(False)
+        self.__wake_writer.setblocking(False)
+        self.__selector.register(self.__wake_reader, selectors.EVENT_READ, None)
+
+    @property
+    def networks(self) -> Dict[str, IRCNetwork]:
+        """The managed networks, by name."""
+        return self.__networks
+
+    def add(self, name: str, server: str, port: int, user: str, nick: str, **kwargs) -> IRCNetwork:
+        """Add a network, connected once the loop runs. Takes the same keyword arguments as IRCNetwork."""
+        if name in self.__networks:
+            raise IRCException("A network named {} already exists".format(name))
+
+        kwargs.setdefault("logger", self.__logger)
+        network = IRCNetwork(name, server, port, user, nick, on_queued=self.wake, **kwargs)
+        self.__networks[name] = network
+        return network
+
+    def wake(self) -> None:
+        """Wake the loop, such as when lines are queued from another thread."""
+        try:
+            self.__wake_writer.send(b"\x00")
+        except BlockingIOError:
+            # The loop is already woken
+            pass
+
+    def stop(self) -> None:
+        """Stop the loop and disconnect from all networks."""
+        self.__should_run.clear()
+        self.wake()
+
+    def run(self, on_message: Callable[[IRCNetwork, IRCBaseMessage], None]) -> None:
+        """Run the loop, connecting to all networks and calling on_message for each received message."""
+        self.__should_run.set()
+        for network in self.__networks.values():
+            self.__connect(network)
+
+        while self.__should_run.is_set():
+            timeout = self.__service_networks()
+            for key, events in self.__selector.select(timeout):
+                network = key.data
+                if network is None:
+                    self.__drain_wake()
+                elif events & selectors.EVENT_READ:
+                    self.__read(network, on_message)
+
+        for network in self.__networks.values():
+            if network.is_connected:
+                self.__disconnect(network)
+        # Close connections opened after stopping, those still being opened are left to their threads
+        while self.__opened:
+            network, exception = self.__opened.popleft()
+            if exception is None:
+                network.disconnect()
+
+    def __service_networks(self) -> Optional[float]:
+        """Write, reconnect or time out each network. Returns the number of seconds until it is needed again."""
+        while self.__opened:
+            self.__start(*self.__opened.popleft())
+
+        now = monotonic()
+        deadlines: List[float] = []
+        for network in self.__networks.values():
+            if not network.is_connected:
+                if network.name in self.__connecting:
+                    # The loop is woken once the connection is opened
+                    continue
+                if network.reconnect_at <= now:
+                    self.__connect(network)
+                else:
+                    deadlines.append(network.reconnect_at)
+                continue
+
+            if network.timeout_at <= now:
+                self.__logger.info("Timeout while reading data from %s - reconnecting", network.name)
+                self.__reconnect(network)
+                deadlines.append(network.reconnect_at)
+                continue
+
+            try:
+                wait = network.flush()
+            except IRCSocketException:
+                self.__logger.info("Unable to write to %s - reconnecting", network.name, exc_info=True)
+                self.__reconnect(network)
+                deadlines.append(network.reconnect_at)
+                continue
+
+            deadlines.append(network.timeout_at)
+            if wait is not None:
+                deadlines.append(now + wait)
+
+            # Only wait for the socket to be writable while there are bytes it did not accept
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if network.has_pending_writes else 0)
+            if self.__registrations[network.name].events != events:
+                self.__registrations[network.name] = self.__selector.modify(network.fileno(), events, network)
+
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def __read(self, network: IRCNetwork, on_message: Callable[[IRCNetwork, IRCBaseMessage], None]) -> None:
+        """Read and handle all available messages of a network."""
+        try:
+            messages = network.read()
+        except IRCSocketClosedException:
+            self.__logger.info("Socket of %s has closed, reconnecting", network.name)
+            self.__reconnect(network)
+            return
+
+        for message in messages:
+            try:
+                on_message(network, message)
+            except Exception:  # pylint: disable=broad-except
+                self.__logger.error("Unable to handle message from %s", network.name, exc_info=True)
+
+    def __connect(self, network: IRCNetwork) -> None:
+        """Open a connection to a network in a thread, never blocking the loop on resolving, connecting or TLS."""
+        self.__connecting.add(network.name)
+        thread = Thread(target=self.__open, args=(network,), name="connect-{}".format(network.name))
+        thread.daemon = True
+        thread.start()
+
+    def __open(self, network: IRCNetwork) -> None:
+        """Thread entrypoint opening a connection, handing it back to the loop."""
+        try:
+            network.open()
+            self.__opened.append((network, None))
+        except Exception as exception:  # pylint: disable=broad-except
+            # Any error is handed back, a network must never be left connecting
+            self.__opened.append((network, exception))
+        self.wake()
+
+    def __start(self, network: IRCNetwork, exception: Optional[Exception]) -> None:
+        """Start using an opened connection, scheduling a new attempt if opening it failed."""
+        self.__connecting.discard(network.name)
+        if exception is not None:
+            self.__logger.error("Unable to connect to %s", network.name, exc_info=exception)
+            wait = network.schedule_reconnect()
+            self.__logger.info("Trying to reconnect to %s again in %.1fs", network.name, wait)
+            return
+
+        network.start()
+        self.__registrations[network.name] = self.__selector.register(network.fileno(), selectors.EVENT_READ, network)
+
+    def __disconnect(self, network: IRCNetwork) -> None:
+        """Stop watching and disconnect a network."""
+        registration = self.__registrations.pop(network.name)
+        self.__selector.unregister(registration.fd)
+        network.disconnect()
+
+    def __reconnect(self, network: IRCNetwork) -> None:
+        """Disconnect a network and schedule reconnecting it."""
+        self.__disconnect(network)
+        network.schedule_reconnect()
+
+    def __drain_wake(self) -> None:
+        """Consume the bytes written to wake the loop."""
+        try:
+            while self.__wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
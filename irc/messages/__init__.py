@@ -9,4 +9,10 @@ __package__ = "irc.messages"
 from irc.messages.base import IRCBaseMessage as IRCBaseMessage  # noqa: F401
 from irc.messages.control import IRCControlMessage as IRCControlMessage  # noqa: F401
 from irc.messages.control import IRCControlMessageType as IRCControlMessageType  # noqa: F401
+from irc.messages.membership import IRCJoinMessage as IRCJoinMessage  # noqa: F401
+from irc.messages.membership import IRCKickMessage as IRCKickMessage  # noqa: F401
+from irc.messages.membership import IRCPartMessage as IRCPartMessage  # noqa: F401
 from irc.messages.message import IRCMessage as IRCMessage  # noqa: F401
+from irc.messages.nick import IRCNickMessage as IRCNickMessage  # noqa: F401
+from irc.messages.parser import parse_message as parse_message  # noqa: F401
+from irc.messages.ping import IRCPingMessage as IRCPingMessage  # noqa: F401
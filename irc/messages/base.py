@@ -2,10 +2,17 @@
 
 from typing import Optional
 
+# Lazily parsed messages keep the offsets of their fields into the raw message
+# as unsigned 16-bit integers, longer lines are parsed eagerly
+max_offset = 0xFFFF
+
 
 class IRCBaseMessage():
     """IRC message base class."""
 
+    # Messages may be queued in large numbers, avoid a dictionary per message
+    __slots__ = ("__raw_message",)
+
     def __init__(self, raw_message: str) -> None:
         self.__raw_message = raw_message
 
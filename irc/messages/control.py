@@ -1,10 +1,12 @@
 """IRC control message."""
 
-import re
+import struct
+import sys
 from enum import Enum, unique
-from typing import Optional
+from typing import Dict, Optional
 
-from irc.messages.base import IRCBaseMessage
+from irc.messages.base import IRCBaseMessage, max_offset
+from irc.messages.tokenizer import IRCTokens, tokenize
 
 # Taken from https://www.alien.net.au/irc/irc2numerics.html
 # using the following script:
@@ -15,9 +17,6 @@ from irc.messages.base import IRCBaseMessage
 #   .join('\n')
 # )
 
-# Regex for matching the individual parts of an IRC message
-control_message_regex = re.compile("^:([^ ]+) ([0-9]+) ([^ ]+)( ([^ ]+) )(.*)$")
-
 
 @unique
 class IRCControlMessageType(Enum):
@@ -185,9 +184,22 @@ class IRCControlMessageType(Enum):
     ERR_USERSDONTMATCH = "502"
 
 
+# Lookup of message types by their numeric
+control_message_types: Dict[str, IRCControlMessageType] = {
+    message_type.value: message_type for message_type in IRCControlMessageType
+}
+
+# The start and end of the server, the target and the parameter and the start of the message
+control_message_offsets = struct.Struct("<7H")
+
+
 class IRCControlMessage(IRCBaseMessage):
     """An IRC control message."""
 
+    # Parsed messages only keep the offsets of each field into the raw message,
+    # the fields are sliced from it on first access
+    __slots__ = ("__offsets", "__server", "__message_type", "__target", "__parameter", "__message")
+
     def __init__(  # pylint: disable=too-many-arguments
             self,
             raw_message: str,
@@ -199,16 +211,30 @@ class IRCControlMessage(IRCBaseMessage):
     ) -> None:
         super().__init__(raw_message)
 
-        self.__server = server
+        self.__offsets = b""
+        self.__server: Optional[str] = sys.intern(server)
         self.__message_type = message_type
-        self.__target = target
+        self.__target: Optional[str] = sys.intern(target)
         self.__parameter = parameter
-        self.__message = message
+        self.__message: Optional[str] = message
+
+    def __materialize(self) -> None:
+        """Slice the fields from the raw message."""
+        server_start, server_end, target_start, target_end, parameter_start, parameter_end, message_start = \
+            control_message_offsets.unpack(self.__offsets)
+        line = self.raw_message
+        self.__server = sys.intern(line[server_start:server_end])
+        self.__target = sys.intern(line[target_start:target_end])
+        # A parameter never starts at the beginning of the line, an offset of 0 means there is none
+        self.__parameter = line[parameter_start:parameter_end] if parameter_start else None
+        self.__message = line[message_start:]
 
     @property
     def server(self) -> str:
         """The server the message originated from."""
-        return self.__server
+        if self.__server is None:
+            self.__materialize()
+        return self.__server  # type: ignore
 
     @property
     def message_type(self) -> IRCControlMessageType:
@@ -218,39 +244,84 @@ class IRCControlMessage(IRCBaseMessage):
     @property
     def target(self) -> str:
         """The message's target."""
-        return self.__target
+        if self.__target is None:
+            self.__materialize()
+        return self.__target  # type: ignore
 
     @property
     def parameter(self) -> Optional[str]:
         """The message's parameter if set."""
+        if self.__server is None:
+            self.__materialize()
         return self.__parameter
 
     @property
     def message(self) -> str:
         """The message itself."""
-        return self.__message
+        if self.__message is None:
+            self.__materialize()
+        return self.__message  # type: ignore
 
     def __str__(self) -> str:
         """String representation of the message."""
         return ":{} {} {}{} {}".format(
-            self.__server,
+            self.server,
             self.__message_type.value,
-            self.__target,
-            " " + self.__parameter if self.__parameter else "",
-            self.__message
+            self.target,
+            " " + self.parameter if self.parameter else "",
+            self.message
         )
 
     @staticmethod
     def parse(line: str) -> Optional["IRCControlMessage"]:
         """Parse a message."""
-        match = control_message_regex.match(line)
-        if not match:
+        tokens = tokenize(line)
+        if tokens is None:
             return None
 
-        server, raw_type, target, _, parameter, message = match.groups()
-        try:
-            message_type = IRCControlMessageType(raw_type)
-        except ValueError:
+        return IRCControlMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCControlMessage"]:
+        """Create a message from a tokenized line."""
+        message_type = control_message_types.get(tokens.command)
+        prefix = tokens.prefix
+        if message_type is None or prefix is None:
             return None
 
-        return IRCControlMessage(line, server, message_type, target, parameter, message)
+        # The parameter is the word following the target, the message is the
+        # raw text following that
+        params_offset = tokens.params_offset
+        parts = line[params_offset:].split(" ", 2)
+        target = parts[0]
+        if len(parts) == 3:
+            parameter: Optional[str] = parts[1]
+            message = parts[2]
+        else:
+            parameter = None
+            message = parts[1] if len(parts) == 2 else ""
+
+        if len(line) > max_offset:
+            return IRCControlMessage(line, prefix, message_type, target, parameter, message)
+
+        target_end = params_offset + len(target)
+        parameter_start = target_end + 1 if parameter is not None else 0
+        parameter_end = parameter_start + len(parameter) if parameter is not None else 0
+
+        parsed_message = IRCControlMessage.__new__(IRCControlMessage)
+        IRCBaseMessage.__init__(parsed_message, line)
+        parsed_message.__offsets = control_message_offsets.pack(
+            tokens.prefix_offset,
+            tokens.prefix_offset + len(prefix),
+            params_offset,
+            target_end,
+            parameter_start,
+            parameter_end,
+            len(line) - len(message)
+        )
+        parsed_message.__server = None
+        parsed_message.__message_type = message_type
+        parsed_message.__target = None
+        parsed_message.__parameter = None
+        parsed_message.__message = None
+        return parsed_message
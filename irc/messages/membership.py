@@ -0,0 +1,185 @@
+"""IRC channel membership messages."""
+
+import sys
+from typing import Optional
+
+from irc.messages.base import IRCBaseMessage
+from irc.messages.tokenizer import IRCTokens, split_prefix, tokenize
+
+
+class IRCJoinMessage(IRCBaseMessage):
+    """A user joining a channel."""
+
+    __slots__ = ("__nick", "__hostname", "__channel")
+
+    def __init__(self, raw_message: str, nick: str, hostname: str, channel: str) -> None:
+        super().__init__(raw_message)
+
+        self.__nick = sys.intern(nick)
+        self.__hostname = sys.intern(hostname)
+        self.__channel = sys.intern(channel)
+
+    @property
+    def nick(self) -> str:
+        """The nick of the user."""
+        return self.__nick
+
+    @property
+    def hostname(self) -> str:
+        """The hostname of the user."""
+        return self.__hostname
+
+    @property
+    def channel(self) -> str:
+        """The channel joined."""
+        return self.__channel
+
+    def __str__(self) -> str:
+        """String representation of the message."""
+        return "JOIN {} : {}".format(self.__nick, self.__channel)
+
+    @staticmethod
+    def parse(line: str) -> Optional["IRCJoinMessage"]:
+        """Parse a message."""
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCJoinMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCJoinMessage"]:
+        """Create a message from a tokenized line."""
+        if tokens.command != "JOIN" or tokens.prefix is None or len(tokens.params) < 1:
+            return None
+
+        nick, hostname = split_prefix(tokens.prefix)
+        return IRCJoinMessage(line, nick, hostname, tokens.params[0])
+
+
+class IRCPartMessage(IRCBaseMessage):
+    """A user leaving a channel."""
+
+    __slots__ = ("__nick", "__hostname", "__channel", "__reason")
+
+    def __init__(self, raw_message: str, nick: str, hostname: str, channel: str, reason: Optional[str]) -> None:
+        super().__init__(raw_message)
+
+        self.__nick = sys.intern(nick)
+        self.__hostname = sys.intern(hostname)
+        self.__channel = sys.intern(channel)
+        self.__reason = reason
+
+    @property
+    def nick(self) -> str:
+        """The nick of the user."""
+        return self.__nick
+
+    @property
+    def hostname(self) -> str:
+        """The hostname of the user."""
+        return self.__hostname
+
+    @property
+    def channel(self) -> str:
+        """The channel left."""
+        return self.__channel
+
+    @property
+    def reason(self) -> Optional[str]:
+        """The reason for leaving, if given."""
+        return self.__reason
+
+    def __str__(self) -> str:
+        """String representation of the message."""
+        return "PART {} : {}".format(self.__nick, self.__channel)
+
+    @staticmethod
+    def parse(line: str) -> Optional["IRCPartMessage"]:
+        """Parse a message."""
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCPartMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCPartMessage"]:
+        """Create a message from a tokenized line."""
+        if tokens.command != "PART" or tokens.prefix is None or len(tokens.params) < 1:
+            return None
+
+        nick, hostname = split_prefix(tokens.prefix)
+        reason = tokens.params[1] if len(tokens.params) > 1 else None
+        return IRCPartMessage(line, nick, hostname, tokens.params[0], reason)
+
+
+class IRCKickMessage(IRCBaseMessage):
+    """A user being kicked from a channel."""
+
+    __slots__ = ("__nick", "__hostname", "__channel", "__kicked_nick", "__reason")
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            raw_message: str,
+            nick: str,
+            hostname: str,
+            channel: str,
+            kicked_nick: str,
+            reason: Optional[str]
+    ) -> None:
+        super().__init__(raw_message)
+
+        self.__nick = sys.intern(nick)
+        self.__hostname = sys.intern(hostname)
+        self.__channel = sys.intern(channel)
+        self.__kicked_nick = sys.intern(kicked_nick)
+        self.__reason = reason
+
+    @property
+    def nick(self) -> str:
+        """The nick of the user kicking."""
+        return self.__nick
+
+    @property
+    def hostname(self) -> str:
+        """The hostname of the user kicking."""
+        return self.__hostname
+
+    @property
+    def channel(self) -> str:
+        """The channel the user was kicked from."""
+        return self.__channel
+
+    @property
+    def kicked_nick(self) -> str:
+        """The nick of the kicked user."""
+        return self.__kicked_nick
+
+    @property
+    def reason(self) -> Optional[str]:
+        """The reason for the kick, if given."""
+        return self.__reason
+
+    def __str__(self) -> str:
+        """String representation of the message."""
+        return "KICK {} : {} {}".format(self.__nick, self.__channel, self.__kicked_nick)
+
+    @staticmethod
+    def parse(line: str) -> Optional["IRCKickMessage"]:
+        """Parse a message."""
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCKickMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCKickMessage"]:
+        """Create a message from a tokenized line."""
+        if tokens.command != "KICK" or tokens.prefix is None or len(tokens.params) < 2:
+            return None
+
+        nick, hostname = split_prefix(tokens.prefix)
+        reason = tokens.params[2] if len(tokens.params) > 2 else None
+        return IRCKickMessage(line, nick, hostname, tokens.params[0], tokens.params[1], reason)
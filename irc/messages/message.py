@@ -1,17 +1,24 @@
 """IRC message."""
 
-import re
+import struct
+import sys
 from typing import Optional
 
-from irc.messages.base import IRCBaseMessage
+from irc.messages.base import IRCBaseMessage, max_offset
+from irc.messages.tokenizer import IRCTokens, tokenize
 
-# Regex for matching the individual parts of an IRC message
-private_message_regex = re.compile("^:([^!]+)!(.*?) (PRIVMSG|NOTICE) ([^ ]+) :(.*)")
+# The start and end of the author, the end of the hostname, the start and end
+# of the target and the start and end of the message
+message_offsets = struct.Struct("<7H")
 
 
 class IRCMessage(IRCBaseMessage):
     """An IRC private message."""
 
+    # Parsed messages only keep the offsets of each field into the raw message,
+    # the fields are sliced from it on first access
+    __slots__ = ("__offsets", "__author", "__hostname", "__is_notice", "__target", "__message")
+
     def __init__(  # pylint: disable=too-many-arguments
             self,
             raw_message: str,
@@ -23,21 +30,36 @@ class IRCMessage(IRCBaseMessage):
     ) -> None:
         super().__init__(raw_message)
 
-        self.__author = author
-        self.__hostname = hostname
+        self.__offsets = b""
+        self.__author: Optional[str] = sys.intern(author)
+        self.__hostname: Optional[str] = sys.intern(hostname)
         self.__is_notice = is_notice
-        self.__target = target
-        self.__message = message
+        self.__target: Optional[str] = sys.intern(target)
+        self.__message: Optional[str] = message
+
+    def __materialize(self) -> None:
+        """Slice the fields from the raw message."""
+        author_start, author_end, hostname_end, target_start, target_end, message_start, message_end = \
+            message_offsets.unpack(self.__offsets)
+        line = self.raw_message
+        self.__author = sys.intern(line[author_start:author_end])
+        self.__hostname = sys.intern(line[author_end + 1:hostname_end])
+        self.__target = sys.intern(line[target_start:target_end])
+        self.__message = line[message_start:message_end]
 
     @property
     def author(self) -> str:
         """The author of the message."""
-        return self.__author
+        if self.__author is None:
+            self.__materialize()
+        return self.__author  # type: ignore
 
     @property
     def hostname(self) -> str:
         """The hostname of the message's author."""
-        return self.__hostname
+        if self.__hostname is None:
+            self.__materialize()
+        return self.__hostname  # type: ignore
 
     @property
     def is_notice(self) -> bool:
@@ -47,26 +69,67 @@ class IRCMessage(IRCBaseMessage):
     @property
     def target(self) -> str:
         """The target of the message."""
-        return self.__target
+        if self.__target is None:
+            self.__materialize()
+        return self.__target  # type: ignore
 
     @property
     def message(self) -> str:
         """The message itself."""
-        return self.__message
+        if self.__message is None:
+            self.__materialize()
+        return self.__message  # type: ignore
 
     def __str__(self) -> str:
         """String representation of the message."""
         if self.__is_notice:
-            return "NOTICE {} : {}".format(self.__author, self.__message)
-        return "PRIVMSG {} : {}".format(self.__author, self.__message)
+            return "NOTICE {} : {}".format(self.author, self.message)
+        return "PRIVMSG {} : {}".format(self.author, self.message)
 
     @staticmethod
     def parse(line: str) -> Optional["IRCMessage"]:
         """Parse a message."""
-        match = private_message_regex.match(line)
-        if not match:
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCMessage"]:
+        """Create a message from a tokenized line."""
+        _, prefix, command, params, params_offset, prefix_offset = tokens
+        if prefix is None or len(params) != 2 or command not in ("PRIVMSG", "NOTICE"):
+            return None
+
+        # Only messages sent by users are handled, not those sent by the server
+        author_length = prefix.find("!")
+        if author_length < 1:
             return None
 
-        author, hostname, type, target, message = match.groups()
-        is_notice = type == "NOTICE"
-        return IRCMessage(line, author, hostname, is_notice, target, message)
+        target, message = params
+        if len(line) > max_offset:
+            author, _, hostname = prefix.partition("!")
+            return IRCMessage(line, author, hostname, command == "NOTICE", target, message)
+
+        # The message is the trailing parameter, or the last word of the line
+        message_start = len(line) - len(message) if line.endswith(message) \
+            else line.find(message, params_offset + len(target))
+
+        parsed_message = IRCMessage.__new__(IRCMessage)
+        IRCBaseMessage.__init__(parsed_message, line)
+        parsed_message.__offsets = message_offsets.pack(
+            prefix_offset,
+            prefix_offset + author_length,
+            prefix_offset + len(prefix),
+            params_offset,
+            params_offset + len(target),
+            message_start,
+            message_start + len(message)
+        )
+        parsed_message.__author = None
+        parsed_message.__hostname = None
+        parsed_message.__is_notice = command == "NOTICE"
+        parsed_message.__target = None
+        parsed_message.__message = None
+        return parsed_message
@@ -0,0 +1,57 @@
+"""IRC nick change message."""
+
+import sys
+from typing import Optional
+
+from irc.messages.base import IRCBaseMessage
+from irc.messages.tokenizer import IRCTokens, split_prefix, tokenize
+
+
+class IRCNickMessage(IRCBaseMessage):
+    """A user changing nick."""
+
+    __slots__ = ("__nick", "__hostname", "__new_nick")
+
+    def __init__(self, raw_message: str, nick: str, hostname: str, new_nick: str) -> None:
+        super().__init__(raw_message)
+
+        self.__nick = sys.intern(nick)
+        self.__hostname = sys.intern(hostname)
+        self.__new_nick = sys.intern(new_nick)
+
+    @property
+    def nick(self) -> str:
+        """The previous nick of the user."""
+        return self.__nick
+
+    @property
+    def hostname(self) -> str:
+        """The hostname of the user."""
+        return self.__hostname
+
+    @property
+    def new_nick(self) -> str:
+        """The new nick of the user."""
+        return self.__new_nick
+
+    def __str__(self) -> str:
+        """String representation of the message."""
+        return "NICK {} : {}".format(self.__nick, self.__new_nick)
+
+    @staticmethod
+    def parse(line: str) -> Optional["IRCNickMessage"]:
+        """Parse a message."""
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCNickMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCNickMessage"]:
+        """Create a message from a tokenized line."""
+        if tokens.command != "NICK" or tokens.prefix is None or len(tokens.params) < 1:
+            return None
+
+        nick, hostname = split_prefix(tokens.prefix)
+        return IRCNickMessage(line, nick, hostname, tokens.params[0])
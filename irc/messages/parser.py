@@ -0,0 +1,36 @@
+"""Parsing of IRC lines into messages."""
+
+from typing import Callable, Dict, Optional
+
+from irc.messages.base import IRCBaseMessage
+from irc.messages.control import IRCControlMessage, control_message_types
+from irc.messages.membership import IRCJoinMessage, IRCKickMessage, IRCPartMessage
+from irc.messages.message import IRCMessage
+from irc.messages.nick import IRCNickMessage
+from irc.messages.ping import IRCPingMessage
+from irc.messages.tokenizer import IRCTokens, tokenize
+
+# Constructors of messages by command, each line is dispatched once to its constructor
+message_parsers: Dict[str, Callable[[str, IRCTokens], Optional[IRCBaseMessage]]] = {
+    "PRIVMSG": IRCMessage.from_tokens,
+    "NOTICE": IRCMessage.from_tokens,
+    "PING": IRCPingMessage.from_tokens,
+    "JOIN": IRCJoinMessage.from_tokens,
+    "PART": IRCPartMessage.from_tokens,
+    "KICK": IRCKickMessage.from_tokens,
+    "NICK": IRCNickMessage.from_tokens,
+    **{numeric: IRCControlMessage.from_tokens for numeric in control_message_types}
+}
+
+
+def parse_message(line: str) -> Optional[IRCBaseMessage]:
+    """Parse a line into a message. Returns None if the line is unsupported."""
+    tokens = tokenize(line)
+    if tokens is None:
+        return None
+
+    parser = message_parsers.get(tokens.command)
+    if parser is None:
+        return None
+
+    return parser(line, tokens)
@@ -0,0 +1,43 @@
+"""IRC ping message."""
+
+from typing import Optional
+
+from irc.messages.base import IRCBaseMessage
+from irc.messages.tokenizer import IRCTokens, tokenize
+
+
+class IRCPingMessage(IRCBaseMessage):
+    """A PING sent by the server to check that the connection is alive."""
+
+    __slots__ = ("__token",)
+
+    def __init__(self, raw_message: str, token: str) -> None:
+        super().__init__(raw_message)
+
+        self.__token = token
+
+    @property
+    def token(self) -> str:
+        """The token to send back in the PONG reply."""
+        return self.__token
+
+    def __str__(self) -> str:
+        """String representation of the message."""
+        return "PING :{}".format(self.__token)
+
+    @staticmethod
+    def parse(line: str) -> Optional["IRCPingMessage"]:
+        """Parse a message."""
+        tokens = tokenize(line)
+        if tokens is None:
+            return None
+
+        return IRCPingMessage.from_tokens(line, tokens)
+
+    @staticmethod
+    def from_tokens(line: str, tokens: IRCTokens) -> Optional["IRCPingMessage"]:
+        """Create a message from a tokenized line."""
+        if tokens.command != "PING":
+            return None
+
+        return IRCPingMessage(line, tokens.params[-1] if tokens.params else "")
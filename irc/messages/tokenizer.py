@@ -0,0 +1,54 @@
+"""Single-pass tokenizer of IRC lines."""
+
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Matches the optional tags, the optional prefix and the command, in a single pass
+line_regex = re.compile(r"(?:@([^ ]+) +)?(?::([^ ]+) +)?([^ :@][^ ]*) *")
+
+
+class IRCTokens(NamedTuple):
+    """The parts of an IRC line, as described by RFC 1459 and IRCv3."""
+
+    # The raw IRCv3 tags, without the leading "@"
+    tags: Optional[str]
+    # The prefix, without the leading ":"
+    prefix: Optional[str]
+    # The command, in upper case
+    command: str
+    # The parameters, the last one being the trailing parameter if given
+    params: List[str]
+    # The offset of the parameters in the line, for parsers relying on the raw text
+    params_offset: int
+    # The offset of the prefix in the line, or -1 if there is no prefix
+    prefix_offset: int
+
+
+def tokenize(line: str) -> Optional[IRCTokens]:
+    """Split a line into its tags, prefix, command and parameters."""
+    match = line_regex.match(line)
+    if match is None:
+        return None
+
+    tags, prefix, command = match.groups()
+    params_offset = match.end()
+
+    # Everything after the first " :" is the trailing parameter, which may contain spaces
+    rest = line[params_offset:]
+    if rest[:1] == ":":
+        params = [rest[1:]]
+    else:
+        middle, separator, trailing = rest.partition(" :")
+        params = middle.split()
+        if separator:
+            params.append(trailing)
+
+    return IRCTokens(tags, prefix, command.upper(), params, params_offset, match.start(2))
+
+
+def split_prefix(prefix: Optional[str]) -> Tuple[str, str]:
+    """Split a prefix such as "nick!user@host" into the nick and hostname."""
+    if prefix is None:
+        return "", ""
+    nick, _, hostname = prefix.partition("!")
+    return nick, hostname
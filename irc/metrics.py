@@ -0,0 +1,334 @@
+"""Cheap counters, gauges and fixed-bucket histograms, served in the Prometheus text format."""
+
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+from threading import Lock, Thread
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar, Union
+
+# Upper bounds, in seconds, of the buckets of histograms timing work in the hot paths
+default_buckets = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Upper bounds, in seconds, of the buckets of histograms timing reconnects
+reconnect_buckets = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+class Counter:
+    """A value which only ever increases.
+
+    Updated without locking. Under contention an increment from another thread may rarely be lost.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the value."""
+        self.value += amount
+
+
+class Gauge:
+    """A value which may go up and down, either set or read from a function when collected."""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        """Set the value."""
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from a function when collected, costing nothing until then."""
+        self.function = function
+
+    def get(self) -> float:
+        """The current value."""
+        return self.value if self.function is None else self.function()
+
+
+class Histogram:
+    """Observed values counted in fixed buckets.
+
+    Updated without locking. Under contention an observation from another thread may rarely be lost.
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        # The last count holds values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Count a value in the first bucket whose upper bound it does not exceed."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+Metric = TypeVar("Metric", Counter, Gauge, Histogram)
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Format label pairs, escaping the values."""
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricFamily(Generic[Metric]):
+    """A named metric, holding one child metric per combination of label values."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self,
+            name: str,
+            description: str,
+            kind: str,
+            label_names: Sequence[str],
+            create: Callable[[], Metric]
+    ) -> None:
+        self.__name = name
+        self.__description = description
+        self.__kind = kind
+        self.__label_names = tuple(label_names)
+        self.__create = create
+
+        self.__lock = Lock()
+        self.__children: Dict[Tuple[str, ...], Metric] = {}
+
+    @property
+    def name(self) -> str:
+        """The name of the metric."""
+        return self.__name
+
+    @property
+    def kind(self) -> str:
+        """The Prometheus type of the metric, such as "counter"."""
+        return self.__kind
+
+    @property
+    def label_names(self) -> Tuple[str, ...]:
+        """The names of the labels of the metric."""
+        return self.__label_names
+
+    def labels(self, *values: str) -> Metric:
+        """The child metric of the label values, created on first use. Keep it to avoid looking it up again."""
+        child = self.__children.get(values)
+        if child is None:
+            if len(values) != len(self.__label_names):
+                raise ValueError("Expected {} label values for {}".format(len(self.__label_names), self.__name))
+            with self.__lock:
+                child = self.__children.setdefault(values, self.__create())
+        return child
+
+    def render(self) -> List[str]:
+        """Render the metric in the Prometheus text format."""
+        lines = [
+            "# HELP {} {}".format(self.__name, self.__description),
+            "# TYPE {} {}".format(self.__name, self.__kind)
+        ]
+        with self.__lock:
+            children = list(self.__children.items())
+
+        for values, child in children:
+            labels = _format_labels(self.__label_names, values)
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(self.__label_names + ("le",), values + (_format_value(bound),))
+                    lines.append("{}_bucket{} {}".format(self.__name, bucket_labels, cumulative))
+                lines.append("{}_sum{} {}".format(self.__name, labels, _format_value(child.sum)))
+                lines.append("{}_count{} {}".format(self.__name, labels, cumulative))
+            elif isinstance(child, Gauge):
+                lines.append("{}{} {}".format(self.__name, labels, _format_value(child.get())))
+            else:
+                lines.append("{}{} {}".format(self.__name, labels, _format_value(child.value)))
+        return lines
+
+
+class Metrics:
+    """A registry of metrics. Registering a metric twice returns the first registration."""
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__families: Dict[str, MetricFamily] = {}
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> MetricFamily[Counter]:
+        """Register a counter."""
+        return self.__register(name, description, "counter", label_names, Counter)
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> MetricFamily[Gauge]:
+        """Register a gauge."""
+        return self.__register(name, description, "gauge", label_names, Gauge)
+
+    def histogram(
+            self,
+            name: str,
+            description: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = default_buckets
+    ) -> MetricFamily[Histogram]:
+        """Register a histogram with fixed buckets."""
+        return self.__register(name, description, "histogram", label_names, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        with self.__lock:
+            families = list(self.__families.values())
+        return "".join(line + "\n" for family in families for line in family.render())
+
+    def __register(
+            self,
+            name: str,
+            description: str,
+            kind: str,
+            label_names: Sequence[str],
+            create: Callable[[], Union[Counter, Gauge, Histogram]]
+    ) -> MetricFamily:
+        """Register a metric, or return the one already registered."""
+        with self.__lock:
+            family = self.__families.get(name)
+            if family is None:
+                family = MetricFamily(name, description, kind, label_names, create)
+                self.__families[name] = family
+            elif family.kind != kind or family.label_names != tuple(label_names):
+                raise ValueError("Metric {} is already registered as a different metric".format(name))
+            return family
+
+
+class ConnectionMetrics:  # pylint: disable=too-many-instance-attributes
+    """The metrics of a connection to a network, looked up once to keep recording cheap."""
+
+    def __init__(self, metrics: Metrics, network: str) -> None:
+        self.__network = network
+
+        self.read_bytes = metrics.counter(
+            "irc_read_bytes_total", "Bytes read from the server", ("network",)
+        ).labels(network)
+        self.read_lines = metrics.counter(
+            "irc_read_lines_total", "Lines read from the server", ("network",)
+        ).labels(network)
+        self.reconnects = metrics.counter(
+            "irc_reconnects_total", "Reconnects to the server", ("network",)
+        ).labels(network)
+        self.reconnect_seconds = metrics.histogram(
+            "irc_reconnect_seconds", "Seconds from losing the connection to being reconnected", ("network",),
+            buckets=reconnect_buckets
+        ).labels(network)
+        self.rejoin_seconds = metrics.histogram(
+            "irc_rejoin_seconds", "Seconds from losing the connection to having rejoined all channels", ("network",),
+            buckets=reconnect_buckets
+        ).labels(network)
+        tls_handshakes = metrics.counter(
+            "irc_tls_handshakes_total", "TLS handshakes, by whether or not the previous session was resumed", ("network", "resumed")
+        )
+        self.tls_full_handshakes = tls_handshakes.labels(network, "false")
+        self.tls_resumed_handshakes = tls_handshakes.labels(network, "true")
+        self.egress_write_seconds = metrics.histogram(
+            "irc_egress_write_seconds", "Seconds spent writing a batch of lines", ("network",)
+        ).labels(network)
+
+        self.__parse_seconds = metrics.histogram(
+            "irc_parse_seconds", "Seconds spent parsing a line, by the type of message", ("network", "type")
+        )
+        self.__parse_seconds_by_type: Dict[type, Histogram] = {}
+        self.__queue_depth = metrics.gauge(
+            "irc_queue_depth", "Number of queued messages or lines", ("network", "queue")
+        )
+
+    def parse_seconds(self, message_type: type) -> Histogram:
+        """The histogram of parse times of a type of message."""
+        histogram = self.__parse_seconds_by_type.get(message_type)
+        if histogram is None:
+            name = "unhandled" if message_type is type(None) else message_type.__name__
+            histogram = self.__parse_seconds.labels(self.__network, name)
+            self.__parse_seconds_by_type[message_type] = histogram
+        return histogram
+
+    def track_queue_depth(self, queue: str, depth: Callable[[], float]) -> None:
+        """Read the depth of a queue when collected."""
+        self.__queue_depth.labels(self.__network, queue).set_function(depth)
+
+
+class MetricsServer:
+    """Serves metrics over HTTP in a background thread."""
+
+    def __init__(
+            self,
+            metrics: Metrics,
+            host: str = "127.0.0.1",
+            port: int = 9100,
+            logger: Optional[Logger] = None
+    ) -> None:
+        self.__metrics = metrics
+        self.__logger = logging.getLogger(__name__) if logger is None else logger
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Responds with the metrics to any GET request."""
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """Handle a GET request."""
+                body = server.metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+                """Log requests at the debug level."""
+                server.logger.debug("Metrics request: " + format, *args)
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread: Optional[Thread] = None
+
+    @property
+    def metrics(self) -> Metrics:
+        """The served metrics."""
+        return self.__metrics
+
+    @property
+    def logger(self) -> Logger:
+        """The logger of the server."""
+        return self.__logger
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """The host and port the server listens on."""
+        host, port = self.__server.server_address[:2]
+        return str(host), int(port)
+
+    def start(self) -> None:
+        """Start serving in a background thread."""
+        self.__logger.info("Serving metrics on http://%s:%d/metrics", *self.address)
+        self.__thread = Thread(target=self.__server.serve_forever, name="metrics")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
@@ -1,14 +1,40 @@
 """Module for abstracting low-level sockets."""
 
 import logging
+import selectors
 import socket
 from logging import Logger
-from select import select
-from ssl import SSLError, SSLWantReadError, SSLWantWriteError, create_default_context
+from ssl import SSLContext, SSLSession, SSLSocket, SSLWantReadError, SSLWantWriteError, create_default_context
 from typing import Optional
 
+from irc.connector import Connector
 from irc.exception import IRCSocketClosedException, IRCSocketException
 
+# The number of bytes received per call to the underlaying socket
+receive_buffer_size = 16384
+
+
+class _Readiness:
+    """A persistent selector registration for waiting on one direction of a socket, used by a single thread.
+
+    The socket is registered once per connection, not on every wait.
+    """
+
+    def __init__(self, events: int) -> None:
+        self.__selector = selectors.DefaultSelector()
+        self.__events = events
+        self.__registered: Optional[socket.socket] = None
+
+    def wait(self, raw_socket: socket.socket, timeout: float) -> bool:
+        """Wait for the socket to be ready. Returns whether or not it became ready in time."""
+        if raw_socket is not self.__registered:
+            if self.__registered is not None:
+                # The previous socket may be closed, selectors tolerate that
+                self.__selector.unregister(self.__registered)
+            self.__selector.register(raw_socket, self.__events)
+            self.__registered = raw_socket
+        return len(self.__selector.select(timeout)) > 0
+
 
 class Socket:
     """Socket."""
@@ -19,7 +45,8 @@ class Socket:
             port: int,
             timeout: Optional[float] = socket.getdefaulttimeout(),
             use_tls: bool = True,
-            logger: Optional[Logger] = None
+            logger: Optional[Logger] = None,
+            connector: Optional[Connector] = None
     ) -> None:
         self.__server = server
         self.__port = port
@@ -27,28 +54,69 @@ class Socket:
         self.__use_tls = use_tls
         self.__logger = logging.getLogger(__name__) if logger is None else logger
         self.__socket: socket.socket
+        self.__is_open = False
 
-    def __wait_for_read(self, raw_socket: socket.socket, timeout: float) -> None:
-        """Wait for the socket to be readable."""
-        self.__logger.debug("Waiting for socket to be readable")
-        ready_to_read, _, _ = select([raw_socket], [], [], timeout)
-        if raw_socket not in ready_to_read:
-            raise IRCSocketException("Socket operation timed out")
+        # Races the addresses of the server, remembering addresses which failed
+        self.__connector = Connector(logger=self.__logger) if connector is None else connector
+
+        # A single TLS context is kept for all connections, resuming the session of the last one
+        self.__tls_context: Optional[SSLContext] = create_default_context() if use_tls else None
+        self.__tls_session: Optional[SSLSession] = None
+        self.__session_reused = False
+
+        # Reusable buffer for received data
+        self.__receive_buffer = bytearray(receive_buffer_size)
+        self.__receive_view = memoryview(self.__receive_buffer)
+
+        # Waits for the socket to become readable or writable, each used by a single thread
+        self.__readable = _Readiness(selectors.EVENT_READ)
+        self.__writable = _Readiness(selectors.EVENT_WRITE)
+
+        # The number of calls made to send and receive data on the underlaying socket, and to wait for data
+        self.__send_calls = 0
+        self.__receive_calls = 0
+        self.__wait_calls = 0
+
+    @property
+    def connector(self) -> Connector:
+        """The connector racing the addresses of the server, keeping the outcome of each address."""
+        return self.__connector
+
+    @property
+    def session_reused(self) -> bool:
+        """Whether or not the TLS session of the previous connection was resumed, skipping a full handshake."""
+        return self.__session_reused
+
+    @property
+    def send_calls(self) -> int:
+        """The number of calls made to send data, each being a system call."""
+        return self.__send_calls
+
+    @property
+    def receive_calls(self) -> int:
+        """The number of calls made to receive data, each being a system call."""
+        return self.__receive_calls
+
+    @property
+    def wait_calls(self) -> int:
+        """The number of waits for data, each being a system call."""
+        return self.__wait_calls
 
     def __wait_for_write(self, raw_socket: socket.socket, timeout: float) -> None:
         """Wait for the socket to be writable."""
         self.__logger.debug("Waiting for socket to be writable")
-        _, ready_to_write, _ = select([], [raw_socket], [], timeout)
-        if raw_socket not in ready_to_write:
+        if not self.__writable.wait(raw_socket, timeout):
             raise IRCSocketException("Socket operation timed out")
 
     def write(self, data: bytes) -> None:
         """Write bytes to a socket."""
-        data_to_send = data
+        # Slice a view of the data, not copying the rest after each partial send
+        data_to_send = memoryview(data)
         total_bytes = len(data_to_send)
         self.__logger.debug("Writing %d bytes", total_bytes)
         while len(data_to_send) > 0:
             try:
+                self.__send_calls += 1
                 sent_bytes = self.__socket.send(data_to_send)
                 data_to_send = data_to_send[sent_bytes:]
                 self.__logger.debug("Wrote %d bytes", sent_bytes)
@@ -69,109 +137,124 @@ class Socket:
 
         self.__logger.debug("Done writing. Wrote %d bytes", total_bytes)
 
-    def read(self, bytes_to_read: int) -> Optional[bytes]:
-        """Read at most bytes_to_read bytes from a socket. Use -1 to read all."""
-        received_bytes = bytes()
-        self.__logger.debug("Reading at most %d bytes", bytes_to_read)
+    def read_into(self, buffer: bytearray, bytes_to_read: int = -1) -> int:
+        """Read at most bytes_to_read bytes available from a socket without waiting, appending them to a buffer.
 
+        Use -1 to read all available bytes. Returns the number of bytes read, 0 if none were available.
+        """
+        raw_socket = self.__socket
+        tls = isinstance(raw_socket, SSLSocket)
+        total_bytes = 0
         bytes_left = bytes_to_read
         while bytes_left != 0:
+            # Receive into the reusable buffer, only copying the received bytes
+            size = receive_buffer_size if bytes_left < 0 else min(bytes_left, receive_buffer_size)
             try:
-                received_part = self.__socket.recv(4096)
-                self.__logger.debug("Read %d bytes", len(received_part))
-
-                # Check if the server killed the connection
-                if len(received_part) == 0:
-                    raise IRCSocketClosedException("Server killed the connection")
-
-                received_bytes += received_part
-                bytes_left = bytes_left - len(received_part)
-            except SSLWantReadError:
-                # Waiting for socket to be readable before continuing
-                # Use a much lower timeout here, since this may occur
-                # at the end of a call, when no more data is available
-                try:
-                    self.__wait_for_read(self.__socket, 0.1)
-                except IRCSocketException:
-                    break
+                self.__receive_calls += 1
+                received_bytes = raw_socket.recv_into(self.__receive_view, size)
+            except (SSLWantReadError, SSLWantWriteError, BlockingIOError):
+                # Nothing left to read, return right away instead of waiting for more
+                break
             except (ConnectionResetError, BrokenPipeError) as exception:
                 raise IRCSocketClosedException("Lost connection to server") from exception
-            except BlockingIOError:
-                # Waiting for socket to be readable before continuing
-                # Use a much lower timeout here, since this may occur
-                # at the end of a call, when no more data is available
-                try:
-                    self.__wait_for_read(self.__socket, 0.1)
-                except IRCSocketException:
-                    break
-            except IRCSocketException as exception:
-                raise exception
 
-        if len(received_bytes) == 0:
-            self.__logger.debug("Read nothing")
-            return None
+            # Check if the server killed the connection
+            if received_bytes == 0:
+                raise IRCSocketClosedException("Server killed the connection")
+
+            buffer += self.__receive_view[:received_bytes]
+            total_bytes += received_bytes
+            bytes_left -= received_bytes
 
-        self.__logger.debug("Done reading. Read %d bytes", len(received_bytes))
-        return received_bytes
+            # A short read emptied the socket, unless TLS has decrypted bytes left. Skip the call only
+            # to learn that nothing is left, anything arriving meanwhile makes the socket readable again
+            if received_bytes < size and not (tls and raw_socket.pending() > 0):
+                break
+
+        self.__logger.debug("Read %d bytes", total_bytes)
+        return total_bytes
+
+    def read(self, bytes_to_read: int) -> Optional[bytes]:
+        """Read at most bytes_to_read bytes from a socket. Use -1 to read all."""
+        received_bytes = bytearray()
+        if self.read_into(received_bytes, bytes_to_read) == 0:
+            return None
+        return bytes(received_bytes)
 
     def read_all(self) -> Optional[bytes]:
         """Read all data available."""
         return self.read(-1)
 
-    def __upgrade_socket(self, raw_socket: socket.socket) -> socket.socket:
-        """Upgrade a socket for TLS."""
-        self.__logger.debug("Upgrading socket for TLS")
-
-        # Create a TLS context and wrap the raw socket
-        tls_context = create_default_context()
-        tls_socket = tls_context.wrap_socket(
+    def __wrap_socket(self, raw_socket: socket.socket) -> SSLSocket:
+        """Wrap a connected socket for TLS, offering to resume the session of the previous connection."""
+        assert self.__tls_context is not None
+        return self.__tls_context.wrap_socket(
             raw_socket,
             server_hostname=self.__server,
-            do_handshake_on_connect=False
+            do_handshake_on_connect=False,
+            session=self.__tls_session
         )
 
-        # Try to complete the TLS handshake
-        while True:
-            try:
-                # Try to perform a TLS handshake
-                self.__logger.debug("Trying to perform TLS handshake")
-                tls_socket.do_handshake()
-            except SSLWantReadError:
-                self.__wait_for_read(tls_socket, self.__timeout)
-                continue
-            except SSLWantWriteError:
-                # If the socket is not yet writable, wait for it to be so
-                self.__wait_for_write(tls_socket, self.__timeout)
-                continue
-            except SSLError as exception:
-                # Re-raise any other errors
-                raise IRCSocketException("Failed to connect via TLS") from exception
-            break
+    def connect(self) -> None:
+        """Connect to the server, closing any previous connection."""
+        # Closing keeps the TLS session of the previous connection, to resume it
+        if self.__is_open:
+            self.close()
 
-        return tls_socket
+        # Race the addresses of the server, including the TLS handshake if wanted. The socket is non-blocking
+        self.__logger.debug("Creating socket for %s:%s", self.__server, self.__port)
+        self.__socket = self.__connector.connect(
+            self.__server,
+            self.__port,
+            self.__timeout,
+            self.__wrap_socket if self.__use_tls else None
+        )
+        self.__is_open = True
 
-    def connect(self) -> None:
-        """Connect to the server."""
-        try:
-            # Create a connection with the specified server, port and timeout
-            self.__logger.debug("Creating socket for %s:%s", self.__server, self.__port)
-            self.__socket = socket.create_connection((self.__server, self.__port), self.__timeout)
-        except socket.gaierror as exception:
-            raise IRCSocketException("No such server") from exception
-        except socket.timeout as exception:
-            raise IRCSocketException("Connection timed out") from exception
-        except ConnectionRefusedError as exception:
-            raise IRCSocketException("Connection refused") from exception
-
-        # Make the socket non-blocking
-        self.__socket.setblocking(False)
-
-        # Upgrade the socket if wanted
-        if self.__use_tls:
-            self.__socket = self.__upgrade_socket(self.__socket)
+        if isinstance(self.__socket, SSLSocket):
+            self.__session_reused = self.__socket.session_reused
+            self.__logger.debug("Performed TLS handshake, %s", "resumed session" if self.__session_reused else "new session")
 
         self.__logger.debug("Connected")
 
     def wait_for_data(self, timeout: float) -> None:
-        """Wait for data to be available."""
-        self.__wait_for_read(self.__socket, timeout)
+        """Wait for data to be available, raising IRCSocketException on timeout."""
+        # Bytes already decrypted by TLS are not signalled by the socket
+        if isinstance(self.__socket, SSLSocket) and self.__socket.pending() > 0:
+            return
+
+        self.__wait_calls += 1
+        if not self.__readable.wait(self.__socket, timeout):
+            raise IRCSocketException("Socket operation timed out")
+
+    def fileno(self) -> int:
+        """The file descriptor of the connected socket, for use with selectors."""
+        return self.__socket.fileno()
+
+    def try_read_into(self, buffer: bytearray) -> int:
+        """Read all data available without waiting, appending it to a buffer.
+
+        Returns the number of bytes read.
+        """
+        return self.read_into(buffer)
+
+    def try_write(self, data: memoryview) -> int:
+        """Write as much data as possible without waiting. Returns the number of bytes written."""
+        try:
+            self.__send_calls += 1
+            return self.__socket.send(data)
+        except (SSLWantReadError, SSLWantWriteError, BlockingIOError):
+            return 0
+        except (ConnectionResetError, BrokenPipeError) as exception:
+            raise IRCSocketClosedException("Lost connection to server") from exception
+
+    def close(self) -> None:
+        """Close the socket."""
+        self.__is_open = False
+        try:
+            # With TLS 1.3 sessions are sent after the handshake, keep the latest for the next connection
+            if isinstance(self.__socket, SSLSocket) and self.__socket.session is not None:
+                self.__tls_session = self.__socket.session
+            self.__socket.close()
+        except (AttributeError, OSError):
+            self.__logger.debug("Unable to close socket", exc_info=True)
@@ -0,0 +1,92 @@
+"""Tests of the capped exponential backoff between attempts to reconnect."""
+
+import random
+from typing import List
+
+import pytest
+
+from irc.backoff import Backoff, default_stable_after
+
+
+class FixedRandom(random.Random):
+    """A generator always returning the same value, for exact waits."""
+
+    def __init__(self, value: float) -> None:
+        super().__init__()
+        self.value = value
+
+    def random(self) -> float:
+        """The fixed value."""
+        return self.value
+
+
+def waits(backoff: Backoff, count: int) -> List[float]:
+    """The next waits of a backoff."""
+    return [backoff.next_wait() for _ in range(count)]
+
+
+def test_first_attempt_is_immediate() -> None:
+    """The first attempt is made right away, whatever the jitter."""
+    assert Backoff(generator=FixedRandom(0.999)).next_wait() == 0
+
+
+def test_doubling_up_to_the_cap() -> None:
+    """Waits double from the initial wait until capped by the longest wait."""
+    backoff = Backoff(initial_wait=1, max_wait=30, generator=FixedRandom(0))
+    assert waits(backoff, 9) == [0, 1, 2, 4, 8, 16, 30, 30, 30]
+    assert backoff.attempts == 9
+
+
+def test_no_overflow_after_many_attempts() -> None:
+    """The wait stays capped however many attempts failed."""
+    backoff = Backoff(initial_wait=1, max_wait=300, generator=FixedRandom(0))
+    assert waits(backoff, 2000)[-1] == 300
+
+
+@pytest.mark.parametrize("jitter", [0, 0.25, 0.5, 1])
+def test_jitter_bounds(jitter: float) -> None:
+    """Jitter shortens each wait by at most its share, never lengthening it."""
+    backoff = Backoff(initial_wait=1, max_wait=64, jitter=jitter, generator=random.Random(0))
+    backoff.next_wait()
+    for attempt in range(20):
+        base = min(64, 2 ** attempt)
+        assert base * (1 - jitter) <= backoff.next_wait() <= base
+
+
+def test_jitter_extremes() -> None:
+    """The wait ranges from the full wait down to the wait less its jittered share."""
+    assert waits(Backoff(initial_wait=4, jitter=0.5, generator=FixedRandom(0)), 2)[1] == 4
+    assert waits(Backoff(initial_wait=4, jitter=0.5, generator=FixedRandom(1)), 2)[1] == 2
+
+
+def test_reset_after_stable_connection() -> None:
+    """A connection lasting long enough makes the next attempt immediate again."""
+    backoff = Backoff(initial_wait=1, generator=FixedRandom(0))
+    waits(backoff, 5)
+
+    backoff.connected(100.0)
+    backoff.disconnected(100.0 + default_stable_after)
+    assert backoff.attempts == 0
+    assert waits(backoff, 3) == [0, 1, 2]
+
+
+def test_no_reset_after_short_connection() -> None:
+    """A connection dropped right away keeps backing off."""
+    backoff = Backoff(initial_wait=1, generator=FixedRandom(0))
+    waits(backoff, 3)
+
+    backoff.connected(100.0)
+    backoff.disconnected(100.0 + default_stable_after - 1)
+    assert backoff.attempts == 3
+    assert backoff.next_wait() == 4
+
+    # Losing a connection which was never marked as made does not reset either
+    backoff.disconnected(1000.0)
+    assert backoff.attempts == 4
+
+
+def test_invalid_arguments() -> None:
+    """Waits must be positive and ordered, jitter a share."""
+    for arguments in ({"initial_wait": 0}, {"initial_wait": 10, "max_wait": 5}, {"jitter": -0.1}, {"jitter": 1.5}):
+        with pytest.raises(ValueError):
+            Backoff(**arguments)
@@ -0,0 +1,162 @@
+"""Tests of racing the addresses of a server, against local listeners which accept, refuse or black-hole connections."""
+
+import socket
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+from irc.connector import Address, Connector
+from irc.exception import IRCSocketException
+
+attempt_delay = 0.25
+
+
+class Listeners:
+    """Local IPv4 listeners accepting, refusing or black-holing connections."""
+
+    def __init__(self) -> None:
+        self.__sockets: List[socket.socket] = []
+        self.addresses: Dict[str, Address] = {}
+
+        # Connections are queued by the kernel, never needing to be accepted
+        self.addresses["accept"] = self.__address(self.__listen(128).getsockname())
+
+        # A closed port refuses connections
+        refusing = socket.socket()
+        refusing.bind(("127.0.0.1", 0))
+        self.addresses["refuse"] = self.__address(refusing.getsockname())
+        refusing.close()
+
+        # With a full accept queue, connections are silently dropped
+        black_hole = self.__listen(0)
+        filler = socket.socket()
+        filler.connect(black_hole.getsockname())
+        self.__sockets.append(filler)
+        self.addresses["black-hole"] = self.__address(black_hole.getsockname())
+
+    @staticmethod
+    def __address(address: Tuple[Any, ...]) -> Address:
+        """The address of a listener, as resolved."""
+        return Address(socket.AF_INET, socket.IPPROTO_TCP, address)
+
+    def __listen(self, backlog: int) -> socket.socket:
+        """Listen on a free port."""
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(backlog)
+        self.__sockets.append(listener)
+        return listener
+
+    def resolver(self, names: List[str]) -> Callable[[str, int], List[Tuple[Any, ...]]]:
+        """A resolver returning the addresses of listeners, in order."""
+        def resolve(_server: str, _port: int) -> List[Tuple[Any, ...]]:
+            return [
+                (self.addresses[name].family, socket.SOCK_STREAM, self.addresses[name].protocol, "", self.addresses[name].address)
+                for name in names
+            ]
+        return resolve
+
+    def close(self) -> None:
+        """Close all listeners."""
+        for listener in self.__sockets:
+            listener.close()
+
+
+@pytest.fixture()
+def listeners() -> Iterator[Listeners]:
+    """Listeners of each kind."""
+    listeners = Listeners()
+    yield listeners
+    listeners.close()
+
+
+def connect(connector: Connector, timeout: float = 5) -> Tuple[socket.socket, float]:
+    """Connect, returning the connected socket and the time it took."""
+    started = monotonic()
+    connected = connector.connect("irc.example.com", 6667, timeout)
+    return connected, monotonic() - started
+
+
+def test_accepting_address_wins_the_race(listeners: Listeners) -> None:
+    """A black-holed address is raced by the next address once the stagger delay passes, and recorded as failed."""
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["black-hole", "accept"]))
+    connected, elapsed = connect(connector)
+    assert connected.getpeername() == listeners.addresses["accept"].address
+    connected.close()
+    assert attempt_delay <= elapsed < attempt_delay + 0.5
+
+    stats = connector.stats
+    assert stats[listeners.addresses["accept"]].failures == 0
+    assert stats[listeners.addresses["black-hole"]].failures == 1
+    assert stats[listeners.addresses["black-hole"]].skipped_until > monotonic()
+
+
+def test_first_accepting_address_wins_right_away(listeners: Listeners) -> None:
+    """An accepting first address wins without waiting for the stagger delay, the next address is never attempted."""
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["accept", "black-hole"]))
+    connected, elapsed = connect(connector)
+    connected.close()
+    assert elapsed < attempt_delay
+    assert listeners.addresses["black-hole"] not in connector.stats
+
+
+def test_refused_address_is_skipped(listeners: Listeners) -> None:
+    """A refused address is penalized and skipped on the next connect, without delaying it."""
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["refuse", "accept"]))
+    connected, elapsed = connect(connector)
+    connected.close()
+    # A refusal starts the next attempt right away
+    assert elapsed < attempt_delay
+
+    refused = connector.stats[listeners.addresses["refuse"]]
+    assert refused.attempts == 1
+    assert refused.failures == 1
+    assert refused.consecutive_failures == 1
+    assert refused.skipped_until > monotonic() + 20
+
+    attempting, skipped = connector.candidates("irc.example.com", 6667)
+    assert attempting == [listeners.addresses["accept"]]
+    assert skipped == [listeners.addresses["refuse"]]
+
+    connected, _ = connect(connector)
+    connected.close()
+    assert connector.stats[listeners.addresses["refuse"]].attempts == 1
+    assert connector.stats[listeners.addresses["accept"]].attempts == 2
+
+
+def test_skipped_address_is_tried_last(listeners: Listeners) -> None:
+    """Skipped addresses are still attempted once no other address is left, such as when a server restarts."""
+    refused = listeners.addresses["refuse"]
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["refuse"]))
+    with pytest.raises(IRCSocketException):
+        connect(connector)
+    assert connector.candidates("irc.example.com", 6667) == ([], [refused])
+
+    # The server is back, listening on the same port
+    restarted = socket.socket()
+    restarted.bind(refused.address)
+    restarted.listen(1)
+    connected, _ = connect(connector)
+    connected.close()
+    restarted.close()
+    assert connector.stats[refused].attempts == 2
+    assert connector.stats[refused].skipped_until == 0.0
+
+
+def test_all_refused(listeners: Listeners) -> None:
+    """Connecting fails once every address has refused."""
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["refuse"]))
+    with pytest.raises(IRCSocketException, match="Connection refused"):
+        connect(connector)
+    assert connector.stats[listeners.addresses["refuse"]].failures == 1
+
+
+def test_all_black_holed(listeners: Listeners) -> None:
+    """Connecting fails once the timeout passes if no address answers, recording the address as failed."""
+    connector = Connector(attempt_delay=attempt_delay, resolver=listeners.resolver(["black-hole"]))
+    started = monotonic()
+    with pytest.raises(IRCSocketException, match="timed out"):
+        connector.connect("irc.example.com", 6667, 0.5)
+    assert 0.5 <= monotonic() - started < 1.5
+    assert connector.stats[listeners.addresses["black-hole"]].failures == 1
@@ -0,0 +1,62 @@
+"""Tests of decoding received lines, tolerating clients which do not use UTF-8."""
+
+import random
+from typing import Tuple
+
+import pytest
+
+from irc.decoding import LineDecoder, default_encodings
+
+
+def test_utf8() -> None:
+    """UTF-8 lines are decoded without falling back."""
+    decoder = LineDecoder()
+    assert decoder.decode("PRIVMSG #kanal :åäö 😁".encode()) == "PRIVMSG #kanal :åäö 😁"
+    assert decoder.decode(b"") == ""
+    assert (decoder.fallbacks, decoder.errors) == (0, 0)
+
+
+def test_cp1252() -> None:
+    """Lines which are not UTF-8 fall back to cp1252, which has its own characters in 0x80-0x9F."""
+    decoder = LineDecoder()
+    assert decoder.decode("PRIVMSG #kanal :“åäö” €".encode("cp1252")) == "PRIVMSG #kanal :“åäö” €"
+    assert (decoder.fallbacks, decoder.errors) == (1, 0)
+
+
+def test_latin1() -> None:
+    """Bytes undefined in cp1252 fall back to latin-1, which decodes any bytes."""
+    decoder = LineDecoder()
+    assert decoder.decode(b"PRIVMSG #kanal :\xe5 \x81\x8d") == "PRIVMSG #kanal :å \x81\x8d"
+    assert (decoder.fallbacks, decoder.errors) == (1, 0)
+
+
+def test_errors_are_replaced() -> None:
+    """Lines not valid in any encoding of the chain have their invalid bytes replaced, and are counted."""
+    decoder = LineDecoder(("utf-8", "cp1252"))
+    assert decoder.decode(b"PRIVMSG #kanal :\xe5 \x81") == "PRIVMSG #kanal :� �"
+    assert decoder.decode(b"PRIVMSG #kanal :\xe5") == "PRIVMSG #kanal :å"
+    assert (decoder.fallbacks, decoder.errors) == (2, 1)
+
+    decoder = LineDecoder(("utf-8",))
+    assert decoder.decode("åäö".encode("latin-1")) == "�" * 3
+    assert (decoder.fallbacks, decoder.errors) == (1, 1)
+
+
+@pytest.mark.parametrize("encodings", [default_encodings, ("utf-8",), ("utf-8", "cp1252")])
+def test_never_raises(encodings: Tuple[str, ...]) -> None:
+    """Arbitrary bytes are always decoded."""
+    generator = random.Random(0)
+    decoder = LineDecoder(encodings)
+    for _ in range(1000):
+        line = bytes(generator.randrange(256) for _ in range(generator.randrange(64)))
+        assert isinstance(decoder.decode(line), str)
+    if encodings == default_encodings:
+        assert decoder.errors == 0
+
+
+def test_invalid_chains() -> None:
+    """Chains must name known encodings."""
+    with pytest.raises(ValueError):
+        LineDecoder(())
+    with pytest.raises(LookupError):
+        LineDecoder(("utf-8", "no-such-encoding"))
@@ -0,0 +1,142 @@
+"""Tests of encoding outgoing messages into lines fitting within 512 bytes as relayed by the server."""
+
+import random
+import socket
+from typing import Iterator, List
+
+import pytest
+
+from irc.encoding import MessageEncoder, default_hostname_length, max_line_length, split_payload
+from irc.irc import IRC
+
+# Texts splitting into several lines, at spaces or between characters
+texts = {
+    "ascii words": "hej " * 300,
+    "multibyte words": "åäö " * 300,
+    "emoji word": "😁" * 300,
+    "ascii word": "x" * 1000,
+    "mixed": "ord " * 50 + "😁" * 200 + " åäö" * 50,
+    "long words": "a" * 400 + " " + "å" * 400,
+}
+
+
+def relayed_lengths(encoder: MessageEncoder, lines: List[bytes]) -> List[int]:
+    """The length of each line once relayed by the server, prefixed by the bot's nick, user and hostname."""
+    return [encoder.relayed_prefix_length + len(line) for line in lines]
+
+
+def payloads(lines: List[bytes], prefix: bytes) -> List[bytes]:
+    """The text of each line, without the command, target and CR LF."""
+    assert all(line.startswith(prefix) and line.endswith(b"\r\n") for line in lines)
+    return [line[len(prefix):-2] for line in lines]
+
+
+@pytest.mark.parametrize("text", texts.values(), ids=texts.keys())
+def test_lines_fit_when_relayed(text: str) -> None:
+    """Every line fits within 512 bytes once relayed, assuming the longest hostname."""
+    encoder = MessageEncoder("bot", "user")
+    lines = encoder.encode("PRIVMSG", "#channel", text)
+    assert len(lines) > 1
+    assert max(relayed_lengths(encoder, lines)) <= max_line_length
+
+
+@pytest.mark.parametrize("text", texts.values(), ids=texts.keys())
+def test_text_is_kept(text: str) -> None:
+    """The lines hold the whole text, split at spaces or between characters."""
+    encoder = MessageEncoder("bot", "user")
+    parts = payloads(encoder.encode("PRIVMSG", "#channel", text), b"PRIVMSG #channel :")
+    assert "".join(part.decode() for part in parts).replace(" ", "") == text.replace(" ", "")
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_splits_between_code_points(seed: int) -> None:
+    """Splitting never falls inside a character, whatever the budget and mix of multibyte characters."""
+    generator = random.Random(seed)
+    alphabet = ["a", "å", "€", "😁", " "]
+    text = "".join(generator.choice(alphabet) for _ in range(generator.randrange(1, 500)))
+    budget = generator.randrange(4, 100)
+    parts = split_payload(text.encode(), budget)
+    assert all(0 < len(part) <= budget for part in parts)
+    # Decoding strictly raises if a part starts or ends within a character
+    assert "".join(part.decode() for part in parts).replace(" ", "") == text.replace(" ", "")
+
+
+def test_word_longer_than_budget() -> None:
+    """A single word longer than the budget is split between characters, with the spaces around it dropped."""
+    assert split_payload(" ".join(["a", "😁" * 5, "b"]).encode(), 8) == [b"a", "😁😁".encode(), "😁😁".encode(), "😁 b".encode()]
+    assert split_payload(b"  abcdefgh  ", 4) == [b"abcd", b"efgh"]
+    assert split_payload(b"    ", 4) == []
+
+
+def test_unsafe_bytes_are_replaced() -> None:
+    """Bytes ending or corrupting a line are replaced, never sent."""
+    encoder = MessageEncoder("bot", "user")
+    assert encoder.encode("PRIVMSG", "#channel", "one\r\nQUIT\0two") == [b"PRIVMSG #channel :one  QUIT two\r\n"]
+    assert encoder.encode("PRIVMSG", "#channel", "   ") == []
+
+
+def test_budget_follows_nick() -> None:
+    """The budget shrinks and grows with the nick of the bot."""
+    encoder = MessageEncoder("bot", "user")
+    assert encoder.relayed_prefix_length == len(":bot!~user@ ") + default_hostname_length
+
+    encoder.nick = "a-much-longer-nick"
+    assert encoder.relayed_prefix_length == len(":a-much-longer-nick!~user@ ") + default_hostname_length
+    lines = encoder.encode("PRIVMSG", "#channel", "x" * 1000)
+    assert max(relayed_lengths(encoder, lines)) == max_line_length
+
+
+def test_budget_after_learning_hostname() -> None:
+    """Once the hostname is learned, the exact prefix is used, making room for longer lines."""
+    encoder = MessageEncoder("bot", "user")
+    assumed = encoder.encode("PRIVMSG", "#channel", "x" * 1000)
+
+    encoder.learn_hostname("~user@host.example")
+    assert encoder.relayed_prefix_length == len(":bot!~user@host.example ")
+    learned = encoder.encode("PRIVMSG", "#channel", "x" * 1000)
+    assert len(learned[0]) == len(assumed[0]) + default_hostname_length - len("host.example")
+    assert max(relayed_lengths(encoder, learned)) == max_line_length
+
+
+@pytest.fixture()
+def server() -> Iterator[socket.socket]:
+    """A listening socket on a free local port."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    yield listener
+    listener.close()
+
+
+def read_lines(connection: socket.socket, count: int) -> List[bytes]:
+    """Read lines sent by the client, skipping the login."""
+    connection.settimeout(5)
+    received = b""
+    while True:
+        lines = [line for line in received.split(b"\r\n")[:-1] if line.startswith(b"PRIVMSG")]
+        if len(lines) >= count:
+            return [line + b"\r\n" for line in lines]
+        data = connection.recv(4096)
+        assert data, "connection closed"
+        received += data
+
+
+def test_client_learns_nick_and_hostname(server: socket.socket) -> None:
+    """The client uses the nick assigned when registering and the hostname relayed when joining."""
+    irc = IRC("127.0.0.1", server.getsockname()[1], "user", "bot", timeout=1)
+    irc.connect()
+    connection, _ = server.accept()
+
+    connection.sendall(b":server 001 assigned-nick :Welcome\r\n:assigned-nick!~user@host.example JOIN #channel\r\n")
+    messages = irc.messages
+    next(messages)
+    next(messages)
+
+    irc.send_message("#channel", "x" * 1000)
+    lines = read_lines(connection, 3)
+    relayed_prefix = b":assigned-nick!~user@host.example "
+    assert [len(relayed_prefix) + len(line) for line in lines[:2]] == [max_line_length, max_line_length]
+    assert b"".join(payloads(lines, b"PRIVMSG #channel :")) == b"x" * 1000
+
+    irc.disconnect()
+    connection.close()
@@ -0,0 +1,129 @@
+"""Tests of the flood control of outgoing lines."""
+
+import pytest
+
+import irc.flood
+from irc.flood import EgressPriority, EgressScheduler
+
+
+class Clock:  # pylint: disable=too-few-public-methods
+    """A clock only moving when told to."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        """The current time."""
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    """Replace the clock of the scheduler."""
+    clock = Clock()
+    monkeypatch.setattr(irc.flood, "monotonic", clock)
+    return clock
+
+
+def test_priority_order(clock: Clock) -> None:
+    """Connection lines are taken before commands, and commands before reactions, each in the order queued."""
+    scheduler = EgressScheduler(rate=1, burst=10)
+    scheduler.put(b"reaction 1", EgressPriority.REACTION, "#a")
+    scheduler.put(b"command 1", EgressPriority.COMMAND)
+    scheduler.put(b"PONG", EgressPriority.CONNECTION)
+    scheduler.put(b"command 2", EgressPriority.COMMAND)
+    scheduler.put(b"reaction 2", EgressPriority.REACTION, "#b")
+    assert scheduler.depth == 5
+    assert [scheduler.depth_of(priority) for priority in EgressPriority] == [1, 2, 2]
+
+    clock.now += 2
+    assert scheduler.take(4096) == ([b"PONG", b"command 1", b"command 2", b"reaction 1", b"reaction 2"], None)
+    assert scheduler.depth == 0
+    assert scheduler.sent == 5
+    assert scheduler.average_wait == 2
+    assert scheduler.max_wait == 2
+
+
+def test_max_priority(clock: Clock) -> None:
+    """Lines of a lower priority than asked for stay queued."""
+    scheduler = EgressScheduler(rate=1, burst=10)
+    scheduler.put(b"reaction", EgressPriority.REACTION)
+    scheduler.put(b"command", EgressPriority.COMMAND)
+    assert scheduler.take(4096, EgressPriority.COMMAND) == ([b"command"], None)
+    assert scheduler.take(4096) == ([b"reaction"], None)
+    assert scheduler.take(4096) == ([], None)
+
+
+def test_max_size(clock: Clock) -> None:
+    """Lines are taken up to the size of a write, a line longer than that being taken on its own."""
+    scheduler = EgressScheduler(rate=0)
+    for line in (b"a" * 6, b"b" * 4, b"c" * 20, b"d"):
+        scheduler.put(line)
+    assert scheduler.take(10) == ([b"a" * 6, b"b" * 4], None)
+    assert scheduler.take(10) == ([b"c" * 20], None)
+    assert scheduler.take(10) == ([b"d"], None)
+
+
+def test_rate_limit(clock: Clock) -> None:
+    """After a burst, lines are released at the rate, telling how long to wait."""
+    scheduler = EgressScheduler(rate=2, burst=2)
+    for index in range(4):
+        scheduler.put(b"command %d" % index)
+    assert scheduler.take(4096) == ([b"command 0", b"command 1"], None)
+    assert scheduler.take(4096) == ([], 0.5)
+
+    clock.now += 0.5
+    assert scheduler.take(4096) == ([b"command 2"], None)
+    clock.now += 10
+    assert scheduler.take(4096) == ([b"command 3"], None)
+
+
+def test_connection_bypasses_rate_limit(clock: Clock) -> None:
+    """Connection lines are sent while other lines wait for the rate, delaying those further."""
+    scheduler = EgressScheduler(rate=1, burst=1)
+    scheduler.put(b"command 0")
+    scheduler.put(b"command 1")
+    assert scheduler.take(4096) == ([b"command 0"], None)
+    assert scheduler.take(4096) == ([], 1)
+
+    scheduler.put(b"PONG 0", EgressPriority.CONNECTION)
+    scheduler.put(b"PONG 1", EgressPriority.CONNECTION)
+    assert scheduler.take(4096) == ([b"PONG 0", b"PONG 1"], None)
+    # The connection lines are still counted against the bucket
+    assert scheduler.take(4096) == ([], 3)
+
+    clock.now += 3
+    assert scheduler.take(4096) == ([b"command 1"], None)
+
+
+def test_reactions_are_coalesced_by_key(clock: Clock) -> None:
+    """Once too many reactions are queued, a reaction replaces a queued reaction with the same key."""
+    scheduler = EgressScheduler(rate=0, max_queued_reactions=2)
+    scheduler.put(b"#a old", EgressPriority.REACTION, "#a")
+    scheduler.put(b"#b", EgressPriority.REACTION, "#b")
+    scheduler.put(b"#a new", EgressPriority.REACTION, "#a")
+    assert scheduler.coalesced == 1
+    assert scheduler.dropped == 0
+    assert scheduler.take(4096) == ([b"#b", b"#a new"], None)
+
+
+def test_oldest_reaction_is_dropped(clock: Clock) -> None:
+    """Once too many reactions are queued, a reaction without a queued reaction to replace drops the oldest."""
+    scheduler = EgressScheduler(rate=0, max_queued_reactions=2)
+    scheduler.put(b"#a", EgressPriority.REACTION, "#a")
+    scheduler.put(b"#b", EgressPriority.REACTION, "#b")
+    scheduler.put(b"#c", EgressPriority.REACTION, "#c")
+    scheduler.put(b"no key", EgressPriority.REACTION)
+    assert scheduler.dropped == 2
+    assert scheduler.coalesced == 0
+    assert scheduler.take(4096) == ([b"#c", b"no key"], None)
+
+
+def test_only_reactions_are_dropped(clock: Clock) -> None:
+    """Commands and connection lines are never dropped nor coalesced."""
+    scheduler = EgressScheduler(rate=0, max_queued_reactions=1)
+    for index in range(5):
+        scheduler.put(b"command", EgressPriority.COMMAND, "#a")
+        scheduler.put(b"PONG %d" % index, EgressPriority.CONNECTION, "#a")
+    assert scheduler.depth == 10
+    assert (scheduler.dropped, scheduler.coalesced) == (0, 0)
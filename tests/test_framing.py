@@ -0,0 +1,100 @@
+"""Tests of framing received bytes into IRC lines."""
+
+import random
+from typing import Iterable, List
+
+import pytest
+
+from irc.framing import LineBuffer
+
+
+def read(line_buffer: LineBuffer, chunks: Iterable[bytes]) -> List[bytes]:
+    """Feed chunks one at a time, collecting the lines complete after each."""
+    lines = []
+    for chunk in chunks:
+        line_buffer.feed(chunk)
+        lines.extend(line_buffer.lines())
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunk_splits(seed: int) -> None:
+    """Lines are the same however the received bytes are split."""
+    generator = random.Random(seed)
+    expected = [
+        ":nick!user@host PRIVMSG #channel :message {} {}".format(index, "åäö 😁" * generator.randrange(10)).encode()
+        for index in range(50)
+    ]
+    data = b"".join(line + generator.choice((b"\r\n", b"\n")) for line in expected)
+
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = start + generator.randrange(1, 64)
+        chunks.append(data[start:end])
+        start = end
+
+    line_buffer = LineBuffer()
+    assert read(line_buffer, chunks) == expected
+    assert line_buffer.pending_bytes == 0
+    assert line_buffer.discarded_bytes == 0
+
+
+def test_crlf_split_across_chunks() -> None:
+    """A CR at the end of a chunk is not part of the line once the LF arrives."""
+    line_buffer = LineBuffer()
+    assert read(line_buffer, [b"PING :one\r"]) == []
+    assert line_buffer.pending_bytes == len(b"PING :one\r")
+    assert read(line_buffer, [b"\nPING :two\r", b"\n"]) == [b"PING :one", b"PING :two"]
+    assert line_buffer.pending_bytes == 0
+
+
+def test_empty_lines_are_skipped() -> None:
+    """Empty lines yield nothing."""
+    assert read(LineBuffer(), [b"\r\n\nPING :one\r\n\r\n"]) == [b"PING :one"]
+
+
+def test_too_long_line_in_one_chunk() -> None:
+    """A too long line ending in the same chunk is discarded, keeping the lines around it."""
+    line_buffer = LineBuffer(max_line_length=16)
+    lines = read(line_buffer, [b"PING :before\r\n" + b"x" * 17 + b"\r\nPING :after\r\n"])
+    assert lines == [b"PING :before", b"PING :after"]
+    assert line_buffer.discarded_bytes == 17
+
+
+def test_line_of_exactly_the_limit() -> None:
+    """A line of the longest length accepted is kept."""
+    line_buffer = LineBuffer(max_line_length=16)
+    assert read(line_buffer, [b"x" * 16 + b"\r\n"]) == [b"x" * 16]
+    assert line_buffer.discarded_bytes == 0
+
+
+def test_too_long_line_without_an_end() -> None:
+    """A line growing past the limit without an end is discarded as it arrives, never growing the buffer."""
+    line_buffer = LineBuffer(max_line_length=16)
+    assert read(line_buffer, [b"PING :before\r\n" + b"x" * 20]) == [b"PING :before"]
+    assert line_buffer.pending_bytes == 0
+    assert line_buffer.discarded_bytes == 20
+
+    # The rest of the line is discarded once its end arrives
+    assert read(line_buffer, [b"x" * 10, b"x\r\n"]) == []
+    assert line_buffer.pending_bytes == 0
+    assert line_buffer.discarded_bytes == 31
+
+
+def test_recovery_after_discarding() -> None:
+    """Lines following a discarded line are yielded, whether in the same chunk or later."""
+    line_buffer = LineBuffer(max_line_length=16)
+    assert read(line_buffer, [b"x" * 20, b"xx\r\nPING :same\r\n"]) == [b"PING :same"]
+    assert read(line_buffer, [b"PING :later\r\n"]) == [b"PING :later"]
+
+    assert read(line_buffer, [b"y" * 20, b"y\r\n", b"PING :next\r", b"\n"]) == [b"PING :next"]
+    assert line_buffer.pending_bytes == 0
+
+
+def test_clear_stops_discarding() -> None:
+    """Clearing the buffer, such as when reconnecting, forgets a line being discarded."""
+    line_buffer = LineBuffer(max_line_length=16)
+    read(line_buffer, [b"x" * 20])
+    line_buffer.clear()
+    assert read(line_buffer, [b"PING :new\r\n"]) == [b"PING :new"]
@@ -0,0 +1,187 @@
+"""Tests of the bounded queue of received messages and its overflow policies."""
+
+import socket
+import threading
+from time import monotonic, sleep
+from typing import Iterator, List
+
+import pytest
+
+from irc.ingress import IngressQueue, OverflowPolicy
+from irc.irc import IRC
+from irc.messages import IRCBaseMessage, IRCMessage, parse_message
+
+
+def private(index: int) -> IRCBaseMessage:
+    """A channel message."""
+    message = parse_message(":nick!user@host PRIVMSG #channel :message {}".format(index))
+    assert isinstance(message, IRCMessage)
+    return message
+
+
+def control(index: int) -> IRCBaseMessage:
+    """A control message, never dropped nor blocked on."""
+    message = parse_message(":server 353 bot = #channel :nick{}".format(index))
+    assert message is not None and not isinstance(message, IRCMessage)
+    return message
+
+
+def drain(queue: IngressQueue) -> List[str]:
+    """Take every queued message."""
+    messages = []
+    while queue.depth > 0:
+        messages.append(str(queue.get()))
+    return messages
+
+
+def test_default_policy() -> None:
+    """The oldest private message is dropped by default, as by the bot."""
+    assert IngressQueue().policy == OverflowPolicy.DROP_OLDEST
+    assert IRC("localhost", 6667, "user", "nick").ingress_queue.policy == OverflowPolicy.DROP_OLDEST
+
+
+def test_drop_oldest() -> None:
+    """The oldest queued private message makes room, control messages are kept."""
+    queue = IngressQueue(3, OverflowPolicy.DROP_OLDEST)
+    for message in (control(0), private(0), private(1), private(2), control(1)):
+        assert queue.put(message)
+    assert drain(queue) == [str(control(0)), str(private(1)), str(private(2)), str(control(1))]
+    assert queue.dropped == 1
+    assert queue.blocked == 0
+    assert queue.high_water_mark == 4
+
+
+def test_drop_newest() -> None:
+    """The received private message is dropped, control messages are kept."""
+    queue = IngressQueue(2, OverflowPolicy.DROP_NEWEST)
+    for message in (private(0), private(1), private(2), control(0), private(3)):
+        assert queue.put(message)
+    assert drain(queue) == [str(private(0)), str(private(1)), str(control(0))]
+    assert queue.dropped == 2
+    assert queue.high_water_mark == 3
+
+
+def test_only_private_messages_are_dropped() -> None:
+    """A queue full of control messages grows rather than dropping them."""
+    queue = IngressQueue(2, OverflowPolicy.DROP_OLDEST)
+    for index in range(3):
+        assert queue.put(control(index))
+    assert queue.put(private(0))
+    assert drain(queue) == [str(control(0)), str(control(1)), str(control(2)), str(private(0))]
+    assert queue.dropped == 0
+    assert queue.high_water_mark == 4
+
+
+def test_block_times_out() -> None:
+    """A blocked private message is not queued once the wait times out, control messages still are."""
+    queue = IngressQueue(2, OverflowPolicy.BLOCK)
+    assert queue.put(private(0))
+    assert queue.put(private(1))
+
+    started = monotonic()
+    assert not queue.put(private(2), timeout=0.1)
+    assert monotonic() - started >= 0.1
+    assert not queue.wait_for_room(0)
+    assert queue.put(control(0), timeout=0)
+
+    assert drain(queue) == [str(private(0)), str(private(1)), str(control(0))]
+    assert queue.dropped == 0
+    assert queue.blocked == 1
+    assert queue.high_water_mark == 3
+
+
+def test_block_until_room() -> None:
+    """A blocked private message is queued once a message is taken."""
+    queue = IngressQueue(1, OverflowPolicy.BLOCK)
+    queue.put(private(0))
+
+    taken = []
+    consumer = threading.Timer(0.1, lambda: taken.append(str(queue.get())))
+    consumer.start()
+    assert queue.put(private(1), timeout=5)
+    consumer.join()
+
+    assert taken == [str(private(0))]
+    assert drain(queue) == [str(private(1))]
+    assert queue.blocked == 1
+    assert queue.dropped == 0
+    assert queue.high_water_mark == 1
+
+
+@pytest.fixture()
+def server() -> Iterator[socket.socket]:
+    """A listening socket on a free local port."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    yield listener
+    listener.close()
+
+
+def read_until(connection: socket.socket, expected: bytes) -> bytes:
+    """Read from the client until the expected bytes are received."""
+    connection.settimeout(5)
+    received = b""
+    while expected not in received:
+        data = connection.recv(4096)
+        assert data, "connection closed before receiving {!r}".format(expected)
+        received += data
+    return received
+
+
+def ingress_threads() -> List[threading.Thread]:
+    """The running ingress threads of clients."""
+    return [thread for thread in threading.enumerate() if "handle_ingress_messages" in thread.name]
+
+
+def wait_for_exit() -> None:
+    """Wait for the ingress threads of clients to exit."""
+    deadline = monotonic() + 5
+    while ingress_threads() and monotonic() < deadline:
+        sleep(0.01)
+    assert ingress_threads() == []
+
+
+def test_block_answers_pings_and_stops(server: socket.socket) -> None:
+    """A client blocked by a full queue keeps answering PINGs, queues held messages in order and exits when asked."""
+    port = server.getsockname()[1]
+    irc = IRC("127.0.0.1", port, "user", "bot", timeout=5, max_ingress_depth=2, overflow_policy=OverflowPolicy.BLOCK)
+    irc.connect()
+    connection, _ = server.accept()
+    read_until(connection, b"NICK bot\r\n")
+
+    # Fill the queue, leaving messages held back, then PING the client
+    lines = [":nick!user@host PRIVMSG #channel :message {}\r\n".format(index).encode() for index in range(4)]
+    connection.sendall(b"".join(lines) + b"PING :alive\r\n")
+    read_until(connection, b"PONG :alive\r\n")
+    queue = irc.ingress_queue
+    assert queue.depth == 2
+    assert queue.blocked == 1
+
+    # Held messages follow in order once there is room
+    messages = irc.messages
+    assert [next(messages).message for _ in range(4)] == ["message {}".format(index) for index in range(4)]
+    assert queue.dropped == 0
+    assert queue.high_water_mark == 2
+
+    # Exit while blocked
+    connection.sendall(b"".join(lines))
+    deadline = monotonic() + 5
+    while queue.depth < 2 and monotonic() < deadline:
+        sleep(0.01)
+    irc.disconnect()
+    wait_for_exit()
+    connection.close()
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_disconnect_while_waiting(server: socket.socket) -> None:
+    """A client waiting for data exits when disconnected, rather than reconnecting once the server closes the connection."""
+    irc = IRC("127.0.0.1", server.getsockname()[1], "user", "bot", timeout=5)
+    irc.connect()
+    connection, _ = server.accept()
+    read_until(connection, b"NICK bot\r\n")
+
+    irc.disconnect()
+    connection.close()
+    wait_for_exit()
@@ -0,0 +1,89 @@
+"""Tests of compiling, mapping and checking lexicons."""
+
+from pathlib import Path
+
+import pytest
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from bot.lexicon import CompiledLexicon, CompiledSentimentIntensityAnalyzer, MappedLexicon, check_lexicon, write_lexicon
+
+
+@pytest.fixture(scope="module")
+def vader() -> SentimentIntensityAnalyzer:
+    """VADER's analyzer, reading the source lexicon."""
+    return SentimentIntensityAnalyzer()
+
+
+@pytest.fixture()
+def lexicon_path(vader: SentimentIntensityAnalyzer, tmp_path: Path) -> Path:
+    """The path of a freshly compiled lexicon."""
+    path = tmp_path / "lexicon.bin"
+    assert write_lexicon(vader, str(path)) == path.stat().st_size
+    return path
+
+
+def test_round_trip(vader: SentimentIntensityAnalyzer, lexicon_path: Path) -> None:
+    """A compiled lexicon decodes to the source lexicon and its single character emojis."""
+    lexicon = CompiledLexicon(str(lexicon_path))
+    assert lexicon.lexicon() == vader.lexicon
+    assert lexicon.emojis() == {emoji: description for emoji, description in vader.emojis.items() if len(emoji) == 1}
+    lexicon.close()
+
+
+def test_mapped_lexicon(vader: SentimentIntensityAnalyzer, lexicon_path: Path) -> None:
+    """Words looked up in place have the valences of the source lexicon, boosters and negations are left out."""
+    lexicon = CompiledLexicon(str(lexicon_path))
+    mapped = MappedLexicon(lexicon)
+    assert dict(mapped.items()) == vader.lexicon
+    assert len(mapped) == len(vader.lexicon)
+    for word in ("", "inte", "x" * (lexicon.word_width + 1), "zzzzzz", "\U0001f600"):
+        assert (word in mapped) == (word in vader.lexicon)
+    with pytest.raises(KeyError):
+        _ = mapped["zzzzzz"]
+    lexicon.close()
+
+
+def test_scores_in_place(vader: SentimentIntensityAnalyzer, lexicon_path: Path) -> None:
+    """VADER scores the same using a lexicon decoded or looked up in place."""
+    lexicon = CompiledLexicon(str(lexicon_path))
+    decoded = CompiledSentimentIntensityAnalyzer(lexicon)
+    in_place = CompiledSentimentIntensityAnalyzer(lexicon, in_place=True)
+    for text in ("det här är BRA!!", "inte alls dåligt men inte bra heller 😁", "no way this is kind of good"):
+        assert decoded.polarity_scores(text) == vader.polarity_scores(text)
+        assert in_place.polarity_scores(text) == vader.polarity_scores(text)
+    lexicon.close()
+
+
+def test_check_fresh_lexicon(vader: SentimentIntensityAnalyzer, lexicon_path: Path) -> None:
+    """A freshly compiled lexicon has no differences."""
+    lexicon = CompiledLexicon(str(lexicon_path))
+    assert check_lexicon(vader, lexicon) == []
+    lexicon.close()
+
+
+def test_check_corrupted_lexicon(vader: SentimentIntensityAnalyzer, lexicon_path: Path) -> None:
+    """A lexicon with a changed valence is reported, naming the word."""
+    lexicon = CompiledLexicon(str(lexicon_path))
+    word = sorted(vader.lexicon)[0]
+    index = lexicon.words().index(word)
+    offset = lexicon.valences_offset + index * 8
+    lexicon.close()
+
+    data = bytearray(lexicon_path.read_bytes())
+    # Flip the sign bit of the little-endian float64
+    data[offset + 7] ^= 0x80
+    lexicon_path.write_bytes(bytes(data))
+
+    lexicon = CompiledLexicon(str(lexicon_path))
+    differences = check_lexicon(vader, lexicon)
+    lexicon.close()
+    assert any(repr(word) in difference for difference in differences)
+    assert "file differs from a freshly compiled lexicon" in differences
+
+
+def test_rejects_other_files(lexicon_path: Path) -> None:
+    """Files which are not compiled lexicons, or are truncated, are rejected."""
+    with pytest.raises(ValueError):
+        CompiledLexicon(b"not a lexicon, but long enough")
+    with pytest.raises(ValueError):
+        CompiledLexicon(lexicon_path.read_bytes()[:-1])
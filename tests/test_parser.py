@@ -0,0 +1,181 @@
+"""Tests of tokenizing and parsing received lines into messages."""
+
+from typing import Optional, Type
+
+import pytest
+
+from irc.messages import IRCBaseMessage, IRCControlMessage, IRCControlMessageType, IRCJoinMessage, IRCKickMessage, IRCMessage, IRCNickMessage, IRCPartMessage, IRCPingMessage, parse_message
+from irc.messages.base import max_offset
+from irc.messages.control import control_message_offsets
+from irc.messages.message import message_offsets
+from irc.messages.tokenizer import tokenize
+
+
+def parse(line: str, message_type: Type[IRCBaseMessage]) -> IRCBaseMessage:
+    """Parse a line, asserting the type of the message and that the parser of the type agrees."""
+    message = parse_message(line)
+    assert isinstance(message, message_type)
+    assert message.raw_message == line
+    parsed: Optional[IRCBaseMessage] = message_type.parse(line)
+    assert parsed is not None and str(parsed) == str(message)
+    return message
+
+
+def test_tokenize() -> None:
+    """Lines are split into their tags, prefix, command and parameters, the trailing parameter keeping its spaces."""
+    line = "@time=2020-01-01T00:00:00Z;msgid=abc :nick!user@host privmsg #channel :hello there :)"
+    tokens = tokenize(line)
+    assert tokens is not None
+    assert tokens.tags == "time=2020-01-01T00:00:00Z;msgid=abc"
+    assert tokens.prefix == "nick!user@host"
+    assert tokens.command == "PRIVMSG"
+    assert tokens.params == ["#channel", "hello there :)"]
+    assert line[tokens.prefix_offset:].startswith("nick!")
+    assert line[tokens.params_offset:] == "#channel :hello there :)"
+
+    tokens = tokenize("KICK #channel nick")
+    assert tokens is not None
+    assert (tokens.tags, tokens.prefix, tokens.prefix_offset, tokens.params) == (None, None, -1, ["#channel", "nick"])
+
+
+def test_private_message_with_tags_and_prefix() -> None:
+    """Tags are skipped, the author and hostname are taken from the prefix."""
+    message = parse("@time=2020-01-01T00:00:00Z;msgid=abc :nick!user@host PRIVMSG #channel :hello there :)", IRCMessage)
+    assert isinstance(message, IRCMessage)
+    assert (message.author, message.hostname, message.target, message.message) == ("nick", "user@host", "#channel", "hello there :)")
+    assert not message.is_notice
+
+
+def test_notice() -> None:
+    """Notices are private messages."""
+    message = parse(":nick!user@host NOTICE bot :psst", IRCMessage)
+    assert isinstance(message, IRCMessage)
+    assert (message.target, message.message, message.is_notice) == ("bot", "psst", True)
+
+
+@pytest.mark.parametrize("line, text", [
+    (":nick!user@host PRIVMSG #channel :", ""),
+    (":nick!user@host PRIVMSG #channel hello", "hello"),
+    (":nick!user@host PRIVMSG #channel ::)", ":)"),
+    (":nick!user@host  PRIVMSG  #channel  :spaced  out ", "spaced  out "),
+    (":nick!user@host PRIVMSG #channel :åäö 😁", "åäö 😁"),
+])
+def test_message_text(line: str, text: str) -> None:
+    """The text is the trailing parameter, which may be empty, or the last word of the line."""
+    message = parse(line, IRCMessage)
+    assert isinstance(message, IRCMessage)
+    assert (message.author, message.target, message.message) == ("nick", "#channel", text)
+
+
+@pytest.mark.parametrize("line, token", [
+    ("PING :irc.example.com", "irc.example.com"),
+    ("PING irc.example.com", "irc.example.com"),
+    ("PING :two words", "two words"),
+    (":irc.example.com PING :token", "token"),
+    ("PING", ""),
+])
+def test_ping(line: str, token: str) -> None:
+    """The token of a PING is its last parameter, with or without a colon."""
+    message = parse(line, IRCPingMessage)
+    assert isinstance(message, IRCPingMessage)
+    assert message.token == token
+
+
+@pytest.mark.parametrize("line", [":nick!user@host JOIN #channel", ":nick!user@host JOIN :#channel"])
+def test_join(line: str) -> None:
+    """A join names the user and the channel."""
+    message = parse(line, IRCJoinMessage)
+    assert isinstance(message, IRCJoinMessage)
+    assert (message.nick, message.hostname, message.channel) == ("nick", "user@host", "#channel")
+
+
+@pytest.mark.parametrize("line, reason", [(":nick!user@host PART #channel", None), (":nick!user@host PART #channel :bye now", "bye now")])
+def test_part(line: str, reason: Optional[str]) -> None:
+    """A part names the user, the channel and the reason if given."""
+    message = parse(line, IRCPartMessage)
+    assert isinstance(message, IRCPartMessage)
+    assert (message.nick, message.hostname, message.channel, message.reason) == ("nick", "user@host", "#channel", reason)
+
+
+@pytest.mark.parametrize("line, reason", [(":op!user@host KICK #channel nick", None), (":op!user@host KICK #channel nick :spam", "spam")])
+def test_kick(line: str, reason: Optional[str]) -> None:
+    """A kick names the user kicking, the channel, the kicked user and the reason if given."""
+    message = parse(line, IRCKickMessage)
+    assert isinstance(message, IRCKickMessage)
+    assert (message.nick, message.hostname, message.channel, message.kicked_nick, message.reason) == \
+        ("op", "user@host", "#channel", "nick", reason)
+
+
+@pytest.mark.parametrize("line", [":nick!user@host NICK newnick", ":nick!user@host NICK :newnick"])
+def test_nick(line: str) -> None:
+    """A nick change names the previous and new nick."""
+    message = parse(line, IRCNickMessage)
+    assert isinstance(message, IRCNickMessage)
+    assert (message.nick, message.hostname, message.new_nick) == ("nick", "user@host", "newnick")
+
+
+@pytest.mark.parametrize("line, message_type, target, parameter, text", [
+    (":server 001 bot :Welcome", IRCControlMessageType.RPL_WELCOME, "bot", None, ":Welcome"),
+    (":server 433 * bot :Nickname is already in use", IRCControlMessageType.ERR_NICKNAMEINUSE, "*", "bot", ":Nickname is already in use"),
+    (":server 353 bot = #channel :nick1 nick2", IRCControlMessageType.RPL_NAMREPLY, "bot", "=", "#channel :nick1 nick2"),
+    (":server 366 bot #channel :End of /NAMES list.", IRCControlMessageType.RPL_ENDOFNAMES, "bot", "#channel", ":End of /NAMES list."),
+])
+def test_numerics(line: str, message_type: IRCControlMessageType, target: str, parameter: Optional[str], text: str) -> None:
+    """A numeric names the server, its type, the target, the word following it if any and the raw text after that."""
+    message = parse(line, IRCControlMessage)
+    assert isinstance(message, IRCControlMessage)
+    assert (message.server, message.message_type, message.target, message.parameter, message.message) == \
+        ("server", message_type, target, parameter, text)
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    " ",
+    ":prefix-only",
+    "@tags-only",
+    "PRIVMSG #channel :without a prefix",
+    ":server PRIVMSG #channel :sent by the server",
+    ":nick!user@host PRIVMSG #channel",
+    "JOIN #channel",
+    ":op!user@host KICK #channel",
+    ":nick!user@host NICK",
+    "001 bot :without a prefix",
+    ":server 999 bot :unknown numeric",
+    ":nick!user@host UNKNOWN #channel :unknown command",
+])
+def test_malformed_lines(line: str) -> None:
+    """Malformed and unsupported lines are not parsed."""
+    assert parse_message(line) is None
+
+
+def test_lazy_offsets() -> None:
+    """Messages keep offsets into the raw line, slicing the fields on first access."""
+    line = "@tag=1 :nick!user@host PRIVMSG #channel :åäö 😁"
+    message = parse_message(line)
+    assert isinstance(message, IRCMessage)
+    offsets = message_offsets.unpack(getattr(message, "_IRCMessage__offsets"))
+    assert [line[start:end] for start, end in zip(offsets[:2], offsets[1:3])] == ["nick", "!user@host"]
+    assert line[offsets[3]:offsets[4]] == "#channel"
+    assert line[offsets[5]:offsets[6]] == "åäö 😁"
+    assert (message.author, message.hostname, message.target, message.message) == ("nick", "user@host", "#channel", "åäö 😁")
+
+    line = ":server 353 bot = #channel :nick1 nick2"
+    control = parse_message(line)
+    assert isinstance(control, IRCControlMessage)
+    server_start, server_end = control_message_offsets.unpack(getattr(control, "_IRCControlMessage__offsets"))[:2]
+    assert line[server_start:server_end] == "server"
+    assert (control.server, control.target, control.parameter) == ("server", "bot", "=")
+
+
+def test_long_lines_are_parsed_eagerly() -> None:
+    """Lines too long for 16-bit offsets are parsed right away, with the same fields."""
+    text = "x" * max_offset
+    message = parse_message(":nick!user@host PRIVMSG #channel :" + text)
+    assert isinstance(message, IRCMessage)
+    assert getattr(message, "_IRCMessage__offsets") == b""
+    assert (message.author, message.hostname, message.target, message.message) == ("nick", "user@host", "#channel", text)
+
+    control = parse_message(":server 353 bot = #channel :" + text)
+    assert isinstance(control, IRCControlMessage)
+    assert getattr(control, "_IRCControlMessage__offsets") == b""
+    assert (control.server, control.target, control.parameter, control.message) == ("server", "bot", "=", "#channel :" + text)
@@ -0,0 +1,77 @@
+"""Tests of the lexicon pre-filter, which must never skip a message with a sentiment."""
+
+import random
+from typing import List
+
+import pytest
+
+from bot.analyzer import Analyzer
+from bot.prefilter import LexiconFilter
+
+# Common chat words, a few of them such as "lol" and ":)" in the lexicon
+chatter = [
+    "jag", "du", "och", "att", "det", "är", "vi", "på", "en", "som", "lol", "ok", "hmm", "ja", "nej", "idag",
+    "imorgon", "kaffe", "lunch", "deploy", "servern", "koden", "mötet", "?", "!", ":)", ":(", "xD", "😁", "👍",
+    "🚀", "https://example.com", "@alice", "#random", "v1.2.3"
+]
+
+# Decorations of single words, as typed in chat
+decorations = ["{}", "{}!", "{}?!", "({})", "\"{}\"", "{}...", "{},", ":{}:", "{}😁", "😁{}", "#{}", "{}'s"]
+
+
+@pytest.fixture(scope="module", params=Analyzer.engines)
+def analyzer(request: pytest.FixtureRequest) -> Analyzer:
+    """A loaded analyzer of each engine."""
+    analyzer = Analyzer(engine=request.param)
+    analyzer.load()
+    return analyzer
+
+
+def assert_never_skips_scored(analyzer: Analyzer, messages: List[str]) -> None:
+    """Assert that every message ruled out by the pre-filter scores 0."""
+    prefilter = LexiconFilter(analyzer, report_interval=0)
+    skipped = [message for message in messages if not prefilter.may_score(message)]
+    scores = analyzer.polarity_scores_batch(skipped)
+    assert [(message, score["compound"]) for message, score in zip(skipped, scores) if score["compound"] != 0] == []
+    assert prefilter.checked == len(messages)
+
+
+def test_lexicon_words_in_every_form(analyzer: Analyzer) -> None:
+    """Every word and emoji of the lexicon, in every case and decoration, is never skipped if it scores."""
+    messages = []
+    for word in sorted(analyzer.lexicon) + sorted(analyzer.emojis):
+        for decoration in decorations:
+            messages.append(decoration.format(word))
+            messages.append(decoration.format(word.upper()))
+            messages.append(decoration.format(word.capitalize()))
+            messages.append("inte väldigt {} alls".format(decoration.format(word)))
+    assert_never_skips_scored(analyzer, messages)
+
+
+def test_generated_chat(analyzer: Analyzer) -> None:
+    """Generated chat, some of it with words of the lexicon, is never skipped if it scores."""
+    generator = random.Random(0)
+    words = sorted(analyzer.lexicon)
+    messages = []
+    for _ in range(5000):
+        message = [generator.choice(chatter) for _ in range(generator.randint(1, 12))]
+        if generator.random() < 0.2:
+            word = generator.choice(decorations).format(generator.choice(words))
+            message.insert(generator.randrange(len(message) + 1), word.upper() if generator.random() < 0.2 else word)
+        messages.append(" ".join(message))
+    assert_never_skips_scored(analyzer, messages)
+
+
+def test_skips_messages_without_lexicon_words(analyzer: Analyzer) -> None:
+    """Messages of only words outside the lexicon are skipped and counted."""
+    prefilter = LexiconFilter(analyzer, report_interval=0)
+    assert not prefilter.may_score("kaffe och lunch idag")
+    assert not prefilter.may_score("https://example.com #random v1.2.3")
+    assert prefilter.may_score("det här är bra")
+    assert prefilter.skipped == 2
+    assert prefilter.skip_ratio == pytest.approx(2 / 3)
+
+
+def test_words_of_compiled_lexicon(analyzer: Analyzer) -> None:
+    """The words read from the word table of the vectorized engine are those of VADER's lexicon."""
+    assert analyzer.lexicon_words == frozenset(Analyzer().lexicon)
@@ -0,0 +1,118 @@
+"""Tests of the vectorized engine, which must score as VADER does."""
+
+import random
+from typing import List
+
+import pytest
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from bot.lexicon import CompiledLexicon, write_lexicon
+from bot.vectorized import VectorizedSentimentIntensityAnalyzer, compound_tolerance, fallback_phrases, fallback_words
+
+# Texts exercising VADER's rules, in Swedish as the lexicon
+texts = [
+    # Boosters and dampeners
+    "det här är väldigt bra",
+    "helt otroligt dåligt",
+    "absolut fantastiskt, betydligt bättre än igår",
+    "lite bra",
+    # Negations, directly and a few words before
+    "inte bra",
+    "inte alls dåligt",
+    "aldrig någonsin glad",
+    "ingen är ledsen",
+    "utan tvekan bäst",
+    # ALL-CAPS emphasis, in mixed and only capitals
+    "det här är BRA",
+    "DET HÄR ÄR BRA",
+    "väldigt BRA men inte DÅLIGT",
+    # Punctuation emphasis
+    "bra!!!",
+    "dåligt???",
+    "är det bra?!",
+    # Contrasts
+    "det var bra but sen blev det dåligt",
+    "dåligt men sen blev det bra",
+    # Emojis and emoticons
+    "😁",
+    "bra 😁👍",
+    "ledsen 😢 :(",
+    "haha :) lol",
+    # Rules of English phrases, scored by VADER itself
+    "kind of bra",
+    "at least bra",
+    "no bra",
+    "never so good",
+    "without doubt",
+    "this is the shit",
+    "yeah right, bra",
+    "att dö för",
+    # Nothing to score
+    "",
+    "kaffe och lunch",
+    "https://example.com #random v1.2.3",
+]
+
+
+def differing(expected: List[float], actual: List[float]) -> List[int]:
+    """The indexes of scores differing by more than the tolerance."""
+    return [index for index, (left, right) in enumerate(zip(expected, actual)) if abs(left - right) > compound_tolerance]
+
+
+@pytest.fixture(scope="module")
+def vader() -> SentimentIntensityAnalyzer:
+    """VADER's analyzer, reading the source lexicon."""
+    return SentimentIntensityAnalyzer()
+
+
+@pytest.fixture(scope="module", params=["source", "compiled"])
+def vectorized(request: pytest.FixtureRequest, vader: SentimentIntensityAnalyzer, tmp_path_factory: pytest.TempPathFactory) -> VectorizedSentimentIntensityAnalyzer:
+    """The vectorized engine, compiling the source lexicon or reading a compiled lexicon in place."""
+    if request.param == "source":
+        return VectorizedSentimentIntensityAnalyzer(vader)
+
+    path = tmp_path_factory.mktemp("lexicon") / "lexicon.bin"
+    write_lexicon(vader, str(path))
+    return VectorizedSentimentIntensityAnalyzer(lexicon=CompiledLexicon(str(path)))
+
+
+def generate_texts(vader: SentimentIntensityAnalyzer, count: int) -> List[str]:
+    """Generate texts mixing lexicon words, boosters, negations and words of the fallback rules."""
+    generator = random.Random(0)
+    words = sorted(vader.lexicon)[::20] + ["väldigt", "helt", "inte", "aldrig", "men", "!", "?", "😁", ":)", "kaffe"] * 20
+    words += sorted(fallback_words) + sorted(fallback_phrases)
+    texts = []
+    for _ in range(count):
+        text = [generator.choice(words) for _ in range(generator.randint(1, 12))]
+        texts.append(" ".join(word.upper() if generator.random() < 0.1 else word for word in text))
+    return texts
+
+
+def test_compound_within_tolerance(vader: SentimentIntensityAnalyzer, vectorized: VectorizedSentimentIntensityAnalyzer) -> None:
+    """Texts exercising every rule score the same compound as VADER's, one at a time and in a batch."""
+    expected = [vader.polarity_scores(text)["compound"] for text in texts]
+    single = [vectorized.polarity_scores(text)["compound"] for text in texts]
+    batched = [scores["compound"] for scores in vectorized.polarity_scores_batch(texts)]
+    assert [texts[index] for index in differing(expected, single)] == []
+    assert [texts[index] for index in differing(expected, batched)] == []
+
+
+def test_generated_texts(vader: SentimentIntensityAnalyzer, vectorized: VectorizedSentimentIntensityAnalyzer) -> None:
+    """Generated texts score the same compound as VADER's."""
+    generated = generate_texts(vader, 2000)
+    expected = [vader.polarity_scores(text)["compound"] for text in generated]
+    batched = [scores["compound"] for scores in vectorized.polarity_scores_batch(generated)]
+    assert [generated[index] for index in differing(expected, batched)] == []
+
+
+def test_fallback_words(vader: SentimentIntensityAnalyzer, vectorized: VectorizedSentimentIntensityAnalyzer) -> None:
+    """Every word and phrase of the rules left to VADER scores as VADER does, in any case."""
+    fallback = [
+        template.format(word)
+        for word in sorted(fallback_words) + sorted(fallback_phrases)
+        for template in ("{} bra", "dåligt {} bra", "{}", "inte {} glad!")
+    ]
+    fallback += [text.upper() for text in fallback]
+    expected = [vader.polarity_scores(text)["compound"] for text in fallback]
+    batched = [scores["compound"] for scores in vectorized.polarity_scores_batch(fallback)]
+    assert [fallback[index] for index in differing(expected, batched)] == []